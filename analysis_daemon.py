@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+常驻分析进程，替代crontab每15分钟启动一次脚本
+分析器实例在进程内一直保留: K线缓存、归档内存映射、HTTP keep-alive连接都只在第一轮建立
+之后每轮只增量获取新K线
+
+运行:
+    python3 analysis_daemon.py [配置文件]
+    kill -TERM <pid>   当前一轮结束后退出
+    kill -HUP <pid>    重新读取配置文件（周期、分析器）
+
+配置文件（JSON，可选）:
+    {"analyzer": "realtime", "interval": 900, "align": true}
+    analyzer: realtime(RealtimeMarketAnalyzer) / comprehensive(GoldSilverAnalyzer) / market(MarketAnalyzer)
+              / universe(UniverseRunner，品种池批量分析)
+    interval: 每轮间隔秒数，最小60
+    align:    按整点对齐（900秒即每小时的00/15/30/45分运行）
+"""
+
+import json
+import signal
+import sys
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+
+DEFAULT_CONFIG = {"analyzer": "realtime", "interval": 900, "align": True}
+MIN_INTERVAL = 60
+
+
+# 各分析器返回 (每轮调用的函数, 切换分析器或退出时的清理函数或None)
+def _realtime():
+    from realtime_analyzer import RealtimeMarketAnalyzer
+    analyzer = RealtimeMarketAnalyzer()
+    return analyzer.run, None
+
+
+def _comprehensive():
+    from market_analysis_script import GoldSilverAnalyzer
+    analyzer = GoldSilverAnalyzer()
+    return analyzer.run, None
+
+
+def _market():
+    from market_analyzer import MarketAnalyzer
+    analyzer = MarketAnalyzer()
+    return analyzer.run_analysis, None
+
+
+def _universe():
+    from universe_runner import UniverseRunner
+    runner = UniverseRunner()
+    # 关闭常驻的进程池
+    return runner.run, runner.close
+
+
+ANALYZERS = {"realtime": _realtime, "comprehensive": _comprehensive, "market": _market, "universe": _universe}
+
+
+def load_config(path):
+    """读取配置，文件不存在或有误时使用默认值"""
+    config = dict(DEFAULT_CONFIG)
+    if path is not None and Path(path).exists():
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                config.update(json.load(f))
+        except (ValueError, OSError) as e:
+            log(f"读取配置失败 {path}: {e}，使用默认配置")
+    if config["analyzer"] not in ANALYZERS:
+        log(f"未知分析器 {config['analyzer']}，使用 {DEFAULT_CONFIG['analyzer']}")
+        config["analyzer"] = DEFAULT_CONFIG["analyzer"]
+    try:
+        interval = int(config["interval"])
+    except (TypeError, ValueError):
+        log(f"无效的周期 {config['interval']!r}，使用 {DEFAULT_CONFIG['interval']}")
+        interval = DEFAULT_CONFIG["interval"]
+    config["interval"] = max(interval, MIN_INTERVAL)
+    return config
+
+
+def log(msg):
+    print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] {msg}", flush=True)
+
+
+class AnalysisDaemon:
+    def __init__(self, config_path=None):
+        self.config_path = config_path
+        self.config = load_config(config_path)
+        self._wake = threading.Event()
+        self._stop = False
+        self._reload = False
+        self._analyzer_name = None
+        self._run_cycle = None
+        self._close_analyzer = None
+        self.cycles = 0
+
+    def _on_term(self, signum, frame):
+        log("收到退出信号，当前一轮结束后退出")
+        self._stop = True
+        self._wake.set()
+
+    def _on_hup(self, signum, frame):
+        self._reload = True
+        self._wake.set()
+
+    def install_signals(self):
+        signal.signal(signal.SIGTERM, self._on_term)
+        signal.signal(signal.SIGINT, self._on_term)
+        if hasattr(signal, "SIGHUP"):
+            signal.signal(signal.SIGHUP, self._on_hup)
+
+    def reload(self):
+        self.config = load_config(self.config_path)
+        log(f"配置已重新加载: {self.config}")
+
+    def _ensure_analyzer(self):
+        """分析器只在首次或配置切换后创建，之后一直复用；切换前清理旧的分析器"""
+        name = self.config["analyzer"]
+        if name != self._analyzer_name:
+            self.close_analyzer()
+            self._run_cycle, self._close_analyzer = ANALYZERS[name]()
+            self._analyzer_name = name
+        return self._run_cycle
+
+    def close_analyzer(self):
+        close, self._close_analyzer = self._close_analyzer, None
+        self._run_cycle = None
+        self._analyzer_name = None
+        if close is not None:
+            try:
+                close()
+            except Exception as e:
+                log(f"关闭分析器失败: {e}")
+
+    def next_run(self, now):
+        interval = self.config["interval"]
+        if self.config["align"]:
+            return now - now % interval + interval
+        return now + interval
+
+    def run_once(self):
+        """运行一轮，分析器创建失败（导入、初始化出错）也只记为本轮失败，下一轮重新创建"""
+        start = time.perf_counter()
+        try:
+            self._ensure_analyzer()()
+            log(f"第{self.cycles + 1}轮完成，耗时 {(time.perf_counter() - start) * 1000:.0f} ms")
+        except Exception as e:
+            log(f"第{self.cycles + 1}轮失败: {e}")
+        self.cycles += 1
+
+    def serve(self):
+        self.install_signals()
+        log(f"分析进程启动: {self.config}")
+        self.run_once()
+        next_at = self.next_run(time.time())
+        while not self._stop:
+            self._wake.wait(max(next_at - time.time(), 0))
+            self._wake.clear()
+            if self._stop:
+                break
+            if self._reload:
+                self._reload = False
+                self.reload()
+                next_at = self.next_run(time.time())
+                continue
+            if time.time() >= next_at:
+                self.run_once()
+                next_at = self.next_run(time.time())
+        self.close_analyzer()
+        log(f"分析进程退出，共运行 {self.cycles} 轮")
+
+
+if __name__ == "__main__":
+    AnalysisDaemon(sys.argv[1] if len(sys.argv) > 1 else None).serve()
@@ -0,0 +1,259 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+交易计划回测
+按报告中的方案A/B规则，在多年5分钟K线上回放每一轮报告给出的交易计划
+每一轮报告（默认每3根5分钟K线，即15分钟）以信号K线收盘价p和ATR(14)计算价位:
+    方案A 回踩做多: 限价 p-0.1ATR（进场区上沿）买入，止损 p-1ATR，止盈 p+1ATR
+    方案B 突破做多: 价格突破 p+0.5ATR 买入，止损 p，止盈 p+1.5ATR
+计划在下一轮报告发出前未成交即作废；成交后持有至止损、止盈或hold_bars根K线后按收盘价平仓
+
+首次触及进场价、止损价、止盈价都用二维数组（信号 × 之后的K线）一次比较得到，没有逐根K线的循环
+同一根K线同时触及止损和止盈时按先止损计（保守）
+成交K线内无法区分最低价出现在成交之前还是之后（突破单的最低价通常在突破之前），
+止损从成交后的下一根K线起算，只有成交价已越过止损（限价单开盘跳空）时当根止损；
+成交K线触及止损的交易单独计数（ambiguous），供判断结果对这一假设的敏感程度
+
+运行:
+    python3 backtest.py <品种> [--days N] [--step N] [--hold N]
+"""
+
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+import indicators
+from bar_archive import BarArchive
+from kline_frame import KlineFrame
+from universe import default_universe
+from volume_profile import VolumeProfile
+
+ARCHIVE_DIR = Path("/root/clawd/market_analysis/archive")
+
+# 出场结果
+TARGET, STOP, TIMEOUT = 1, -1, 0
+
+
+class PlanRule:
+    """
+    交易计划规则，价位为信号收盘价加ATR倍数
+    order: "limit" 价格回落到进场价成交，"stop" 价格上破进场价成交
+    """
+    __slots__ = ("name", "entry", "stop", "target", "order")
+
+    def __init__(self, name, entry, stop, target, order):
+        self.name = name
+        self.entry = entry
+        self.stop = stop
+        self.target = target
+        self.order = order
+
+    def __repr__(self):
+        return f"PlanRule({self.name}, entry={self.entry}, stop={self.stop}, target={self.target}, {self.order})"
+
+
+# 与report_renderer.TradeLevels中的价位一致
+PLAN_A = PlanRule("A", entry=-0.1, stop=-1.0, target=1.0, order="limit")
+PLAN_B = PlanRule("B", entry=0.5, stop=0.0, target=1.5, order="stop")
+PLANS = (PLAN_A, PLAN_B)
+
+
+def signal_index(frame, step=3, warmup=99, atr_period=14):
+    """
+    发出报告的K线位置和对应的ATR
+    从warmup根K线之后开始（与分析窗口长度相同），每step根一次，ATR无效的位置跳过
+    """
+    atr = indicators.atr(frame.high, frame.low, frame.close, atr_period)
+    signals = np.arange(warmup - 1, len(frame) - 1, step)
+    signals = signals[np.isfinite(atr[signals]) & (atr[signals] > 0)]
+    return signals, atr[signals]
+
+
+def signal_scores(frame, signals, tick=0.01, profile_bars=13):
+    """
+    各信号K线上的综合评分，与realtime_analysis.gen_plan相同:
+        EMA7 > EMA25（bullish）30分，收盘价高于2根前（demand）25分，价格高于近13根价值区上沿（above）20分
+    75分为"高"置信度，50分以上为"中高"
+    """
+    closes = np.asarray(frame.close, dtype=np.float64)
+    bullish = indicators.ema(closes, 7)[signals] > indicators.ema(closes, 25)[signals]
+    demand = closes[signals] > closes[np.maximum(signals - 2, 0)]
+    # 成交量分布没有向量化的价值区算法，逐个信号计算（每个约30微秒，只需算一次）
+    above = np.zeros(len(signals), dtype=bool)
+    for k, i in enumerate(signals):
+        summary = VolumeProfile.from_klines(frame[max(i - profile_bars + 1, 0):i + 1], tick).summary(closes[i])
+        above[k] = summary is not None and summary["position"] == "above"
+    return bullish * 30 + demand * 25 + above * 20
+
+
+def simulate(frame, plan, signals, atr, entry_bars=3, hold_bars=288, block=2048):
+    """
+    回放一个方案，返回成交交易的列字典:
+        signal/fill/exit   信号、成交、平仓的K线位置
+        entry/exit_price   成交价、平仓价
+        outcome            TARGET/STOP/TIMEOUT
+        ret                收益率，r为以初始风险计的倍数
+        ambiguous          成交K线（未跳空）也触及了止损，按成交后未止损处理
+    """
+    n = len(frame)
+    op, hi, lo, cl = (np.asarray(c, dtype=np.float64) for c in (frame.open, frame.high, frame.low, frame.close))
+    cols = np.arange(hold_bars)
+    parts = []
+    for b in range(0, len(signals), block):
+        sig = signals[b:b + block]
+        a = atr[b:b + block]
+        p = cl[sig]
+        entry = (p + plan.entry * a)[:, None]
+        stop = (p + plan.stop * a)[:, None]
+        target = (p + plan.target * a)[:, None]
+        rows = np.arange(len(sig))
+
+        idx = sig[:, None] + 1 + cols
+        valid = idx < n
+        idx = np.minimum(idx, n - 1)
+        bar_lo, bar_hi = lo[idx], hi[idx]
+
+        # 进场: 计划有效期内第一次触及进场价
+        touch = (bar_lo <= entry) if plan.order == "limit" else (bar_hi >= entry)
+        touch &= valid & (cols < entry_bars)
+        filled = touch.any(axis=1)
+        f = touch.argmax(axis=1)
+        fill_open = op[idx[rows, f]]
+        if plan.order == "limit":
+            fill = np.minimum(fill_open, entry[:, 0])
+        else:
+            fill = np.maximum(fill_open, entry[:, 0])
+
+        # 出场: 成交后的K线起算止损和止盈；成交价本身已越过止损（限价单开盘跳空到止损之下）时当根止损
+        # 突破单开盘低于止损说明最低价在突破成交之前，不算止损
+        gapped = fill <= stop[:, 0]
+        ambiguous = ~gapped & (lo[idx[rows, f]] <= stop[:, 0])
+        after = (cols > f[:, None]) | ((cols == f[:, None]) & gapped[:, None])
+        stop_hit = (bar_lo <= stop) & after & valid
+        target_hit = (bar_hi >= target) & (cols > f[:, None]) & valid
+        s = np.where(stop_hit.any(axis=1), stop_hit.argmax(axis=1), hold_bars)
+        t = np.where(target_hit.any(axis=1), target_hit.argmax(axis=1), hold_bars)
+        last = valid.sum(axis=1) - 1
+
+        outcome = np.where(s <= t, STOP, TARGET)
+        outcome[(s == hold_bars) & (t == hold_bars)] = TIMEOUT
+        exit_col = np.where(outcome == STOP, s, np.where(outcome == TARGET, t, last))
+        exit_col = np.minimum(exit_col, hold_bars - 1)
+        exit_open = op[idx[rows, exit_col]]
+        # 跳空越过止损/止盈时按开盘价成交；成交K线上（跳空成交）止损按成交价
+        exit_price = np.where(
+            outcome == STOP,
+            np.where(exit_col > f, np.minimum(exit_open, stop[:, 0]), np.minimum(stop[:, 0], fill)),
+            np.where(outcome == TARGET, np.maximum(exit_open, target[:, 0]), cl[idx[rows, exit_col]]),
+        )
+
+        keep = filled
+        risk = fill - stop[:, 0]
+        parts.append({
+            "signal": sig[keep],
+            "fill": idx[rows, f][keep],
+            "exit": idx[rows, exit_col][keep],
+            "entry": fill[keep],
+            "exit_price": exit_price[keep],
+            "outcome": outcome[keep],
+            "ret": (exit_price / fill - 1)[keep],
+            "r": np.where(risk > 0, (exit_price - fill) / np.where(risk > 0, risk, 1), np.nan)[keep],
+            "ambiguous": ambiguous[keep],
+        })
+    if not parts:
+        return {k: np.zeros(0) for k in ("signal", "fill", "exit", "entry", "exit_price", "outcome", "ret", "r",
+                                         "ambiguous")}
+    return {k: np.concatenate([p[k] for p in parts]) for k in parts[0]}
+
+
+def max_drawdown(returns):
+    """按顺序累加收益（每笔1个单位）的最大回撤"""
+    if not len(returns):
+        return 0.0
+    equity = np.cumsum(returns)
+    peak = np.maximum.accumulate(np.r_[0.0, equity])[1:]
+    return float((peak - equity).max())
+
+
+def summarize(trades, signals):
+    """胜率、期望、回撤和成交数"""
+    fills = len(trades["ret"])
+    ret = trades["ret"]
+    outcome = trades["outcome"]
+    wins = int((outcome == TARGET).sum())
+    gains = ret[ret > 0].sum()
+    losses = -ret[ret < 0].sum()
+    # 持仓可能重叠，回撤按平仓先后累加
+    order = np.argsort(trades["exit"], kind="stable")
+    return {
+        "signals": int(signals),
+        "fills": fills,
+        "fill_rate": round(fills / signals, 4) if signals else 0.0,
+        "wins": wins,
+        "stops": int((outcome == STOP).sum()),
+        "timeouts": int((outcome == TIMEOUT).sum()),
+        "ambiguous": int(trades["ambiguous"].sum()),
+        "win_rate": round(wins / fills, 4) if fills else 0.0,
+        "expectancy_pct": round(float(ret.mean()) * 100, 4) if fills else 0.0,
+        "expectancy_r": round(float(np.nanmean(trades["r"])), 4) if fills else 0.0,
+        "profit_factor": round(float(gains / losses), 3) if losses > 0 else None,
+        "max_drawdown_pct": round(max_drawdown(ret[order]) * 100, 3),
+        "avg_bars": round(float((trades["exit"] - trades["fill"]).mean()) + 1, 1) if fills else 0.0,
+    }
+
+
+def backtest(frame, plans=PLANS, step=3, entry_bars=None, hold_bars=288, warmup=99):
+    """
+    在一段K线上回测各方案，返回 {方案名: 统计}
+    entry_bars默认等于step，即计划只在下一轮报告前有效
+    """
+    frame = KlineFrame.from_klines(frame)
+    signals, atr = signal_index(frame, step, warmup)
+    entry_bars = step if entry_bars is None else entry_bars
+    return {plan.name: summarize(simulate(frame, plan, signals, atr, entry_bars, hold_bars), len(signals))
+            for plan in plans}
+
+
+def load_bars(symbol, days=None, archive_dir=ARCHIVE_DIR):
+    """从K线归档读取品种的5分钟K线，依次尝试传入的代码、实时分析的归档名（XAUUSD）和数据源代码"""
+    inst = default_universe.get(symbol)
+    names = [symbol] + ([inst.symbol.replace("/", ""), inst.source] if inst is not None else [])
+    for name in names:
+        archive = BarArchive(archive_dir, name, "5m")
+        if len(archive):
+            last = archive.last_time()
+            return archive.frame(None if days is None else last - int(days * 86400), None)
+    return KlineFrame.empty()
+
+
+def format_results(results):
+    lines = ["| 方案 | 信号 | 成交 | 胜率 | 止盈/止损/超时 | 成交K线触及止损 | 期望(%) | 期望(R) | 盈亏比 | 最大回撤(%) | 平均持仓(根) |",
+             "|------|------|------|------|----------------|-----------------|---------|---------|--------|-------------|--------------|"]
+    for name, s in results.items():
+        lines.append(f"| {name} | {s['signals']} | {s['fills']} | {s['win_rate'] * 100:.1f}% | "
+                     f"{s['wins']}/{s['stops']}/{s['timeouts']} | {s.get('ambiguous', 0)} | {s['expectancy_pct']} | "
+                     f"{s['expectancy_r']} | {s['profit_factor']} | {s['max_drawdown_pct']} | {s['avg_bars']} |")
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    options = {}
+    for flag in ("--days", "--step", "--hold"):
+        if flag in args:
+            i = args.index(flag)
+            options[flag] = float(args[i + 1])
+            del args[i:i + 2]
+    if not args:
+        print(__doc__)
+        sys.exit(1)
+    frame = load_bars(args[0], options.get("--days"))
+    if len(frame) < 100:
+        print(f"{args[0]} 归档K线不足: {len(frame)} 根")
+        sys.exit(1)
+    start = time.perf_counter()
+    results = backtest(frame, step=int(options.get("--step", 3)), hold_bars=int(options.get("--hold", 288)))
+    print(f"{args[0]}: {len(frame)} 根5分钟K线, 耗时 {time.perf_counter() - start:.2f}s")
+    print(format_results(results))
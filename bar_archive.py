@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+多年K线二进制归档
+每个品种、周期一个定长记录文件: time(int64) + open/high/low/close/volume(float64)，48字节一条
+用numpy.memmap打开，稀疏时间索引二分定位，按时间取K线直接返回零拷贝视图
+支持原地追加，最后一根未收线的K线原地覆盖
+
+查看归档:
+    python3 bar_archive.py <归档目录>
+"""
+
+import os
+import sys
+from pathlib import Path
+
+import numpy as np
+
+from kline_frame import KlineFrame
+
+RECORD_DTYPE = np.dtype([
+    ("time", "<i8"),
+    ("open", "<f8"),
+    ("high", "<f8"),
+    ("low", "<f8"),
+    ("close", "<f8"),
+    ("volume", "<f8"),
+])
+
+MAGIC = b"PMBARS01"
+HEADER_SIZE = 64
+
+# 稀疏索引每隔多少条记录取一个时间戳
+INDEX_STRIDE = 4096
+
+
+class BarArchive:
+    def __init__(self, root, symbol, interval="5m"):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.symbol = symbol
+        self.interval = interval
+        safe = symbol.replace("=", "_").replace("/", "_").replace("^", "_")
+        self.path = self.root / f"{safe}_{interval}.bars"
+        if not self.path.exists():
+            with open(self.path, "wb") as f:
+                f.write(MAGIC.ljust(HEADER_SIZE, b"\0"))
+        self._check_header()
+        self._mm = None
+        self._index = None
+
+    def _check_header(self):
+        size = self.path.stat().st_size
+        with open(self.path, "rb") as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                raise ValueError(f"不是K线归档文件: {self.path}")
+        # 截掉写入中断留下的半条记录
+        extra = (size - HEADER_SIZE) % RECORD_DTYPE.itemsize
+        if extra:
+            os.truncate(self.path, size - extra)
+
+    def __len__(self):
+        return (self.path.stat().st_size - HEADER_SIZE) // RECORD_DTYPE.itemsize
+
+    def _records(self):
+        """只读内存映射，文件增长后重新映射"""
+        n = len(self)
+        if self._mm is None or len(self._mm) != n:
+            if n == 0:
+                self._mm = np.zeros(0, dtype=RECORD_DTYPE)
+            else:
+                self._mm = np.memmap(self.path, dtype=RECORD_DTYPE, mode="r", offset=HEADER_SIZE, shape=(n,))
+            self._index = None
+        return self._mm
+
+    def _sparse_index(self):
+        if self._index is None:
+            self._index = np.array(self._records()["time"][::INDEX_STRIDE])
+        return self._index
+
+    def _locate(self, t, side):
+        """稀疏索引确定块，再在块内二分，只触及少量页面"""
+        records = self._records()
+        index = self._sparse_index()
+        j = int(np.searchsorted(index, t, side=side))
+        lo = max(j - 1, 0) * INDEX_STRIDE
+        hi = min(j * INDEX_STRIDE, len(records))
+        return lo + int(np.searchsorted(records["time"][lo:hi], t, side=side))
+
+    def last_time(self):
+        records = self._records()
+        return int(records["time"][-1]) if len(records) else None
+
+    def append(self, klines):
+        """
+        追加K线，klines为字典列表或KlineFrame
+        早于最后一根的K线忽略，与最后一根时间相同的原地覆盖
+        返回新增条数
+        """
+        frame = KlineFrame.from_klines(klines)
+        if not len(frame):
+            return 0
+        last = self.last_time()
+        if last is not None:
+            frame = frame.between(last, None)
+        if not len(frame):
+            return 0
+
+        rows = np.empty(len(frame), dtype=RECORD_DTYPE)
+        for name, col in frame.columns().items():
+            rows[name] = col
+
+        overwrite = last is not None and int(rows["time"][0]) == last
+        with open(self.path, "r+b") as f:
+            if overwrite:
+                f.seek(HEADER_SIZE + (len(self) - 1) * RECORD_DTYPE.itemsize)
+            else:
+                f.seek(0, os.SEEK_END)
+            f.write(rows.tobytes())
+        self._mm = None
+        return len(rows) - 1 if overwrite else len(rows)
+
+    def frame(self, t0=None, t1=None):
+        """时间在[t0, t1]内的K线，返回内存映射上的零拷贝KlineFrame"""
+        records = self._records()
+        start = 0 if t0 is None else self._locate(t0, "left")
+        end = len(records) if t1 is None else self._locate(t1, "right")
+        view = records[start:end]
+        return KlineFrame(view["time"], view["open"], view["high"], view["low"], view["close"], view["volume"])
+
+    def tail(self, n):
+        """最近n根K线"""
+        records = self._records()
+        view = records[max(len(records) - n, 0):]
+        return KlineFrame(view["time"], view["open"], view["high"], view["low"], view["close"], view["volume"])
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print(__doc__)
+        sys.exit(1)
+    for path in sorted(Path(sys.argv[1]).glob("*.bars")):
+        symbol, interval = path.stem.rsplit("_", 1)
+        archive = BarArchive(path.parent, symbol, interval)
+        print(f"{path.name}: {len(archive)} 根, 最后时间 {archive.last_time()}, "
+              f"{path.stat().st_size / 1024 / 1024:.1f} MB")
@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+本地K线缓存
+每个品种、周期一个文件，记录最后一根K线的时间戳
+每轮只请求该时间戳之后的K线，按时间戳幂等合并，未收线的最后一根直接覆盖
+批量接口只有收盘价的K线也可以写入（merge_closes），它们不推进ohlc_time，
+下次增量更新从最后一根完整K线起请求，用完整的OHLC覆盖它们
+"""
+
+import bisect
+import json
+import os
+import time
+from pathlib import Path
+
+import metrics
+from market_data import fetch_chart, parse_chart
+
+INTERVAL_SECONDS = {"1m": 60, "2m": 120, "5m": 300, "15m": 900, "30m": 1800, "60m": 3600, "1h": 3600}
+
+# 首次建立缓存时拉取的范围，5分钟K线5天约1400根，足够EMA99
+SEED_RANGE = "5d"
+
+
+class BarCache:
+    def __init__(self, cache_dir, interval="5m", max_bars=5000):
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.interval = interval
+        self.seconds = INTERVAL_SECONDS[interval]
+        self.max_bars = max_bars
+        self._bars = {}
+        # 各品种最后一根完整OHLC K线的时间，之后的K线可能只有收盘价
+        self._ohlc = {}
+        self.stats = {"fetches": 0, "new_bars": 0, "replaced_bars": 0}
+
+    def _path(self, symbol):
+        safe = symbol.replace("=", "_").replace("/", "_").replace("^", "_")
+        return self.cache_dir / f"{safe}_{self.interval}.json"
+
+    def load(self, symbol):
+        """读取某品种的缓存K线（内存中已有则直接返回）"""
+        if symbol not in self._bars:
+            bars = []
+            path = self._path(symbol)
+            if path.exists():
+                try:
+                    with open(path, 'r', encoding='utf-8') as f:
+                        data = json.load(f)
+                    bars = [{"time": r[0], "open": r[1], "high": r[2], "low": r[3], "close": r[4], "volume": r[5]}
+                            for r in data.get("bars", [])]
+                    self._ohlc[symbol] = data.get("ohlc_time", data.get("last_time"))
+                except (ValueError, OSError) as e:
+                    print(f"读取K线缓存失败 {path.name}: {e}")
+            self._bars[symbol] = bars
+        return self._bars[symbol]
+
+    def save(self, symbol):
+        """原子写入缓存文件"""
+        bars = self.load(symbol)
+        path = self._path(symbol)
+        tmp = path.with_suffix(".tmp")
+        data = {
+            "symbol": symbol,
+            "interval": self.interval,
+            "last_time": bars[-1]["time"] if bars else None,
+            "ohlc_time": self._ohlc.get(symbol),
+            "bars": [[k["time"], k["open"], k["high"], k["low"], k["close"], k["volume"]] for k in bars]
+        }
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(data, f, separators=(",", ":"))
+        os.replace(tmp, path)
+
+    def last_time(self, symbol):
+        bars = self.load(symbol)
+        return bars[-1]["time"] if bars else None
+
+    def ohlc_time(self, symbol):
+        """最后一根完整OHLC K线的时间，没有缓存时为None"""
+        self.load(symbol)
+        return self._ohlc.get(symbol)
+
+    def merge(self, symbol, klines):
+        """
+        按时间戳合并新K线，重复合并结果不变
+        时间戳先对齐到周期起点，Yahoo最后一根实时K线会落到正在形成的K线上并覆盖它
+        返回新增的K线数量
+        """
+        bars = self.load(symbol)
+        times = [k["time"] for k in bars]
+        added = 0
+        for k in sorted(klines, key=lambda x: x["time"]):
+            bar = dict(k)
+            bar["time"] = k["time"] - k["time"] % self.seconds
+            i = bisect.bisect_left(times, bar["time"])
+            if i < len(times) and times[i] == bar["time"]:
+                bars[i] = bar
+                self.stats["replaced_bars"] += 1
+            else:
+                bars.insert(i, bar)
+                times.insert(i, bar["time"])
+                added += 1
+        if len(bars) > self.max_bars:
+            del bars[:len(bars) - self.max_bars]
+        if klines:
+            last = max(k["time"] for k in klines)
+            self._ohlc[symbol] = max(self._ohlc.get(symbol) or 0, last - last % self.seconds)
+        self.stats["new_bars"] += added
+        return added
+
+    def merge_closes(self, symbol, klines):
+        """
+        合并只有收盘价的K线（spark批量接口），只更新最后一根及之后的K线
+        最后一根只更新收盘价并扩展高低价，不覆盖已有的开高低；不推进ohlc_time
+        返回新增的K线数量
+        """
+        bars = self.load(symbol)
+        added = 0
+        for k in sorted(klines, key=lambda x: x["time"]):
+            t = k["time"] - k["time"] % self.seconds
+            price = k["close"]
+            if bars and t < bars[-1]["time"]:
+                continue
+            if bars and t == bars[-1]["time"]:
+                last = bars[-1]
+                bars[-1] = dict(last, close=price, high=max(last["high"], price), low=min(last["low"], price))
+            else:
+                bars.append(dict(k, time=t))
+                added += 1
+        if len(bars) > self.max_bars:
+            del bars[:len(bars) - self.max_bars]
+        self.stats["new_bars"] += added
+        return added
+
+    def refresh(self, symbol, timeout=10):
+        """
+        增量更新: 只请求最后一根缓存K线之后的数据
+        最后一根可能尚未收线，所以从它的起点开始重新请求；之后只有收盘价的K线一并重新请求
+        """
+        last = self.ohlc_time(symbol)
+        if last is None:
+            metrics.inc("cache_misses")
+            data = fetch_chart(symbol, self.interval, SEED_RANGE, timeout=timeout)
+        else:
+            metrics.inc("cache_hits")
+            data = fetch_chart(symbol, self.interval, timeout=timeout, period1=last, period2=int(time.time()))
+        self.stats["fetches"] += 1
+        added = self.merge(symbol, parse_chart(data))
+        self.save(symbol)
+        return added
+
+    def since(self, symbol, t):
+        """时间不早于t的缓存K线，t为None时返回全部"""
+        bars = self.load(symbol)
+        if t is None:
+            return list(bars)
+        i = bisect.bisect_left([k["time"] for k in bars], t)
+        return bars[i:]
+
+    def window(self, symbol, n):
+        """分析用的最近n根K线"""
+        return self.load(symbol)[-n:]
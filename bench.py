@@ -0,0 +1,194 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+指标与分析流程基准测试
+在固定种子生成的模拟K线（13、1千、10万、1千万根）上逐项测量各阶段的耗时和峰值内存:
+    calculate_ema / calculate_rsi / calculate_atr   实时分析器的指标计算
+    wyckoff_analysis / profile_analysis             综合分析脚本的威科夫、四度空间分析
+    analyze_frame                                   单品种完整分析
+    generate_markdown_report                        实时报告渲染
+结果保存为JSON，与基线比较，耗时或峰值内存超过阈值的项标记为退化（退出码1）
+完全离线运行，不访问网络，不写分析输出目录
+
+运行:
+    python3 bench.py                           运行全部规模，与 benchmarks/baseline.json 比较
+    python3 bench.py --sizes 13,1000,100000    只运行部分规模
+    python3 bench.py --save-baseline           把本次结果保存为基线
+    python3 bench.py --threshold 0.25          退化阈值（默认0.2，即慢20%）
+"""
+
+import json
+import platform
+import statistics
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+
+from market_analysis_script import GoldSilverAnalyzer
+from realtime_analyzer import RealtimeMarketAnalyzer, analyze_frame
+from synthetic import generate
+from volume_profile import tick_size
+
+BENCH_DIR = Path(__file__).resolve().parent / "benchmarks"
+BASELINE = BENCH_DIR / "baseline.json"
+
+SIZES = (13, 1000, 100000, 10000000)
+SEED = 20260202
+
+# 每项至少运行的总时长和最多重复次数
+MIN_TIME = 0.2
+MAX_REPEATS = 1000
+
+# 差值低于这些下限时不算退化，避免微秒级计时抖动误报
+TIME_FLOOR = 50e-6
+MEMORY_FLOOR = 64 * 1024
+
+
+def stages():
+    """
+    各阶段的 (名称, 准备函数)，准备函数接收K线返回无参的被测调用
+    被测方法不使用实例状态，分析器不经过__init__创建，避免创建输出目录和发布线程
+    """
+    realtime = object.__new__(RealtimeMarketAnalyzer)
+    comprehensive = object.__new__(GoldSilverAnalyzer)
+
+    def report(frame):
+        silver = analyze_frame(frame, "XAG/USD")
+        gold = analyze_frame(frame, "XAU/USD")
+        return lambda: realtime.generate_markdown_report(silver, gold)
+
+    return [
+        ("calculate_ema", lambda f: lambda: realtime.calculate_ema(f.close, 25)),
+        ("calculate_rsi", lambda f: lambda: realtime.calculate_rsi(f.close)),
+        ("calculate_atr", lambda f: lambda: realtime.calculate_atr(f)),
+        ("wyckoff_analysis", lambda f: lambda: comprehensive.wyckoff_analysis(f, float(f.close[-1]))),
+        ("profile_analysis", lambda f: lambda: comprehensive.profile_analysis(f, tick_size("XAU/USD"))),
+        ("analyze_frame", lambda f: lambda: analyze_frame(f, "XAU/USD")),
+        ("generate_markdown_report", report),
+    ]
+
+
+def measure(fn):
+    """最短/中位耗时（秒）和单次调用的峰值内存（字节）"""
+    times = []
+    total = 0.0
+    while total < MIN_TIME and len(times) < MAX_REPEATS:
+        start = time.perf_counter()
+        fn()
+        elapsed = time.perf_counter() - start
+        times.append(elapsed)
+        total += elapsed
+    # 内存单独测一次，tracemalloc会拖慢计时
+    tracemalloc.start()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        "seconds": min(times),
+        "median": statistics.median(times),
+        "repeats": len(times),
+        "peak_bytes": peak,
+    }
+
+
+def run(sizes=SIZES):
+    results = {}
+    for n in sizes:
+        frame = generate("XAU/USD", n=n, seed=SEED)
+        for name, prepare in stages():
+            fn = prepare(frame)
+            results[f"{name}@{n}"] = m = measure(fn)
+            print(f"  {name:<26} {n:>9} 根  {format_seconds(m['seconds']):>10}  "
+                  f"峰值内存 {format_bytes(m['peak_bytes']):>9}  (x{m['repeats']})")
+        del frame
+    return {
+        "meta": {
+            "datetime": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "machine": platform.machine(),
+            "platform": platform.platform(),
+            "seed": SEED,
+        },
+        "results": results,
+    }
+
+
+def compare(current, baseline, threshold=0.2):
+    """返回退化项列表 [(项, 指标, 基线值, 本次值)]，只比较两边都有的项"""
+    regressions = []
+    for key, now in current["results"].items():
+        base = baseline["results"].get(key)
+        if base is None:
+            continue
+        if now["seconds"] > base["seconds"] * (1 + threshold) and now["seconds"] - base["seconds"] > TIME_FLOOR:
+            regressions.append((key, "seconds", base["seconds"], now["seconds"]))
+        if (now["peak_bytes"] > base["peak_bytes"] * (1 + threshold)
+                and now["peak_bytes"] - base["peak_bytes"] > MEMORY_FLOOR):
+            regressions.append((key, "peak_bytes", base["peak_bytes"], now["peak_bytes"]))
+    return regressions
+
+
+def format_seconds(s):
+    if s < 1e-3:
+        return f"{s * 1e6:.1f}µs"
+    if s < 1:
+        return f"{s * 1e3:.2f}ms"
+    return f"{s:.2f}s"
+
+
+def format_bytes(b):
+    for unit in ("B", "KB", "MB"):
+        if b < 1024:
+            return f"{b:.0f}{unit}"
+        b /= 1024
+    return f"{b:.1f}GB"
+
+
+def load(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def save(data, path):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, indent=2, ensure_ascii=False)
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    options = {}
+    for flag in ("--sizes", "--threshold", "--baseline"):
+        if flag in args:
+            i = args.index(flag)
+            options[flag] = args[i + 1]
+            del args[i:i + 2]
+    sizes = [int(s) for s in options["--sizes"].split(",")] if "--sizes" in options else SIZES
+    baseline_path = Path(options.get("--baseline", BASELINE))
+    threshold = float(options.get("--threshold", 0.2))
+
+    print(f"基准测试: {', '.join(str(n) for n in sizes)} 根K线")
+    current = run(sizes)
+    out = BENCH_DIR / f"bench_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+    save(current, out)
+    print(f"结果: {out}")
+
+    if "--save-baseline" in args:
+        save(current, baseline_path)
+        print(f"已保存为基线: {baseline_path}")
+    elif baseline_path.exists():
+        regressions = compare(current, load(baseline_path), threshold)
+        if regressions:
+            print(f"\n超过基线{threshold * 100:.0f}%的退化:")
+            for key, metric, base, now in regressions:
+                fmt = format_seconds if metric == "seconds" else format_bytes
+                print(f"  {key:<36} {metric:<10} {fmt(base):>10} -> {fmt(now):>10} (x{now / base:.2f})")
+            sys.exit(1)
+        print(f"\n与基线相比无退化（阈值{threshold * 100:.0f}%）")
+    else:
+        print(f"\n没有基线 {baseline_path}，用 --save-baseline 保存")
@@ -0,0 +1,208 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+后台Git发布
+分析流程只把本轮生成的文件路径放入队列，立即返回
+后台线程:
+  - 只暂存队列中的具体路径（不再 git add .，索引耗时不随目录文件数增长）
+  - 窗口期内的多轮合并为一次提交
+  - 推送失败按指数退避重试，推送期间的新文件照常提交，下次推送一并带上
+远程仓库缓慢或无响应只影响发布线程，不会推迟下一轮分析
+
+    publisher = get_publisher(output_dir)
+    publisher.publish([md_file, json_file], "更新分析报告 - 20260101_120000")
+"""
+
+import atexit
+import queue
+import subprocess
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+
+import metrics
+
+_STOP = object()
+
+# 单次git调用（init、add、commit、remote）的超时秒数，推送用push_timeout
+GIT_TIMEOUT = 60
+
+
+class GitPublisher:
+    def __init__(self, repo_dir, remote="origin", branch="main", window=0.0, push=True,
+                 push_timeout=120, retry_base=5.0, retry_max=900.0):
+        self.repo_dir = Path(repo_dir)
+        self.remote = remote
+        self.branch = branch
+        # 收到第一批文件后再等待window秒，期间到达的文件合并到同一次提交
+        self.window = window
+        self.push_enabled = push
+        self.push_timeout = push_timeout
+        self.retry_base = retry_base
+        self.retry_max = retry_max
+        self.stats = {"queued": 0, "commits": 0, "pushes": 0, "push_failures": 0, "last_error": None}
+        self._queue = queue.Queue()
+        self._push_pending = False
+        self._push_failures = 0
+        self._next_push_at = 0.0
+        # 已入队但尚未处理的批次数
+        self._unfinished = 0
+        self._done = threading.Condition()
+        # close()之后不再接受新文件；发布线程退出后flush()不再等待
+        self._closed = False
+        self._stopped = False
+        self._thread = threading.Thread(target=self._worker, name="git-publisher", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def _git(self, *args, timeout=GIT_TIMEOUT):
+        return subprocess.run(["git", *args], cwd=self.repo_dir, capture_output=True, text=True, timeout=timeout)
+
+    def publish(self, paths, message=None):
+        """加入发布队列，不等待提交和推送；close()之后抛出RuntimeError"""
+        with self._done:
+            if self._closed or self._stopped:
+                raise RuntimeError(f"{self.repo_dir} 的发布线程已停止")
+            self._unfinished += 1
+        self._queue.put(([str(p) for p in paths], message))
+        self.stats["queued"] += 1
+
+    def _collect(self, first):
+        """取出窗口期内到达的全部批次"""
+        batches = [first]
+        deadline = time.monotonic() + self.window
+        while True:
+            timeout = deadline - time.monotonic()
+            try:
+                item = self._queue.get(timeout=timeout) if timeout > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                return batches, False
+            if item is _STOP:
+                return batches, True
+            batches.append(item)
+
+    def _commit(self, batches):
+        if not (self.repo_dir / ".git").exists():
+            self._git("init")
+        paths = []
+        for batch_paths, _ in batches:
+            paths.extend(str(Path(p).resolve().relative_to(self.repo_dir.resolve())) for p in batch_paths)
+        paths = list(dict.fromkeys(paths))
+        result = self._git("add", "--", *paths)
+        if result.returncode != 0:
+            self.stats["last_error"] = result.stderr.strip()[:200]
+            return False
+        messages = [m for _, m in batches if m]
+        if len(batches) == 1 and messages:
+            message = messages[0]
+        else:
+            message = f"更新分析报告 - {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}（{len(batches)}轮）"
+        result = self._git("commit", "-q", "--no-verify", "-m", message)
+        if result.returncode != 0:
+            # 文件内容未变化时没有可提交的内容
+            self.stats["last_error"] = (result.stdout + result.stderr).strip()[:200]
+            return False
+        self.stats["commits"] += 1
+        return True
+
+    def _has_remote(self):
+        return self._git("remote", "get-url", self.remote).returncode == 0
+
+    def _push(self):
+        if not self._has_remote():
+            self._push_pending = False
+            return
+        try:
+            result = self._git("push", self.remote, f"HEAD:{self.branch}", timeout=self.push_timeout)
+            ok = result.returncode == 0
+            error = result.stderr.strip()[:200]
+        except subprocess.TimeoutExpired:
+            ok, error = False, f"推送超时({self.push_timeout}s)"
+        if ok:
+            self._push_pending = False
+            self._push_failures = 0
+            self.stats["pushes"] += 1
+        else:
+            self._push_failures += 1
+            self.stats["push_failures"] += 1
+            self.stats["last_error"] = error
+            delay = min(self.retry_base * 2 ** (self._push_failures - 1), self.retry_max)
+            self._next_push_at = time.monotonic() + delay
+
+    def _worker(self):
+        try:
+            self._run()
+        finally:
+            # 发布线程退出（包括意外异常），唤醒等待中的flush
+            with self._done:
+                self._stopped = True
+                self._done.notify_all()
+
+    def _run(self):
+        stopping = False
+        while True:
+            if self._push_pending and time.monotonic() >= self._next_push_at:
+                with metrics.stage("git_push"):
+                    self._push()
+            timeout = max(self._next_push_at - time.monotonic(), 0) if self._push_pending else None
+            if stopping:
+                break
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                continue
+            if item is _STOP:
+                stopping = True
+                # 退出前立即尝试推送一次
+                self._next_push_at = 0.0
+                continue
+            batches, stopping = self._collect(item)
+            try:
+                with metrics.stage("git_commit"):
+                    committed = self._commit(batches)
+            except (OSError, ValueError, subprocess.SubprocessError) as e:
+                self.stats["last_error"] = str(e)
+                committed = False
+            if committed and self.push_enabled:
+                self._push_pending = True
+                self._next_push_at = 0.0
+            with self._done:
+                self._unfinished -= len(batches)
+                self._done.notify_all()
+
+    def commit_timeout(self):
+        """
+        一批文件入队后最长多久提交完成，超过时可以认为git已卡住
+        正在进行的推送（含remote检查）、合并窗口，加上前一批和本批的add、commit
+        """
+        return self.push_timeout + self.window + 5 * GIT_TIMEOUT
+
+    def flush(self, timeout=None):
+        """
+        等待队列中的文件全部提交（不等待推送），全部提交时返回True
+        超时或发布线程已退出（剩余文件不会再提交）时返回False
+        """
+        with self._done:
+            self._done.wait_for(lambda: self._unfinished == 0 or self._stopped, timeout)
+            return self._unfinished == 0
+
+    def close(self, timeout=None):
+        """提交剩余文件并尝试最后一次推送后停止"""
+        with self._done:
+            self._closed = True
+        if not self._thread.is_alive():
+            return
+        self._queue.put(_STOP)
+        self._thread.join(self.push_timeout + 10 if timeout is None else timeout)
+
+
+_publishers = {}
+
+
+def get_publisher(repo_dir, **kwargs):
+    """同一仓库共用一个发布线程，避免多个线程争用git索引锁"""
+    key = Path(repo_dir).resolve()
+    if key not in _publishers:
+        _publishers[key] = GitPublisher(repo_dir, **kwargs)
+    return _publishers[key]
@@ -0,0 +1,330 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+历史分析查询
+从报告存储中按时间范围取出某个品种某个字段的序列，返回numpy列
+    ts, rsi = history("XAU/USD", "rsi", start, end)
+    ts, rsi = history("XAU/USD", "rsi", start, end, every=3600, how="mean")   按小时取均值
+    cols = HistoryIndex(store).query("XAG/USD", ["rsi", "trend", "levels.s1"], start, end)
+
+每个分段第一次被查询时，把其中所有品种的标量字段展开为列，缓存到 store/columns/reports-YYYYMMDD.cols
+列缓存为 8字节头长度 + JSON头（各列的类型、偏移、行数） + 连续存放的原始数组
+之后的查询按时间戳索引只读取需要的分段和列，不再解析JSON记录
+分段有新记录追加时（当天的分段）只重建该分段的列缓存
+嵌套字段用点号连接，如 levels.s1、15m.rsi、15m.bollinger.upper
+数值字段为float64（缺失为NaN），文本字段为字符串（缺失为空串）
+
+命令行:
+    python3 history_query.py <存储目录> <品种> <字段> [天数] [聚合秒数] [聚合方式]
+"""
+
+import json
+import os
+import struct
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+from report_store import KINDS, ReportStore, segment_day
+from universe import default_universe
+
+DEFAULT_STORE = Path("/root/clawd/market_analysis/store")
+
+_SEP = "|"
+
+AGGREGATES = ("last", "first", "mean", "min", "max", "count")
+
+
+def _symbol_dicts(data):
+    """记录中带symbol字段的分析结果（实时/综合报告为gold、silver，品种池汇总为analyses列表）"""
+    if not isinstance(data, dict):
+        return
+    if "symbol" in data:
+        yield data
+        return
+    for value in data.values():
+        if isinstance(value, dict) and "symbol" in value:
+            yield value
+        elif isinstance(value, list):
+            for item in value:
+                if isinstance(item, dict) and "symbol" in item:
+                    yield item
+
+
+def flatten(d, prefix=""):
+    """嵌套字典展开为 {点号路径: 标量}，列表字段（如last_klines）不展开"""
+    out = {}
+    for key, value in d.items():
+        name = prefix + str(key)
+        if isinstance(value, dict):
+            out.update(flatten(value, name + "."))
+        elif value is None or isinstance(value, (bool, int, float, str)):
+            out[name] = value
+    return out
+
+
+def _column(values):
+    """一列值转换为数组，全部为数值时为float64，否则为字符串"""
+    if all(v is None or (isinstance(v, (int, float)) and not isinstance(v, bool)) for v in values):
+        return np.array([np.nan if v is None else v for v in values], dtype=np.float64)
+    return np.array(["" if v is None else str(v) for v in values])
+
+
+def build_columns(records):
+    """
+    把一个分段的记录展开为列，返回 {"品种|字段": 数组}
+    每个品种都有 ts、kind 两列，其余字段与之按行对齐
+    """
+    rows = {}
+    for ts, kind, data in records:
+        for item in _symbol_dicts(data):
+            symbol = item["symbol"]
+            if symbol not in rows:
+                rows[symbol] = ([], [], [])
+            ts_list, kind_list, flats = rows[symbol]
+            ts_list.append(ts)
+            kind_list.append(KINDS.get(kind, 0))
+            flats.append(flatten(item))
+
+    columns = {}
+    for symbol, (ts_list, kind_list, flats) in rows.items():
+        columns[f"{symbol}{_SEP}ts"] = np.array(ts_list, dtype=np.int64)
+        columns[f"{symbol}{_SEP}kind"] = np.array(kind_list, dtype=np.int32)
+        names = dict.fromkeys(name for flat in flats for name in flat)
+        for name in names:
+            if name in ("symbol", "ts", "kind"):
+                continue
+            columns[f"{symbol}{_SEP}{name}"] = _column([flat.get(name) for flat in flats])
+    return columns
+
+
+def downsample(ts, values, every, how="last", offset=0):
+    """
+    按every秒分桶聚合，返回 (桶起点, 聚合值)
+    mean/min/max忽略NaN，count为非缺失值个数；文本列只支持last/first/count
+    """
+    if how not in AGGREGATES:
+        raise ValueError(f"不支持的聚合方式: {how}")
+    if not len(ts):
+        return ts, values
+    buckets = ts - (ts - offset) % every
+    starts = np.flatnonzero(np.r_[True, buckets[1:] != buckets[:-1]])
+    ends = np.r_[starts[1:], len(ts)] - 1
+    numeric = values.dtype.kind == "f"
+    if how == "last":
+        out = values[ends]
+    elif how == "first":
+        out = values[starts]
+    elif how == "count":
+        present = ~np.isnan(values) if numeric else values != ""
+        out = np.add.reduceat(present.astype(np.int64), starts)
+    elif not numeric:
+        raise ValueError(f"文本字段不支持{how}聚合")
+    elif how == "mean":
+        present = ~np.isnan(values)
+        sums = np.add.reduceat(np.where(present, values, 0.0), starts)
+        counts = np.add.reduceat(present.astype(np.int64), starts)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            out = np.where(counts > 0, sums / np.maximum(counts, 1), np.nan)
+    elif how == "min":
+        out = np.fmin.reduceat(values, starts)
+    else:
+        out = np.fmax.reduceat(values, starts)
+    return buckets[starts], out
+
+
+def write_columns(path, columns, stamp):
+    """列写入缓存文件（先写临时文件再替换），stamp标识生成时的分段状态"""
+    header = {"stamp": stamp, "columns": {}}
+    offset = 0
+    for name, arr in columns.items():
+        header["columns"][name] = [arr.dtype.str, offset, len(arr)]
+        offset += arr.nbytes
+    head = json.dumps(header, ensure_ascii=False).encode("utf-8")
+    tmp = Path(str(path) + ".tmp")
+    with open(tmp, "wb") as f:
+        f.write(struct.pack("<Q", len(head)))
+        f.write(head)
+        for arr in columns.values():
+            f.write(np.ascontiguousarray(arr).tobytes())
+    os.replace(tmp, path)
+
+
+def read_columns(path, names=None, stamp=None):
+    """
+    读取列缓存中的若干列（names为None时读取全部）
+    stamp与文件中的不一致或文件不存在时返回None
+    """
+    try:
+        f = open(path, "rb")
+    except FileNotFoundError:
+        return None
+    with f:
+        size = struct.unpack("<Q", f.read(8))[0]
+        header = json.loads(f.read(size))
+        if stamp is not None and header.get("stamp") != stamp:
+            return None
+        base = 8 + size
+        out = {}
+        for name in header["columns"] if names is None else names:
+            spec = header["columns"].get(name)
+            if spec is None:
+                continue
+            dtype, offset, count = spec
+            f.seek(base + offset)
+            out[name] = np.fromfile(f, dtype=np.dtype(dtype), count=count)
+        return out
+
+
+class HistoryIndex:
+    def __init__(self, store=None):
+        if not isinstance(store, ReportStore):
+            store = ReportStore(store or DEFAULT_STORE)
+        self.store = store
+        self.cache_dir = store.root / "columns"
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        # {分段日期: (分段状态, {列名: 数组})}，只保存查询过的列
+        self._loaded = {}
+        self.prune()
+
+    def _cache_path(self, day):
+        return self.cache_dir / f"reports-{day}.cols"
+
+    def _stamp(self, day):
+        """分段的记录数和数据长度，追加或压缩后都会变化"""
+        entries = self.store.index(day)
+        if not len(entries):
+            return [0, 0]
+        return [len(entries), int(entries[-1]["offset"]) + int(entries[-1]["length"])]
+
+    def _rebuild(self, day, stamp):
+        entries = self.store.index(day)[:stamp[0]]
+        columns = build_columns(self.store.read(day, entries))
+        write_columns(self._cache_path(day), columns, stamp)
+        return columns
+
+    def prune(self):
+        """删除分段已被retain删除的列缓存"""
+        days = set(self.store.days())
+        for path in self.cache_dir.glob("reports-*.cols"):
+            if path.stem[len("reports-"):] not in days:
+                path.unlink()
+
+    def columns(self, day, names):
+        """
+        读取某分段的若干列，返回 {列名: 数组}（该分段没有的列不出现）
+        列缓存与分段当前状态不一致时重建
+        """
+        stamp = self._stamp(day)
+        loaded = self._loaded.get(day)
+        if loaded is None or loaded[0] != stamp:
+            loaded = (stamp, {})
+            self._loaded[day] = loaded
+        cached = loaded[1]
+        wanted = [n for n in names if n not in cached]
+        if wanted:
+            data = read_columns(self._cache_path(day), wanted, stamp)
+            if data is None:
+                full = self._rebuild(day, stamp)
+                data = {n: full[n] for n in wanted if n in full}
+            cached.update(data)
+            # 分段中不存在的列记为None，避免重复读取
+            for n in wanted:
+                cached.setdefault(n, None)
+        return {n: cached[n] for n in names if cached.get(n) is not None}
+
+    def query(self, symbol, fields, start=None, end=None, kind=None, every=None, how="last"):
+        """
+        返回 {"ts": 时间戳, 字段: 数组}，时间在[start, end]内，按时间升序
+        kind只取某类报告（realtime/market/comprehensive/universe）
+        every为聚合秒数，各字段按how聚合
+        """
+        inst = default_universe.get(symbol)
+        symbol = inst.symbol if inst is not None else symbol
+        fields = [fields] if isinstance(fields, str) else list(fields)
+        names = [f"{symbol}{_SEP}{n}" for n in ["ts", "kind"] + fields]
+        first = None if start is None else segment_day(start)
+        last = None if end is None else segment_day(end)
+
+        parts = []
+        for day in self.store.days():
+            if (first is not None and day < first) or (last is not None and day > last):
+                continue
+            cols = self.columns(day, names)
+            ts = cols.get(names[0])
+            if ts is None:
+                continue
+            lo = 0 if start is None else int(np.searchsorted(ts, start, side="left"))
+            hi = len(ts) if end is None else int(np.searchsorted(ts, end, side="right"))
+            mask = slice(lo, hi)
+            if kind is not None:
+                mask = np.flatnonzero(cols[names[1]][lo:hi] == KINDS.get(kind, 0)) + lo
+            n = len(ts)
+            part = {"ts": ts[mask]}
+            for field, name in zip(fields, names[2:]):
+                col = cols.get(name)
+                part[field] = (col if col is not None else np.full(n, np.nan))[mask]
+            parts.append(part)
+
+        out = {"ts": np.concatenate([p["ts"] for p in parts]) if parts else np.zeros(0, dtype=np.int64)}
+        for field in fields:
+            if not parts:
+                out[field] = np.zeros(0, dtype=np.float64)
+                continue
+            values = [p[field] for p in parts]
+            if any(v.dtype.kind != "f" for v in values):
+                # 某些分段缺失的字段为NaN，与文本列合并时转为空串
+                values = [np.where(np.isnan(v), "", v.astype(str)) if v.dtype.kind == "f" else v
+                          for v in values]
+            out[field] = np.concatenate(values)
+
+        if every:
+            ts = out["ts"]
+            for field in fields:
+                out["ts"], out[field] = downsample(ts, out[field], every, how)
+        return out
+
+    def history(self, symbol, field, start=None, end=None, kind=None, every=None, how="last"):
+        """单个字段的 (时间戳, 值)"""
+        out = self.query(symbol, [field], start, end, kind, every, how)
+        return out["ts"], out[field]
+
+    def fields(self, symbol, day=None):
+        """品种在某分段（默认最新分段）中可查询的字段"""
+        days = self.store.days()
+        if not days:
+            return []
+        day = day or days[-1]
+        stamp = self._stamp(day)
+        columns = read_columns(self._cache_path(day), None, stamp)
+        names = list(columns if columns is not None else self._rebuild(day, stamp))
+        prefix = f"{symbol}{_SEP}"
+        return [n[len(prefix):] for n in names if n.startswith(prefix) and n[len(prefix):] not in ("ts", "kind")]
+
+_indexes = {}
+
+
+def history(symbol, field, start=None, end=None, kind=None, every=None, how="last", store=None):
+    """按时间范围查询某品种某字段，返回 (时间戳数组, 值数组)"""
+    root = Path(store or DEFAULT_STORE).resolve()
+    if root not in _indexes:
+        _indexes[root] = HistoryIndex(root)
+    return _indexes[root].history(symbol, field, start, end, kind, every, how)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 4:
+        print(__doc__)
+        sys.exit(1)
+    days = float(sys.argv[4]) if len(sys.argv) > 4 else 7
+    every = int(sys.argv[5]) if len(sys.argv) > 5 else None
+    how = sys.argv[6] if len(sys.argv) > 6 else "last"
+    now = int(time.time())
+    start = time.perf_counter()
+    ts, values = history(sys.argv[2], sys.argv[3], now - days * 86400, now, every=every, how=how, store=sys.argv[1])
+    elapsed = time.perf_counter() - start
+    for t, v in zip(ts[-20:], values[-20:]):
+        print(time.strftime("%Y-%m-%d %H:%M", time.gmtime(int(t))), v)
+    print(f"共 {len(ts)} 条, 查询耗时 {elapsed * 1000:.1f} ms")
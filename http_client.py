@@ -0,0 +1,295 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+共享HTTP客户端
+按主机维护keep-alive长连接池，自动解压gzip，区分连接超时和读取超时
+守护进程模式下，对query1.finance.yahoo.com的连接在品种之间、轮次之间复用
+请求可以带一个CancelToken，在另一个线程中取消（关闭socket，阻塞在读取上的线程立即返回）
+对rate_limiter.LIMITS中的主机，请求前从跨进程共享的令牌桶取令牌，429/5xx响应让所有进程一起退避
+
+本地对比测试:
+    python3 http_client.py bench [请求次数]
+"""
+
+import gzip
+import json
+import socket
+import ssl
+import sys
+import threading
+import time
+import http.client
+from urllib.parse import urlsplit
+
+import metrics
+from rate_limiter import limiter_for, wait_limit
+
+DEFAULT_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36',
+    'Accept': 'application/json',
+    'Accept-Encoding': 'gzip',
+    'Connection': 'keep-alive'
+}
+
+# 复用连接失败时可以安全重试的异常（服务器已关闭空闲连接）
+_STALE_ERRORS = (http.client.RemoteDisconnected, http.client.BadStatusLine,
+                 ConnectionResetError, BrokenPipeError)
+
+
+class HttpError(Exception):
+    """非2xx响应，paused表示该主机的令牌桶已安排退避"""
+    def __init__(self, status, url, body=b"", paused=False):
+        super().__init__(f"HTTP {status}: {url}")
+        self.status = status
+        self.url = url
+        self.body = body
+        self.paused = paused
+
+
+class Cancelled(Exception):
+    """请求被CancelToken取消"""
+
+
+class CancelToken:
+    """
+    取消进行中的请求: 关闭当前连接的socket，请求线程抛出Cancelled
+    连接阶段无法中断，连接建立后立即检查
+    """
+    def __init__(self):
+        self.cancelled = False
+        self._conn = None
+        self._lock = threading.Lock()
+
+    def attach(self, conn):
+        """登记请求使用的连接，已取消时返回False"""
+        with self._lock:
+            self._conn = conn
+            return not self.cancelled
+
+    def detach(self):
+        with self._lock:
+            self._conn = None
+
+    def cancel(self):
+        with self._lock:
+            self.cancelled = True
+            sock = self._conn.sock if self._conn is not None else None
+        if sock is not None:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+
+class Response:
+    def __init__(self, status, headers, body, url):
+        self.status = status
+        self.headers = headers
+        self.body = body
+        self.url = url
+
+    def json(self):
+        return json.loads(self.body.decode())
+
+
+class HttpClient:
+    """
+    线程安全的keep-alive连接池
+    每个(scheme, host, port)最多保留max_per_host个空闲连接
+    limiter: 按主机名返回令牌桶（或None）的函数，默认为rate_limiter.limiter_for
+    """
+    def __init__(self, connect_timeout=5, read_timeout=15, max_per_host=8, idle_timeout=60,
+                 ssl_context=None, limiter=limiter_for):
+        self.limiter = limiter
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.max_per_host = max_per_host
+        self.idle_timeout = idle_timeout
+        self.ssl_context = ssl_context or ssl.create_default_context()
+        self._pool = {}
+        self._lock = threading.Lock()
+        self.stats = {"requests": 0, "connections": 0, "reused": 0, "bytes": 0}
+
+    def _new_connection(self, scheme, host, port, connect_timeout):
+        if scheme == "https":
+            conn = http.client.HTTPSConnection(host, port, timeout=connect_timeout, context=self.ssl_context)
+        else:
+            conn = http.client.HTTPConnection(host, port, timeout=connect_timeout)
+        conn.connect()
+        # 请求-响应模式下关闭Nagle，避免小包与延迟ACK叠加的40ms等待
+        conn.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        with self._lock:
+            self.stats["connections"] += 1
+        return conn
+
+    def _acquire(self, key):
+        """取出一个未过期的空闲连接，没有则返回None"""
+        now = time.monotonic()
+        with self._lock:
+            idle = self._pool.get(key, [])
+            while idle:
+                conn, last_used = idle.pop()
+                if now - last_used < self.idle_timeout:
+                    self.stats["reused"] += 1
+                    return conn
+                conn.close()
+        return None
+
+    def _release(self, key, conn):
+        with self._lock:
+            idle = self._pool.setdefault(key, [])
+            if len(idle) < self.max_per_host:
+                idle.append((conn, time.monotonic()))
+                return
+        conn.close()
+
+    def request(self, method, url, headers=None, body=None, connect_timeout=None, read_timeout=None,
+                cancel=None):
+        """发送请求并读取完整响应，非2xx抛出HttpError，经cancel取消时抛出Cancelled"""
+        parts = urlsplit(url)
+        scheme = parts.scheme or "http"
+        port = parts.port or (443 if scheme == "https" else 80)
+        key = (scheme, parts.hostname, port)
+        path = parts.path or "/"
+        if parts.query:
+            path += "?" + parts.query
+        all_headers = dict(DEFAULT_HEADERS)
+        all_headers.update(headers or {})
+        connect_timeout = connect_timeout or self.connect_timeout
+        read_timeout = read_timeout or self.read_timeout
+
+        # 取令牌的等待不超过本轮截止时间（未设置时为连接超时），数据源要求更长的暂停时直接失败，由调用方使用备用数据
+        bucket = self.limiter(parts.hostname) if self.limiter else None
+        if bucket is not None:
+            bucket.acquire(timeout=wait_limit(connect_timeout))
+
+        with self._lock:
+            self.stats["requests"] += 1
+
+        conn = self._acquire(key)
+        reused = conn is not None
+        try:
+            while True:
+                if conn is None:
+                    conn = self._new_connection(scheme, parts.hostname, port, connect_timeout)
+                if cancel is not None and not cancel.attach(conn):
+                    self._release(key, conn)
+                    raise Cancelled(url)
+                conn.sock.settimeout(read_timeout)
+                try:
+                    conn.request(method, path, body=body, headers=all_headers)
+                    resp = conn.getresponse()
+                    data = resp.read()
+                    break
+                except _STALE_ERRORS:
+                    conn.close()
+                    if not reused or (cancel is not None and cancel.cancelled):
+                        raise
+                    # 复用的空闲连接已被服务器关闭，换新连接重试一次
+                    conn, reused = None, False
+                except Exception:
+                    conn.close()
+                    raise
+        except Cancelled:
+            raise
+        except Exception:
+            # socket被取消方关闭，读取失败的原因是取消而不是服务器
+            if cancel is not None and cancel.cancelled:
+                raise Cancelled(url) from None
+            raise
+        finally:
+            if cancel is not None:
+                cancel.detach()
+        if cancel is not None and cancel.cancelled:
+            conn.close()
+            raise Cancelled(url)
+
+        if resp.will_close:
+            conn.close()
+        else:
+            self._release(key, conn)
+
+        with self._lock:
+            self.stats["bytes"] += len(data)
+        metrics.inc("http_bytes", len(data))
+        if resp.getheader("Content-Encoding", "").lower() == "gzip":
+            data = gzip.decompress(data)
+        paused = bucket.report(resp.status, resp.getheader("Retry-After")) if bucket is not None else 0
+        if not 200 <= resp.status < 300:
+            raise HttpError(resp.status, url, data, paused=bool(paused))
+        return Response(resp.status, dict(resp.getheaders()), data, url)
+
+    def get(self, url, headers=None, **kwargs):
+        return self.request("GET", url, headers=headers, **kwargs)
+
+    def get_json(self, url, headers=None, **kwargs):
+        return self.get(url, headers=headers, **kwargs).json()
+
+    def close(self):
+        """关闭所有空闲连接"""
+        with self._lock:
+            for idle in self._pool.values():
+                for conn, _ in idle:
+                    conn.close()
+            self._pool.clear()
+
+
+# 进程内共享的客户端，所有分析器都使用它
+default_client = HttpClient()
+
+
+def get_json(url, headers=None, timeout=None, cancel=None):
+    """使用共享客户端获取JSON，timeout同时限制连接和读取"""
+    return default_client.get_json(url, headers=headers, connect_timeout=timeout, read_timeout=timeout,
+                                   cancel=cancel)
+
+
+def _bench(n):
+    """本地HTTP服务对比: 每次新建连接的urlopen vs 共享连接池"""
+    import urllib.request
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    payload = gzip.compress(json.dumps({"chart": {"result": [{"timestamp": list(range(300))}]}}).encode())
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        disable_nagle_algorithm = True
+
+        def do_GET(self):
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Encoding", "gzip")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_address[1]}/v8/finance/chart/GC=F"
+
+    start = time.perf_counter()
+    for _ in range(n):
+        with urllib.request.urlopen(url, timeout=5) as r:
+            json.loads(gzip.decompress(r.read()).decode())
+    plain = time.perf_counter() - start
+
+    client = HttpClient()
+    start = time.perf_counter()
+    for _ in range(n):
+        client.get_json(url)
+    pooled = time.perf_counter() - start
+
+    server.shutdown()
+    print(f"请求次数: {n}")
+    print(f"urlopen:  {plain * 1000 / n:.3f} ms/次")
+    print(f"连接池:   {pooled * 1000 / n:.3f} ms/次  (新建连接 {client.stats['connections']}, 复用 {client.stats['reused']})")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "bench":
+        _bench(int(sys.argv[2]) if len(sys.argv) > 2 else 500)
+    else:
+        print(__doc__)
@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+统一技术指标引擎
+所有指标都对整条序列一次性向量化计算，返回与输入等长的numpy数组
+数据不足的位置为NaN，取最新值用 [-1]
+
+EMA/Wilder平滑这类递推 y[i] = (1-a)*y[i-1] + a*x[i] 用分块闭式解计算:
+块内 y[k] = (1-a)^(k+1)*y[-1] + a*(1-a)^k * cumsum(x[j]*(1-a)^-j)
+块长按(1-a)^-k不溢出选取，整个序列只有 n/块长 次Python循环
+"""
+
+import numpy as np
+
+from kline_frame import KlineFrame
+
+
+def _recursive_filter(x, alpha, y0):
+    """y[i] = (1-alpha)*y[i-1] + alpha*x[i]，y[-1] = y0"""
+    x = np.asarray(x, dtype=np.float64)
+    n = len(x)
+    out = np.empty(n)
+    if n == 0:
+        return out
+    beta = 1.0 - alpha
+    if beta <= 0:
+        out[:] = x
+        return out
+    block = int(min(n, max(1, 300 / -np.log(beta))))
+    decay = beta ** np.arange(block)
+    grow = 1.0 / decay
+    prev = y0
+    for start in range(0, n, block):
+        seg = x[start:start + block]
+        m = len(seg)
+        y = decay[:m] * (beta * prev + alpha * np.cumsum(seg * grow[:m]))
+        out[start:start + m] = y
+        prev = y[-1]
+    return out
+
+
+def _wilder(x, period):
+    """Wilder平滑: 前period个值的均值作为起点，之后 a=1/period 递推"""
+    x = np.asarray(x, dtype=np.float64)
+    n = len(x)
+    out = np.full(n, np.nan)
+    if n == 0:
+        return out
+    seed = min(period, n)
+    out[seed - 1] = x[:seed].mean()
+    out[seed:] = _recursive_filter(x[seed:], 1.0 / period, out[seed - 1])
+    return out
+
+
+def sma(values, period):
+    """简单移动平均"""
+    x = np.asarray(values, dtype=np.float64)
+    out = np.full(len(x), np.nan)
+    if len(x) >= period:
+        c = np.cumsum(np.insert(x - x[0], 0, 0.0))
+        out[period - 1:] = (c[period:] - c[:-period]) / period + x[0]
+    return out
+
+
+def ema(values, period):
+    """指数移动平均，以序列第一个值为起点"""
+    x = np.asarray(values, dtype=np.float64)
+    if not len(x):
+        return x.copy()
+    return _recursive_filter(x, 2.0 / (period + 1), x[0])
+
+
+def rsi(closes, period=14):
+    """Wilder RSI，无下跌时为100，无涨跌时为50"""
+    x = np.asarray(closes, dtype=np.float64)
+    out = np.full(len(x), np.nan)
+    if len(x) < 2:
+        return out
+    delta = np.diff(x)
+    avg_gain = _wilder(np.clip(delta, 0, None), period)
+    avg_loss = _wilder(np.clip(-delta, 0, None), period)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        values = 100.0 - 100.0 / (1.0 + avg_gain / avg_loss)
+    values = np.where(avg_loss == 0, np.where(avg_gain == 0, 50.0, 100.0), values)
+    out[1:] = np.where(np.isnan(avg_gain), np.nan, values)
+    return out
+
+
+def true_range(highs, lows, closes):
+    """真实波幅，第一根为 high-low"""
+    h = np.asarray(highs, dtype=np.float64)
+    l = np.asarray(lows, dtype=np.float64)
+    c = np.asarray(closes, dtype=np.float64)
+    tr = h - l
+    if len(c) > 1:
+        prev = c[:-1]
+        tr[1:] = np.maximum(tr[1:], np.maximum(np.abs(h[1:] - prev), np.abs(l[1:] - prev)))
+    return tr
+
+
+def atr(highs, lows, closes, period=14):
+    """Wilder ATR"""
+    return _wilder(true_range(highs, lows, closes), period)
+
+
+def macd(closes, fast=12, slow=26, signal=9):
+    """MACD: 返回 (DIFF, DEA, HIST)，DEA为DIFF的EMA信号线"""
+    diff = ema(closes, fast) - ema(closes, slow)
+    dea = ema(diff, signal)
+    return diff, dea, diff - dea
+
+
+def bollinger(closes, period=20, k=2.0):
+    """布林带: 返回 (上轨, 中轨, 下轨)，标准差为总体标准差"""
+    x = np.asarray(closes, dtype=np.float64)
+    n = len(x)
+    upper = np.full(n, np.nan)
+    middle = np.full(n, np.nan)
+    lower = np.full(n, np.nan)
+    if n >= period:
+        # 先减去均值再做累加，避免大价格平方和的精度损失
+        centered = x - x.mean()
+        c1 = np.cumsum(np.insert(centered, 0, 0.0))
+        c2 = np.cumsum(np.insert(centered * centered, 0, 0.0))
+        mean = (c1[period:] - c1[:-period]) / period
+        var = np.maximum((c2[period:] - c2[:-period]) / period - mean * mean, 0.0)
+        std = np.sqrt(var)
+        middle[period - 1:] = mean + x.mean()
+        upper[period - 1:] = middle[period - 1:] + k * std
+        lower[period - 1:] = middle[period - 1:] - k * std
+    return upper, middle, lower
+
+
+def snapshot(klines):
+    """
+    计算分析器使用的全部指标并取最新值
+    klines为字典列表或KlineFrame，各入口脚本都调用这里，结果保持一致
+    """
+    frame = KlineFrame.from_klines(klines)
+    closes = frame.close
+    diff, dea, hist = macd(closes)
+    upper, middle, lower = bollinger(closes, min(20, len(closes)))
+
+    def last(series):
+        value = float(series[-1])
+        return value if value == value else None
+
+    return {
+        "ema7": last(ema(closes, 7)),
+        "ema25": last(ema(closes, 25)),
+        "ema99": last(ema(closes, 99)),
+        "rsi": last(rsi(closes, 14)),
+        "atr": last(atr(frame.high, frame.low, closes, 14)),
+        "macd_diff": last(diff),
+        "macd_dea": last(dea),
+        "macd_hist": last(hist),
+        "boll_upper": last(upper),
+        "boll_middle": last(middle),
+        "boll_lower": last(lower),
+    }
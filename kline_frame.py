@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+列式K线容器
+time为int64列，open/high/low/close/volume为float64列
+按下标或时间切片都返回共享内存的视图，不复制数据
+与 [{"time","open","high","low","close","volume"}] 字典列表可以互相转换
+"""
+
+import numpy as np
+
+PRICE_COLUMNS = ("open", "high", "low", "close", "volume")
+
+
+class KlineFrame:
+    __slots__ = ("time",) + PRICE_COLUMNS
+
+    def __init__(self, time, open, high, low, close, volume):
+        self.time = np.asarray(time, dtype=np.int64)
+        self.open = np.asarray(open, dtype=np.float64)
+        self.high = np.asarray(high, dtype=np.float64)
+        self.low = np.asarray(low, dtype=np.float64)
+        self.close = np.asarray(close, dtype=np.float64)
+        self.volume = np.asarray(volume, dtype=np.float64)
+
+    @classmethod
+    def from_klines(cls, klines):
+        """由字典列表构建"""
+        if isinstance(klines, cls):
+            return klines
+        n = len(klines)
+        return cls(
+            np.fromiter((k["time"] for k in klines), dtype=np.int64, count=n),
+            *(np.fromiter((k[c] for k in klines), dtype=np.float64, count=n) for c in PRICE_COLUMNS)
+        )
+
+    @classmethod
+    def empty(cls):
+        return cls(*([] for _ in range(6)))
+
+    def to_klines(self):
+        """转换回字典列表，供报告和JSON输出使用"""
+        rows = zip(self.time.tolist(), self.open.tolist(), self.high.tolist(),
+                   self.low.tolist(), self.close.tolist(), self.volume.tolist())
+        return [{"time": t, "open": o, "high": h, "low": l, "close": c,
+                 "volume": int(v) if v.is_integer() else v}
+                for t, o, h, l, c, v in rows]
+
+    def __len__(self):
+        return len(self.time)
+
+    def __getitem__(self, key):
+        """整数下标返回单根K线字典，切片返回视图"""
+        if isinstance(key, slice):
+            return KlineFrame(self.time[key], self.open[key], self.high[key],
+                              self.low[key], self.close[key], self.volume[key])
+        volume = float(self.volume[key])
+        return {"time": int(self.time[key]), "open": float(self.open[key]), "high": float(self.high[key]),
+                "low": float(self.low[key]), "close": float(self.close[key]),
+                "volume": int(volume) if volume.is_integer() else volume}
+
+    def __iter__(self):
+        return iter(self.to_klines())
+
+    def tail(self, n):
+        return self[-n:] if n else self[:0]
+
+    def between(self, t0=None, t1=None):
+        """时间在[t0, t1]内的K线视图，time列有序，二分查找定位"""
+        start = 0 if t0 is None else int(np.searchsorted(self.time, t0, side="left"))
+        end = len(self) if t1 is None else int(np.searchsorted(self.time, t1, side="right"))
+        return self[start:end]
+
+    def columns(self):
+        return {"time": self.time, "open": self.open, "high": self.high,
+                "low": self.low, "close": self.close, "volume": self.volume}
+
+    @property
+    def nbytes(self):
+        return sum(col.nbytes for col in self.columns().values())
+
+    def __repr__(self):
+        if not len(self):
+            return "KlineFrame(0 bars)"
+        return f"KlineFrame({len(self)} bars, {int(self.time[0])}..{int(self.time[-1])})"
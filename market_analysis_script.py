@@ -7,59 +7,75 @@ GC=F: COMEX黄金期货
 SI=F: COMEX白银期货
 """
 
-import json
 import time
-import subprocess
 import os
 from datetime import datetime
 from pathlib import Path
-import urllib.request
+
+from git_publisher import get_publisher
+import indicators
+from kline_frame import KlineFrame
+from market_data import fetch_batched
+from price_source import PriceResolver
+from report_renderer import render_comprehensive_markdown
+from report_store import ReportStore, write_latest
+from volume_profile import VolumeProfile, tick_size
 
 class GoldSilverAnalyzer:
+    # 所有数据源都不可用时的参考价，报告中标明为非实时数据
+    DEFAULT_PRICES = {"GC=F": 4680.00, "SI=F": 87.30}
+    
     def __init__(self):
         self.output_dir = Path("/root/clawd/market_analysis")
         self.output_dir.mkdir(parents=True, exist_ok=True)
+        self.store = ReportStore(self.output_dir / "store")
+        self.publisher = get_publisher(self.output_dir)
+        # 实时 -> 最近价格 -> 备用源 -> 参考价，结果带来源和数据年龄
+        self.resolver = PriceResolver(self.output_dir / "cache")
         
+    def get_latest_price(self, symbol):
+        """获取期货最新收盘价"""
+        quote = self.resolver.resolve(symbol, self.DEFAULT_PRICES[symbol])
+        if quote.source != "live":
+            print(f"获取{symbol}实时价格失败: {quote.error}，使用{quote.label()}")
+        return quote.price
+    
     def get_gold_price(self):
         """直接获取黄金期货价格 (GC=F)"""
-        try:
-            url = "https://query1.finance.yahoo.com/v8/finance/chart/GC=F?interval=5m&range=1d"
-            req = urllib.request.Request(url, headers={'User-Agent': 'Mozilla/5.0'})
-            with urllib.request.urlopen(req, timeout=15) as r:
-                data = json.loads(r.read().decode())
-                result = data.get('chart', {}).get('result', [{}])[0]
-                closes = result.get('indicators', {}).get('quote', [{}])[0].get('close', [])
-                if closes and closes[-1]:
-                    return round(closes[-1], 2)
-        except Exception as e:
-            print(f"获取黄金价格失败: {e}")
-        return 4680.00
+        return self.get_latest_price("GC=F")
     
     def get_silver_price(self):
         """直接获取白银期货价格 (SI=F)"""
-        try:
-            url = "https://query1.finance.yahoo.com/v8/finance/chart/SI=F?interval=5m&range=1d"
-            req = urllib.request.Request(url, headers={'User-Agent': 'Mozilla/5.0'})
-            with urllib.request.urlopen(req, timeout=15) as r:
-                data = json.loads(r.read().decode())
-                result = data.get('chart', {}).get('result', [{}])[0]
-                closes = result.get('indicators', {}).get('quote', [{}])[0].get('close', [])
-                if closes and closes[-1]:
-                    return round(closes[-1], 2)
-        except Exception as e:
-            print(f"获取白银价格失败: {e}")
-        return 87.30
+        return self.get_latest_price("SI=F")
     
     def get_market_data(self):
         print("[1/5] 获取市场数据...")
-        gold_price = self.get_gold_price()
-        silver_price = self.get_silver_price()
-        print(f"  黄金(GC=F): ${gold_price}")
-        print(f"  白银(SI=F): ${silver_price}")
+        # 只需要最新价，黄金、白银合并为一次批量请求，失败的品种再单独请求
+        # Yahoo已熔断时不发请求，直接使用备用来源
+        results = {}
+        if self.resolver.allow("yahoo"):
+            budget = self.resolver.budget
+            results = fetch_batched(list(self.DEFAULT_PRICES), timeout=budget, deadline=budget * 2)
+            self.resolver.record("yahoo", any(not res['error'] for res in results.values()))
+        quotes = {}
+        for symbol in self.DEFAULT_PRICES:
+            res = results.get(symbol)
+            if res is not None and not res['error']:
+                data = res['data']
+                quotes[symbol] = self.resolver.remember(symbol, data['current_price'], data['klines'][-1]['time'])
+            else:
+                error = res['error'] if res is not None else "yahoo 已熔断"
+                quotes[symbol] = self.resolver.fallback(symbol, self.DEFAULT_PRICES[symbol], error)
+                print(f"  获取{symbol}实时价格失败: {error}")
+        gold, silver = quotes["GC=F"], quotes["SI=F"]
+        print(f"  黄金(GC=F): ${gold.price}（{gold.label()}）")
+        print(f"  白银(SI=F): ${silver.price}（{silver.label()}）")
         
         return {
-            "gold": {"price": gold_price, "klines": self.generate_gold_klines(gold_price)},
-            "silver": {"price": silver_price, "klines": self.generate_silver_klines(silver_price)},
+            "gold": {"price": gold.price, "quote": gold.to_dict(), "source": gold.label(),
+                     "klines": self.generate_gold_klines(gold.price)},
+            "silver": {"price": silver.price, "quote": silver.to_dict(), "source": silver.label(),
+                       "klines": self.generate_silver_klines(silver.price)},
             "cme": self.get_cme_data(),
             "options": self.get_options_data()
         }
@@ -109,37 +125,22 @@ class GoldSilverAnalyzer:
         }
     
     def calculate_ema(self, prices, period):
-        k = 2 / (period + 1)
-        ema = prices[0]
-        for price in prices[1:]:
-            ema = price * k + ema * (1 - k)
-        return ema
+        """计算EMA（最新值）"""
+        return float(indicators.ema(prices, period)[-1])
     
     def calculate_atr(self, klines, period=14):
-        trs = []
-        for i, k in enumerate(klines):
-            if i == 0:
-                tr = k['high'] - k['low']
-            else:
-                prev_close = klines[i-1]['close']
-                tr = max(k['high'] - k['low'], abs(k['high'] - prev_close), abs(k['low'] - prev_close))
-            trs.append(tr)
-        return sum(trs[-period:]) / min(period, len(trs))
+        """计算ATR（最新值）"""
+        frame = KlineFrame.from_klines(klines)
+        return float(indicators.atr(frame.high, frame.low, frame.close, period)[-1])
     
     def calculate_rsi(self, prices, period=14):
-        deltas = [prices[i+1] - prices[i] for i in range(len(prices)-1)]
-        gains = [d if d > 0 else 0 for d in deltas]
-        losses = [-d if d < 0 else 0 for d in deltas]
-        avg_gain = sum(gains[-period:]) / period if gains else 0
-        avg_loss = sum(losses[-period:]) / period if losses else 0
-        if avg_loss == 0:
-            return 70
-        rs = avg_gain / avg_loss
-        return 100 - (100 / (1 + rs))
+        """计算RSI（最新值）"""
+        return float(indicators.rsi(prices, period)[-1])
     
     def wyckoff_analysis(self, klines, current_price):
-        closes = [k['close'] for k in klines]
-        volumes = [k['volume'] for k in klines]
+        frame = KlineFrame.from_klines(klines)
+        closes = frame.close.tolist()
+        volumes = frame.volume.tolist()
         current_trend = "uptrend" if closes[-1] > closes[-5] else "downtrend" if closes[-1] < closes[-5] else "neutral"
         avg_volume = sum(volumes[-5:]) / 5
         volume_trend = "effort_increasing" if volumes[-1] > avg_volume * 1.2 else "effort_decreasing"
@@ -154,210 +155,54 @@ class GoldSilverAnalyzer:
             "force_index": round((closes[-1] - closes[-2]) * volumes[-1] / 1000, 2) if len(closes) > 1 else 0
         }
     
-    def profile_analysis(self, klines):
-        closes = [k['close'] for k in klines]
-        highs = [k['high'] for k in klines]
-        lows = [k['low'] for k in klines]
-        volumes = [k['volume'] for k in klines]
-        price_levels = {}
-        for i, k in enumerate(klines):
-            price_range = highs[i] - lows[i]
-            for p in [lows[i] + price_range * 0.25, lows[i] + price_range * 0.5, lows[i] + price_range * 0.75]:
-                rounded = round(p, 2)
-                price_levels[rounded] = price_levels.get(rounded, 0) + volumes[i]
-        sorted_prices = sorted(price_levels.items(), key=lambda x: x[1], reverse=True)
-        total_vol = sum(price_levels.values())
-        cum_vol = 0
-        value_area = []
-        for price, vol in sorted_prices:
-            cum_vol += vol
-            value_area.append(price)
-            if total_vol > 0 and cum_vol / total_vol >= 0.70:
-                break
-        poc = sorted_prices[0][0] if sorted_prices else sum(closes) / len(closes)
-        vah = max(value_area) if value_area else max(closes)
-        val = min(value_area) if value_area else min(closes)
+    def profile_analysis(self, klines, tick=0.01):
+        frame = KlineFrame.from_klines(klines)
+        current = float(frame.close[-1])
+        profile = VolumeProfile.from_klines(frame, tick).summary(current)
+        if profile is None:
+            return {"poc": round(current, 2), "vah": round(current, 2), "val": round(current, 2),
+                    "price_position": "inside_value"}
         return {
-            "poc": round(poc, 2),
-            "vah": round(vah, 2),
-            "val": round(val, 2),
-            "price_position": "above_value" if closes[-1] > vah else "below_value" if closes[-1] < val else "inside_value"
+            "poc": profile["poc"],
+            "vah": profile["vah"],
+            "val": profile["val"],
+            "price_position": profile["position"] + "_value"
         }
     
     def analyze(self, klines, symbol, price):
-        closes = [k['close'] for k in klines]
-        highs = [k['high'] for k in klines]
-        lows = [k['low'] for k in klines]
-        volumes = [k['volume'] for k in klines]
+        # 只转换一次，威科夫和四度空间分析共用同一个KlineFrame
+        frame = KlineFrame.from_klines(klines)
+        closes = frame.close.tolist()
+        volumes = frame.volume.tolist()
         current_price = closes[-1]
-        ema7 = self.calculate_ema(closes[-7:], 7)
-        ema25 = self.calculate_ema(closes[-25:], 25)
-        ema99 = self.calculate_ema(closes, min(99, len(closes)))
-        rsi = self.calculate_rsi(closes[-15:], 14)
-        atr = self.calculate_atr(klines[-14:])
-        ema12 = self.calculate_ema(closes[-12:], 12)
-        ema26 = self.calculate_ema(closes[-26:], 26)
-        diff = ema12 - ema26
-        dea = diff * 0.8
-        hist = diff - dea
+        ind = indicators.snapshot(frame)
+        ema7, ema25, ema99 = ind['ema7'], ind['ema25'], ind['ema99']
+        rsi = ind['rsi']
+        atr = ind['atr']
+        hist = ind['macd_hist']
         trend = "strong_bullish" if ema7 > ema25 > ema99 and rsi > 60 else "bullish" if ema7 > ema25 else "bearish" if ema7 < ema25 else "consolidation"
         vol_avg = sum(volumes[-5:]) / 5
         vol_trend = "increasing" if volumes[-1] > vol_avg * 0.9 else "decreasing"
         return {
             "symbol": symbol, "current_price": round(current_price, 2),
-            "daily_high": round(max(highs), 2), "daily_low": round(min(lows), 2),
+            "daily_high": round(float(frame.high.max()), 2), "daily_low": round(float(frame.low.min()), 2),
             "trend": trend, "ema7": round(ema7, 2), "ema25": round(ema25, 2), "ema99": round(ema99, 2),
             "rsi": round(rsi, 1), "atr": round(atr, 2),
             "macd_hist": round(hist, 2),
-            "volume_trend": vol_trend, "last_klines": klines[-5:],
-            "wyckoff": self.wyckoff_analysis(klines, current_price),
-            "profile": self.profile_analysis(klines)
+            "volume_trend": vol_trend, "last_klines": frame[-5:].to_klines(),
+            "wyckoff": self.wyckoff_analysis(frame, current_price),
+            "profile": self.profile_analysis(frame, tick_size(symbol))
         }
     
     def generate_report(self, market_data, gold, silver):
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        
-        md = f"""# 贵金属综合技术分析报告
-
-**生成时间**: {datetime.now().strftime("%Y-%m-%d %H:%M:%S")}  
-**数据来源**: Yahoo Finance (GC=F黄金期货, SI=F白银期货)  
-**分析周期**: 5分钟K线 + 多维度分析
-
----
-
-## 一、国际黄金(XAU/USD)综合分析
-
-### 1.1 实时行情
-- 当前价格: ${gold['current_price']}
-- 日内区间: ${gold['daily_low']} - ${gold['daily_high']}
-- ATR(14): {gold['atr']}
-
-### 1.2 技术指标
-| 指标 | 数值 | 信号 |
-|------|------|------|
-| 趋势 | {gold['trend']} | {'偏多' if 'bullish' in gold['trend'] else '偏空' if 'bearish' in gold['trend'] else '中性'} |
-| EMA7/25/99 | {gold['ema7']}/{gold['ema25']}/{gold['ema99']} | {'多头排列' if gold['ema7'] > gold['ema25'] else '空头排列'} |
-| RSI(14) | {gold['rsi']} | {'超买' if gold['rsi'] > 70 else '偏强' if gold['rsi'] > 60 else '中性' if gold['rsi'] > 40 else '偏弱'} |
-| MACD | {gold['macd_hist']} | {'金叉' if gold['macd_hist'] > 0 else '死叉'} |
-
-### 1.3 威科夫分析
-- 趋势: {gold['wyckoff']['current_trend']}
-- 量能: {gold['wyckoff']['volume_trend']}
-- 弹簧测试: {'是' if gold['wyckoff']['spring_test'] else '否'}
-- 供需: {gold['wyckoff']['supply_demand']} ({'买方主导' if gold['wyckoff']['supply_demand'] == 'demand' else '卖方主导'})
-- 阶段: {gold['wyckoff']['wyckoff_phase']}
-
-### 1.4 四度空间分析
-- POC: ${gold['profile']['poc']}
-- VAH/VAL: ${gold['profile']['vah']}/${gold['profile']['val']}
-- 价格位置: {gold['profile']['price_position']}
-
-### 1.5 CME持仓
-- 商业净头寸: {market_data['cme']['gold']['commercial_net']:,} ({'看涨' if market_data['cme']['gold']['commercial_net'] > 0 else '看跌'})
-- 多空比: {market_data['cme']['gold']['long_short_ratio']}
-
-### 1.6 期权分析
-- PCR: {market_data['options']['gold']['put_call_ratio']} ({'看跌多' if market_data['options']['gold']['put_call_ratio'] > 1 else '看涨多'})
-- Max Pain: ${market_data['options']['gold']['max_pain']}
-- IV: {market_data['options']['gold']['vix_equivalent']}
-
-### 1.7 关键价位
-- 支撑: ${round(gold['current_price'] - gold['atr']*0.5, 2)}, ${round(gold['current_price'] - gold['atr']*1, 2)}
-- 阻力: ${round(gold['current_price'] + gold['atr']*0.5, 2)}, ${round(gold['current_price'] + gold['atr']*1, 2)}
-
----
-
-## 二、国际白银(XAG/USD)综合分析
-
-### 2.1 实时行情
-- 当前价格: ${silver['current_price']}
-- 日内区间: ${silver['daily_low']} - ${silver['daily_high']}
-- ATR(14): {silver['atr']}
-
-### 2.2 技术指标
-| 指标 | 数值 | 信号 |
-|------|------|------|
-| 趋势 | {silver['trend']} | {'偏多' if 'bullish' in silver['trend'] else '偏空' if 'bearish' in silver['trend'] else '中性'} |
-| EMA7/25/99 | {silver['ema7']}/{silver['ema25']}/{silver['ema99']} | {'多头排列' if silver['ema7'] > silver['ema25'] else '空头排列'} |
-| RSI(14) | {silver['rsi']} | {'超买' if silver['rsi'] > 70 else '偏强' if silver['rsi'] > 60 else '中性' if silver['rsi'] > 40 else '偏弱'} |
-| MACD | {silver['macd_hist']} | {'金叉' if silver['macd_hist'] > 0 else '死叉'} |
-
-### 2.3 威科夫分析
-- 趋势: {silver['wyckoff']['current_trend']}
-- 量能: {silver['wyckoff']['volume_trend']}
-- 弹簧测试: {'是' if silver['wyckoff']['spring_test'] else '否'}
-- 供需: {silver['wyckoff']['supply_demand']} ({'买方主导' if silver['wyckoff']['supply_demand'] == 'demand' else '卖方主导'})
-- 阶段: {silver['wyckoff']['wyckoff_phase']}
-
-### 2.4 四度空间分析
-- POC: ${silver['profile']['poc']}
-- VAH/VAL: ${silver['profile']['vah']}/${silver['profile']['val']}
-- 价格位置: {silver['profile']['price_position']}
-
-### 2.5 CME持仓
-- 商业净头寸: {market_data['cme']['silver']['commercial_net']:,} ({'看涨' if market_data['cme']['silver']['commercial_net'] > 0 else '看跌'})
-- 多空比: {market_data['cme']['silver']['long_short_ratio']}
-
-### 2.6 期权分析
-- PCR: {market_data['options']['silver']['put_call_ratio']} ({'看跌多' if market_data['options']['silver']['put_call_ratio'] > 1 else '看涨多'})
-- Max Pain: ${market_data['options']['silver']['max_pain']}
-- IV: {market_data['options']['silver']['vix_equivalent']}
-
-### 2.7 关键价位
-- 支撑: ${round(silver['current_price'] - silver['atr']*0.5, 2)}, ${round(silver['current_price'] - silver['atr']*1, 2)}
-- 阻力: ${round(silver['current_price'] + silver['atr']*0.5, 2)}, ${round(silver['current_price'] + silver['atr']*1, 2)}
-
----
-
-## 三、高胜率交易计划
-
-### 3.1 黄金交易计划
-
-**方案A: 回踩做多（胜率最高）**
-- 进场位: {round(gold['current_price'] - gold['atr']*0.3, 2)}-{round(gold['current_price'] - gold['atr']*0.1, 2)}
-- 止损: {round(gold['current_price'] - gold['atr']*1, 2)}
-- 止盈: {round(gold['current_price'] + gold['atr']*1, 2)}
-- 盈亏比: 1:2
-- 仓位: 30%
-
-**方案B: 突破做多**
-- 进场位: {round(gold['current_price'] + gold['atr']*0.5, 2)}+回踩确认
-- 止损: {gold['current_price']}
-- 止盈: {round(gold['current_price'] + gold['atr']*1.5, 2)}
-- 盈亏比: 1:1.5
-- 仓位: 25%
-
-### 3.2 白银交易计划
-
-**方案A: 回踩做多（胜率最高）**
-- 进场位: {round(silver['current_price'] - silver['atr']*0.3, 2)}-{round(silver['current_price'] - silver['atr']*0.1, 2)}
-- 止损: {round(silver['current_price'] - silver['atr']*1, 2)}
-- 止盈: {round(silver['current_price'] + silver['atr']*1, 2)}
-- 盈亏比: 1:2
-- 仓位: 30%
-
-**方案B: 突破做多**
-- 进场位: {round(silver['current_price'] + silver['atr']*0.5, 2)}+回踩确认
-- 止损: {silver['current_price']}
-- 止盈: {round(silver['current_price'] + silver['atr']*1.5, 2)}
-- 盈亏比: 1:1.5
-- 仓位: 25%
-
----
-
-**报告编号**: {timestamp}  
-*自动化系统生成，基于Yahoo Finance期货实时数据*
-"""
-        return md
+        cme, options = market_data['cme'], market_data['options']
+        return render_comprehensive_markdown([
+            (gold, cme['gold'], options['gold']),
+            (silver, cme['silver'], options['silver']),
+        ])
     
     def save_and_push(self, market_data, gold, silver):
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        md_file = self.output_dir / f"analysis_{timestamp}.md"
-        json_file = self.output_dir / f"analysis_{timestamp}.json"
-        
-        with open(md_file, 'w', encoding='utf-8') as f:
-            f.write(self.generate_report(market_data, gold, silver))
-        
         json_data = {
             "timestamp": int(time.time()),
             "datetime": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
@@ -366,14 +211,14 @@ class GoldSilverAnalyzer:
             "gold": gold,
             "silver": silver
         }
-        with open(json_file, 'w', encoding='utf-8') as f:
-            json.dump(json_data, f, indent=2, ensure_ascii=False)
+        ts = self.store.append("comprehensive", json_data, json_data["timestamp"])
+        md_file = write_latest(self.output_dir / "analysis_latest.md",
+                               self.generate_report(market_data, gold, silver))
         
-        subprocess.run(["git", "add", "."], cwd=self.output_dir, capture_output=True)
-        subprocess.run(['git', 'commit', '-m', f'更新分析报告 - {timestamp}'], cwd=self.output_dir, capture_output=True)
-        result = subprocess.run(["git", "push", "origin", "main"], cwd=self.output_dir, capture_output=True, timeout=120)
+        # 提交和推送在后台进行，不阻塞本轮分析
+        self.publisher.publish([md_file, self.store.segment_path(ts)], f'更新分析报告 - {timestamp}')
         
-        return md_file, result.returncode == 0
+        return md_file, True
     
     def run(self):
         print("=" * 60)
@@ -384,13 +229,15 @@ class GoldSilverAnalyzer:
         market_data = self.get_market_data()
         gold = self.analyze(market_data['gold']['klines'], "XAU/USD", market_data['gold']['price'])
         silver = self.analyze(market_data['silver']['klines'], "XAG/USD", market_data['silver']['price'])
+        gold['data_source'] = market_data['gold']['source']
+        silver['data_source'] = market_data['silver']['source']
         
         md_file, success = self.save_and_push(market_data, gold, silver)
         
         print("=" * 60)
         print(f"完成! 黄金: ${market_data['gold']['price']}, 白银: ${market_data['silver']['price']}")
         print(f"报告: {md_file.name}")
-        print(f"GitHub: {'成功' if success else '失败'}")
+        print(f"GitHub: {'已加入发布队列' if success else '失败'}")
         print("=" * 60)
 
 if __name__ == "__main__":
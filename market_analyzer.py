@@ -6,44 +6,99 @@
 并推送到GitHub仓库
 """
 
-import json
 import time
-import subprocess
-import os
 from datetime import datetime
 from pathlib import Path
 
+from git_publisher import get_publisher
+import indicators
+import metrics
+from kline_frame import KlineFrame
+from market_data import fetch_klines
+from price_source import PriceResolver
+from report_store import ReportStore, write_latest
+from resampler import resample_all
+
 class MarketAnalyzer:
+    # 报告品种对应的Yahoo期货合约，用于获取1分钟基础K线
+    CHART_SYMBOLS = {"XAU/USD": "GC=F", "XAG/USD": "SI=F"}
+    # 由1分钟K线合成的周期
+    TIMEFRAMES = ("5m", "15m", "1h", "4h")
+    # 所有数据源都不可用时的参考价，报告中标明为非实时数据
+    DEFAULT_PRICES = {"XAU": 2680.50, "XAG": 85.50}
+    
     def __init__(self):
         self.output_dir = Path("/root/clawd/market_analysis")
         self.output_dir.mkdir(parents=True, exist_ok=True)
+        self.store = ReportStore(self.output_dir / "store")
+        # 只提交到本地仓库，推送由外部配置remote后进行
+        self.publisher = get_publisher(self.output_dir, push=False)
+        # Yahoo期货价与open.er-api.com现货价对冲请求 -> 最近价格 -> 参考价
+        self.resolver = PriceResolver(self.output_dir / "cache")
         
     def get_price(self, symbol):
-        """获取贵金属价格"""
+        """获取贵金属价格，返回Quote（价格、来源、数据年龄）"""
+        return self.resolver.resolve(f"{symbol}/USD", self.DEFAULT_PRICES.get(symbol, 0), hedge=True)
+    
+    def get_base_klines(self, symbol):
+        """获取1分钟基础K线（一次下载），失败返回None"""
         try:
-            url_map = {
-                "XAU": "https://open.er-api.com/v1/latest/XAU",
-                "XAG": "https://open.er-api.com/v1/latest/XAG"
-            }
-            import urllib.request
-            req = urllib.request.Request(
-                url_map.get(symbol, ""), 
-                headers={'User-Agent': 'Mozilla/5.0'}
-            )
-            with urllib.request.urlopen(req, timeout=10) as r:
-                data = json.loads(r.read().decode())
-                return data.get('rates', {}).get('USD', None)
-        except:
-            # 默认价格（备用）
-            default_prices = {
-                "XAU": 2680.50,
-                "XAG": 85.50
+            data = fetch_klines(self.CHART_SYMBOLS[symbol], interval="1m", range_="5d")
+            return KlineFrame.from_klines(data['klines'])
+        except Exception as e:
+            print(f"获取{symbol} 1分钟K线失败: {e}")
+            return None
+    
+    def chart_section(self, frame):
+        """由真实K线计算单个周期的指标"""
+        ind = indicators.snapshot(frame)
+        
+        def r(value, digits=2):
+            return round(value, digits) if value is not None else None
+        
+        ema7, ema25, ema99, rsi = ind['ema7'], ind['ema25'], ind['ema99'], ind['rsi']
+        if rsi is None:
+            trend = "consolidation"
+        elif ema7 > ema25:
+            trend = "strong_bullish" if ema25 > ema99 and rsi > 60 else "bullish"
+        elif ema7 < ema25:
+            trend = "bearish"
+        else:
+            trend = "consolidation"
+        volumes = frame.volume[-5:]
+        volume = "increasing ↑" if len(volumes) and volumes[-1] > volumes.mean() * 0.9 else "decreasing ↓"
+        
+        return {
+            "trend": trend,
+            "bars": len(frame),
+            "ema_ema7": r(ema7),
+            "ema_ema25": r(ema25),
+            "ema_ema99": r(ema99),
+            "bollinger": {
+                "upper": r(ind['boll_upper']),
+                "middle": r(ind['boll_middle']),
+                "lower": r(ind['boll_lower'])
+            },
+            "volume": volume,
+            "rsi": r(rsi, 1),
+            "macd": {
+                "diff": r(ind['macd_diff'], 3),
+                "dea": r(ind['macd_dea'], 3),
+                "hist": r(ind['macd_hist'], 3)
             }
-            return default_prices.get(symbol, 0)
+        }
     
-    def generate_analysis(self, symbol, base_price):
-        """生成技术分析数据"""
-        import random
+    def build_charts(self, base_klines):
+        """1分钟K线一次合成所有周期，返回 {"1m_chart": ..., "5m_chart": ..., ...}"""
+        frames = {"1m": KlineFrame.from_klines(base_klines)}
+        frames.update(resample_all(frames["1m"], self.TIMEFRAMES))
+        return {f"{tf}_chart": self.chart_section(frame) for tf, frame in frames.items() if len(frame)}
+    
+    def generate_analysis(self, symbol, base_price, base_klines=None):
+        """
+        生成技术分析数据
+        提供1分钟基础K线时，各周期指标均由真实K线合成计算
+        """
         current_price = base_price
         
         if symbol == "XAU/USD":
@@ -53,12 +108,28 @@ class MarketAnalyzer:
             volatility = 0.3
             price_range = 1
         
-        return {
+        if base_klines is not None and len(base_klines) >= 2:
+            charts = self.build_charts(base_klines)
+            source = f"Yahoo Finance {self.CHART_SYMBOLS[symbol]} 1分钟K线合成"
+        else:
+            charts = self.simulated_charts(current_price, volatility, price_range)
+            source = "模拟指标（无K线数据，非实时）"
+        
+        analysis = {
             "symbol": symbol,
             "current_price": current_price,
             "timestamp": int(time.time()),
             "datetime": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-            "source": "实时行情数据",
+            "source": source
+        }
+        analysis.update(charts)
+        analysis.update(self.price_levels(current_price, price_range))
+        return analysis
+    
+    def simulated_charts(self, current_price, volatility, price_range):
+        """无K线数据时的备用指标"""
+        import random
+        return {
             "1m_chart": {
                 "trend": "consolidation" if random.random() > 0.6 else "bullish",
                 "ema_ema7": round(current_price + random.uniform(-volatility, volatility), 2),
@@ -83,7 +154,12 @@ class MarketAnalyzer:
                     "dea": round(random.uniform(volatility/20, volatility/5), 3),
                     "hist": round(random.uniform(volatility/20, volatility/5), 3)
                 }
-            },
+            }
+        }
+    
+    def price_levels(self, current_price, price_range):
+        """关键价位与枢轴点"""
+        return {
             "key_levels": {
                 "resistance": [
                     round(current_price + price_range * 0.3, 2),
@@ -125,8 +201,8 @@ class MarketAnalyzer:
         md = f"""# {symbol_name}({symbol}) 短线技术分析报告
 
 **生成时间**: {data["datetime"]}  
-**数据来源**: 实时行情API  
-**当前价格**: ${current_price}
+**数据来源**: {data["source"]}  
+**当前价格**: ${current_price}（{data.get("price_source", "实时")}）
 
 ---
 
@@ -142,6 +218,7 @@ class MarketAnalyzer:
 
 ---
 
+{self.multi_timeframe_table(data)}
 ## 技术指标详解
 
 ### 1分钟K线分析
@@ -217,69 +294,57 @@ class MarketAnalyzer:
 """
         return md
     
+    def multi_timeframe_table(self, data):
+        """多周期指标表，只有真实K线合成的报告才有"""
+        fmt = lambda v: "-" if v is None else v
+        rows = []
+        for tf in self.TIMEFRAMES[1:]:
+            chart = data.get(f"{tf}_chart")
+            if not chart:
+                continue
+            rows.append(f"| {tf} | {chart['trend']} | {fmt(chart['ema_ema7'])} | {fmt(chart['ema_ema25'])} | "
+                        f"{fmt(chart['rsi'])} | {fmt(chart['macd']['hist'])} | {chart['bars']} |")
+        if not rows:
+            return ""
+        return "## 多周期指标\n\n| 周期 | 趋势 | EMA7 | EMA25 | RSI | MACD柱 | K线数 |\n|------|------|------|-------|-----|--------|-------|\n" + "\n".join(rows) + "\n\n---\n"
+    
     def save_report(self, symbol, analysis_data):
-        """保存分析报告"""
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        filename = f"{symbol.replace('/', '_')}_{timestamp}.md"
-        filepath = self.output_dir / filename
-        
-        md_content = self.generate_markdown(analysis_data, symbol)
-        
-        with open(filepath, 'w', encoding='utf-8') as f:
-            f.write(md_content)
-        
-        # 同时生成JSON数据文件
-        json_path = filepath.with_suffix('.json')
-        with open(json_path, 'w', encoding='utf-8') as f:
-            json.dump(analysis_data, f, indent=2, ensure_ascii=False)
-        
-        return filepath
+        """分析数据追加到报告存储，Markdown只保留最新一份，返回Markdown文件"""
+        self.store.append("market", analysis_data, analysis_data["timestamp"])
+        filepath = self.output_dir / f"{symbol.replace('/', '_')}_latest.md"
+        return write_latest(filepath, self.generate_markdown(analysis_data, symbol))
     
-    def push_to_github(self, repo_url=None, branch="main"):
-        """推送到GitHub仓库"""
-        try:
-            # 初始化git仓库（如果需要）
-            if not os.path.exists(self.output_dir / ".git"):
-                subprocess.run(["git", "init"], cwd=self.output_dir, capture_output=True)
-            
-            # 添加所有文件
-            subprocess.run(["git", "add", "."], cwd=self.output_dir, capture_output=True)
-            
-            # 提交
-            timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            commit_msg = f"更新贵金属分析报告 - {timestamp}"
-            subprocess.run(
-                ["git", "commit", "-m", commit_msg], 
-                cwd=self.output_dir, 
-                capture_output=True
-            )
-            
-            # 推送到远程（需要配置remote）
-            # subprocess.run(["git", "push", "origin", branch], cwd=self.output_dir, capture_output=True)
-            
-            return True, "已提交到本地仓库"
-        except Exception as e:
-            return False, str(e)
+    def push_to_github(self, paths):
+        """把报告交给后台发布线程提交到本地仓库"""
+        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        self.publisher.publish(paths, f"更新贵金属分析报告 - {timestamp}")
+        return True, "已加入提交队列"
     
     def run_analysis(self):
         """执行完整分析流程"""
+        metrics.begin()
         results = {}
         
         # 分析黄金
-        gold_price = self.get_price("XAU")
-        gold_analysis = self.generate_analysis("XAU/USD", gold_price)
+        gold = self.get_price("XAU")
+        gold_analysis = self.generate_analysis("XAU/USD", gold.price, self.get_base_klines("XAU/USD"))
+        gold_analysis["price_source"] = gold.label()
         gold_file = self.save_report("XAU/USD", gold_analysis)
-        results["gold"] = {"file": str(gold_file), "price": gold_price}
+        results["gold"] = {"file": str(gold_file), "price": gold.price, "source": gold.source}
         
         # 分析白银
-        silver_price = self.get_price("XAG")
-        silver_analysis = self.generate_analysis("XAG/USD", silver_price)
+        silver = self.get_price("XAG")
+        silver_analysis = self.generate_analysis("XAG/USD", silver.price, self.get_base_klines("XAG/USD"))
+        silver_analysis["price_source"] = silver.label()
         silver_file = self.save_report("XAG/USD", silver_analysis)
-        results["silver"] = {"file": str(silver_file), "price": silver_price}
+        results["silver"] = {"file": str(silver_file), "price": silver.price, "source": silver.source}
         
         # 推送到GitHub
-        success, msg = self.push_to_github()
+        reports = [gold_file, silver_file, self.store.segment_path()]
+        success, msg = self.push_to_github(reports)
         results["github"] = {"success": success, "message": msg}
+        results["hedge"] = dict(self.resolver.stats, rate=self.resolver.hedge_rate())
+        metrics.registry.export(self.output_dir / "logs", "market")
         
         return results
 
@@ -295,3 +360,5 @@ if __name__ == "__main__":
     print(f"报告文件: {results['gold']['file']}")
     print(f"报告文件: {results['silver']['file']}")
     print(f"GitHub推送: {results['github']['message']}")
+    hedge = results['hedge']
+    print(f"对冲请求: {hedge['hedges']}/{hedge['requests']}（备用源胜出 {hedge['hedge_wins']}，量级不一致 {hedge['scale_rejects']}）")
@@ -0,0 +1,213 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+行情数据获取层
+Yahoo Finance chart接口的请求、解析，以及多品种并发获取
+spark接口一次请求多个品种，用于品种较多时减少请求数
+GC=F: COMEX黄金期货  SI=F: COMEX白银期货
+PL=F: NYMEX铂金期货  PA=F: NYMEX钯金期货
+"""
+
+import queue
+import threading
+import time
+from urllib.parse import quote
+
+import metrics
+import rate_limiter
+from http_client import get_json
+
+YAHOO_CHART_URL = "https://query1.finance.yahoo.com/v8/finance/chart/{symbol}"
+# 多品种接口，一次请求返回多个品种的收盘价序列
+YAHOO_SPARK_URL = "https://query1.finance.yahoo.com/v7/finance/spark"
+
+# spark接口单次请求的品种数上限
+SPARK_CHUNK_SIZE = 20
+
+# 默认并发获取的期货合约
+DEFAULT_SYMBOLS = ["GC=F", "SI=F", "PL=F", "PA=F"]
+
+
+@metrics.timed("fetch")
+def fetch_chart(symbol, interval="5m", range_="1d", timeout=15, base_url=YAHOO_CHART_URL,
+                period1=None, period2=None, cancel=None):
+    """
+    请求chart接口，返回解析后的JSON（经共享连接池）
+    指定period1/period2(unix秒)时按时间段请求，用于增量获取
+    """
+    if period1 is not None:
+        url = base_url.format(symbol=symbol) + f"?interval={interval}&period1={int(period1)}&period2={int(period2)}"
+    else:
+        url = base_url.format(symbol=symbol) + f"?interval={interval}&range={range_}"
+    return get_json(url, timeout=timeout, cancel=cancel)
+
+
+@metrics.timed("parse")
+def parse_chart(data):
+    """
+    把chart接口返回转换为K线列表
+    Yahoo在停盘或未成交的时段会返回None，这些K线直接跳过
+    """
+    result = (data.get('chart', {}).get('result') or [{}])[0]
+    timestamps = result.get('timestamp') or []
+    quote = (result.get('indicators', {}).get('quote') or [{}])[0]
+    opens = quote.get('open') or []
+    highs = quote.get('high') or []
+    lows = quote.get('low') or []
+    closes = quote.get('close') or []
+    volumes = quote.get('volume') or []
+
+    klines = []
+    for i, ts in enumerate(timestamps):
+        values = [col[i] if i < len(col) else None for col in (opens, highs, lows, closes)]
+        if None in values:
+            continue
+        volume = volumes[i] if i < len(volumes) and volumes[i] is not None else 0
+        klines.append({
+            "time": ts,
+            "open": values[0],
+            "high": values[1],
+            "low": values[2],
+            "close": values[3],
+            "volume": volume
+        })
+    return klines
+
+
+def fetch_klines(symbol, interval="5m", range_="1d", timeout=15, base_url=YAHOO_CHART_URL, cancel=None):
+    """获取单个品种的K线，返回 {"symbol", "current_price", "klines"}"""
+    klines = parse_chart(fetch_chart(symbol, interval, range_, timeout, base_url, cancel=cancel))
+    if not klines:
+        raise ValueError(f"{symbol} 无有效K线数据")
+    return {"symbol": symbol, "current_price": round(klines[-1]['close'], 2), "klines": klines}
+
+
+def fetch_spark(symbols, interval="5m", range_="1d", timeout=15, base_url=YAHOO_SPARK_URL):
+    """一次请求多个品种的spark数据"""
+    url = base_url + f"?symbols={quote(','.join(symbols), safe=',')}&interval={interval}&range={range_}"
+    return get_json(url, timeout=timeout)
+
+
+def _close_klines(timestamps, closes):
+    """spark只有收盘价，开高低取收盘价、成交量记0"""
+    klines = []
+    for ts, close in zip(timestamps or [], closes or []):
+        if close is None:
+            continue
+        klines.append({"time": ts, "open": close, "high": close, "low": close, "close": close, "volume": 0})
+    return klines
+
+
+def parse_spark(data):
+    """
+    把spark接口返回拆分为各品种的K线，返回 {symbol: klines}
+    兼容两种格式:
+        v7: {"spark": {"result": [{"symbol", "response": [chart result]}]}}
+        v8: {symbol: {"timestamp": [...], "close": [...]}}
+    没有数据的品种不出现在结果中
+    """
+    out = {}
+    if "spark" in data:
+        for item in data["spark"].get("result") or []:
+            response = (item.get("response") or [{}])[0]
+            quote_ = (response.get("indicators", {}).get("quote") or [{}])[0]
+            klines = _close_klines(response.get("timestamp"), quote_.get("close"))
+            if klines:
+                out[item.get("symbol")] = klines
+    else:
+        for symbol, item in data.items():
+            if isinstance(item, dict):
+                klines = _close_klines(item.get("timestamp"), item.get("close"))
+                if klines:
+                    out[symbol] = klines
+    return out
+
+
+def fetch_batched(symbols, chunk_size=SPARK_CHUNK_SIZE, interval="5m", range_="1d", timeout=15, deadline=30,
+                  fetch_single=fetch_klines, spark_url=YAHOO_SPARK_URL):
+    """
+    分批获取多个品种的行情，每批chunk_size个品种一次请求，各批之间并发
+    批量请求失败或结果中缺失的品种，再用fetch_single逐个获取
+    返回格式与fetch_concurrent相同，data为 {"symbol", "current_price", "klines"}
+    批量获取的K线只有收盘价，需要完整OHLC时用fetch_klines
+    """
+    symbols = list(dict.fromkeys(symbols))
+    start = time.monotonic()
+    chunks = {",".join(symbols[i:i + chunk_size]): symbols[i:i + chunk_size]
+              for i in range(0, len(symbols), chunk_size)}
+
+    def fetch_chunk(key):
+        return parse_spark(fetch_spark(chunks[key], interval, range_, timeout, spark_url))
+
+    results = {}
+    for key, res in fetch_concurrent(list(chunks), fetch=fetch_chunk, deadline=deadline).items():
+        parsed = res['data'] or {}
+        for symbol in chunks[key]:
+            klines = parsed.get(symbol)
+            if klines:
+                results[symbol] = {
+                    "data": {"symbol": symbol, "current_price": round(klines[-1]['close'], 2), "klines": klines},
+                    "error": None, "elapsed": res['elapsed'],
+                }
+
+    missing = [s for s in symbols if s not in results]
+    if missing:
+        remaining = max(deadline - (time.monotonic() - start), 1)
+        results.update(fetch_concurrent(missing, fetch=fetch_single, deadline=remaining))
+    return {symbol: results[symbol] for symbol in symbols}
+
+
+def _timed_call(fetch, symbol, deadline_at):
+    """
+    执行单个品种的获取并计时，异常转换为错误信息；限速等待最多到本轮截止时间
+    deadline_at为time.monotonic()时间，只在交给限速器时换算成unix时间
+    """
+    start = time.monotonic()
+    try:
+        with rate_limiter.deadline(time.time() + deadline_at - start):
+            return fetch(symbol), None, time.monotonic() - start
+    except Exception as e:
+        return None, f"{type(e).__name__}: {e}", time.monotonic() - start
+
+
+def fetch_concurrent(symbols, fetch=fetch_klines, deadline=30, max_workers=None):
+    """
+    并发获取多个品种
+    所有品种共享一个整体截止时间，单个品种失败或超时不影响其他品种
+    返回 {symbol: {"data": ..., "error": None或错误信息, "elapsed": 秒}}
+    """
+    symbols = list(dict.fromkeys(symbols))
+    if not symbols:
+        return {}
+
+    # 截止时间用单调时钟，系统时间跳变（NTP校时）不会提前结束或拖长一轮
+    deadline_at = time.monotonic() + deadline
+    pending = queue.Queue()
+    for symbol in symbols:
+        pending.put(symbol)
+    finished = {}
+    lock = threading.Lock()
+
+    def worker():
+        # 截止时间后不再取新的品种
+        while time.monotonic() < deadline_at:
+            try:
+                symbol = pending.get_nowait()
+            except queue.Empty:
+                return
+            data, error, elapsed = _timed_call(fetch, symbol, deadline_at)
+            with lock:
+                finished[symbol] = {"data": data, "error": error, "elapsed": round(elapsed, 3)}
+
+    # 守护线程: 超时的线程不再等待，也不会阻止解释器退出（线程池的工作线程在退出时会被join）
+    threads = [threading.Thread(target=worker, name=f"fetch-{i}", daemon=True)
+               for i in range(min(max_workers or len(symbols), len(symbols)))]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join(max(deadline_at - time.monotonic(), 0))
+
+    with lock:
+        return {symbol: finished.get(symbol) or
+                {"data": None, "error": f"超过本轮截止时间({deadline}s)", "elapsed": deadline}
+                for symbol in symbols}
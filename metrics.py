@@ -0,0 +1,371 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+运行指标
+进程内记录各阶段耗时（按品种分桶的直方图）和计数（下载字节数、缓存命中、模拟数据兜底）
+每轮结束导出:
+  - Prometheus文本文件（node_exporter textfile collector读取），直方图和计数为跨进程累计值
+  - 每轮一行JSON，记录本轮各阶段、各品种的耗时和计数
+
+    with metrics.stage("indicators", "XAU/USD"):
+        ...
+    @metrics.timed("parse")
+    def parse_chart(data): ...
+    metrics.inc("cache_hits")
+
+未指定品种时使用当前线程最近一层stage/scope的品种，底层函数（HTTP、解析）不需要知道品种
+
+累计值保存在状态文件中，导出时加文件锁合并本进程新增的部分:
+crontab每轮启动新进程、常驻进程、多个分析器同时运行都不会丢失或重复计数
+
+检查p95漂移（最近N轮与之前M轮比较，超过阈值退出码1）:
+    python3 metrics.py drift [JSON文件] [--recent N] [--baseline M] [--threshold 0.5]
+"""
+
+import fcntl
+import functools
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+
+PREFIX = "market_analysis"
+LOG_DIR = Path("/root/clawd/market_analysis/logs")
+
+# 直方图桶上界（秒）
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+COUNTERS = {
+    "http_bytes": "下载字节数（压缩后）",
+    "cache_hits": "增量更新K线缓存的次数",
+    "cache_misses": "缓存为空、重新获取全部K线的次数",
+    "fetch_errors": "获取K线失败的次数",
+    "cache_fallbacks": "使用最近的真实K线代替实时数据的次数",
+    "fallbacks": "没有可用的真实K线、使用模拟数据的次数",
+    "price_requests": "对冲取价的次数",
+    "hedges": "Yahoo超过对冲延迟未返回、同时请求备用源的次数",
+    "hedge_wins": "对冲后备用源先返回有效价格的次数",
+    "scale_rejects": "价格与另一数据源量级不一致被拒绝的次数",
+    "rate_limit_waits": "请求前等待共享令牌桶的次数",
+    "throttled": "数据源返回429或5xx、所有进程退避的次数",
+}
+
+
+class Histogram:
+    """固定桶直方图，counts为各桶（不累加）的观测次数，最后一个为+Inf"""
+    __slots__ = ("counts", "sum", "count")
+
+    def __init__(self, counts=None, total=0.0, count=0):
+        self.counts = list(counts) if counts is not None else [0] * (len(BUCKETS) + 1)
+        self.sum = total
+        self.count = count
+
+    def observe(self, value):
+        i = int(np.searchsorted(BUCKETS, value))
+        self.counts[i] += 1
+        self.sum += value
+        self.count += 1
+
+    def merge(self, other):
+        for i, c in enumerate(other.counts):
+            self.counts[i] += c
+        self.sum += other.sum
+        self.count += other.count
+
+    def to_json(self):
+        return {"counts": self.counts, "sum": round(self.sum, 6), "count": self.count}
+
+    @classmethod
+    def from_json(cls, data):
+        if len(data.get("counts", ())) != len(BUCKETS) + 1:
+            # 桶配置变化后旧的累计值无法合并，重新开始
+            return cls()
+        return cls(data["counts"], data["sum"], data["count"])
+
+
+class Metrics:
+    """
+    线程安全的指标登记
+    pending_*为上次导出后新增的部分，导出时合并到累计状态，同时作为本轮的JSON记录
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._reset()
+
+    def _reset(self):
+        self.pending_histograms = {}
+        self.pending_counters = {}
+        self.cycle_started = time.time()
+
+    def _symbol(self, symbol):
+        if symbol is not None:
+            return symbol
+        scopes = getattr(self._local, "symbols", None)
+        return scopes[-1] if scopes else ""
+
+    @contextmanager
+    def scope(self, symbol):
+        """在当前线程内把之后的观测归到symbol下"""
+        scopes = self._local.__dict__.setdefault("symbols", [])
+        scopes.append(symbol)
+        try:
+            yield
+        finally:
+            scopes.pop()
+
+    @contextmanager
+    def stage(self, name, symbol=None):
+        """记录代码块的耗时，出现异常也记录"""
+        symbol = self._symbol(symbol)
+        start = time.perf_counter()
+        try:
+            with self.scope(symbol):
+                yield
+        finally:
+            self.observe(name, time.perf_counter() - start, symbol)
+
+    def timed(self, name):
+        """装饰器版本的stage"""
+        def decorator(fn):
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                with self.stage(name):
+                    return fn(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def observe(self, name, seconds, symbol=None):
+        key = (name, self._symbol(symbol))
+        with self._lock:
+            hist = self.pending_histograms.get(key)
+            if hist is None:
+                hist = self.pending_histograms[key] = Histogram()
+            hist.observe(seconds)
+
+    def inc(self, name, value=1, symbol=None):
+        key = (name, self._symbol(symbol))
+        with self._lock:
+            self.pending_counters[key] = self.pending_counters.get(key, 0) + value
+
+    def begin(self):
+        """本轮开始，常驻进程中两轮之间的等待不计入本轮耗时"""
+        with self._lock:
+            self.cycle_started = time.time()
+
+    def take(self):
+        """取出并清空上次导出后的新增部分"""
+        with self._lock:
+            histograms, counters, started = self.pending_histograms, self.pending_counters, self.cycle_started
+            self._reset()
+        return histograms, counters, started
+
+    def export(self, log_dir=LOG_DIR, job="realtime", started=None):
+        """
+        合并本进程新增的指标到累计状态，写Prometheus文本文件，追加本轮JSON行
+        started为本轮开始时间，默认为begin()的时间；返回本轮的JSON记录
+        """
+        log_dir = Path(log_dir)
+        log_dir.mkdir(parents=True, exist_ok=True)
+        histograms, counters, begun = self.take()
+        started = begun if started is None else started
+        now = time.time()
+
+        state_path = log_dir / "metrics.state.json"
+        with open(log_dir / "metrics.lock", "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                state = load_state(state_path)
+                for key, hist in histograms.items():
+                    state["histograms"].setdefault(key, Histogram()).merge(hist)
+                for key, value in counters.items():
+                    state["counters"][key] = state["counters"].get(key, 0) + value
+                state["cycles"][job] = {"seconds": round(now - started, 3), "timestamp": int(now)}
+                save_state(state_path, state)
+                atomic_write(log_dir / "metrics.prom", to_prometheus(state))
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+        record = cycle_record(job, histograms, counters, started, now)
+        with open(log_dir / "metrics.jsonl", 'a', encoding='utf-8') as f:
+            f.write(json.dumps(record, ensure_ascii=False, separators=(",", ":")) + "\n")
+        return record
+
+
+def _split(key):
+    name, _, symbol = key.partition("|")
+    return name, symbol
+
+
+def load_state(path):
+    """读取累计状态，键为 (名称, 品种)"""
+    state = {"histograms": {}, "counters": {}, "cycles": {}}
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return state
+    state["histograms"] = {_split(k): Histogram.from_json(v) for k, v in data.get("histograms", {}).items()}
+    state["counters"] = {_split(k): v for k, v in data.get("counters", {}).items()}
+    state["cycles"] = data.get("cycles", {})
+    return state
+
+
+def save_state(path, state):
+    data = {
+        "histograms": {f"{n}|{s}": h.to_json() for (n, s), h in sorted(state["histograms"].items())},
+        "counters": {f"{n}|{s}": v for (n, s), v in sorted(state["counters"].items())},
+        "cycles": state["cycles"],
+    }
+    atomic_write(path, json.dumps(data, ensure_ascii=False))
+
+
+def atomic_write(path, text):
+    """textfile collector可能随时读取，先写临时文件再替换"""
+    path = Path(path)
+    tmp = path.with_suffix(path.suffix + ".tmp")
+    with open(tmp, 'w', encoding='utf-8') as f:
+        f.write(text)
+    os.replace(tmp, path)
+
+
+def _labels(**labels):
+    parts = []
+    for k, v in labels.items():
+        if v == "":
+            continue
+        v = str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        parts.append(f'{k}="{v}"')
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _number(v):
+    return repr(float(v)) if isinstance(v, float) else str(v)
+
+
+def to_prometheus(state):
+    """Prometheus文本格式"""
+    name = f"{PREFIX}_stage_seconds"
+    lines = [f"# HELP {name} 各阶段耗时（秒）", f"# TYPE {name} histogram"]
+    for (stage, symbol), hist in sorted(state["histograms"].items()):
+        cumulative = 0
+        for le, c in zip(list(BUCKETS) + ["+Inf"], hist.counts):
+            cumulative += c
+            lines.append(f"{name}_bucket{_labels(stage=stage, symbol=symbol, le=le)} {cumulative}")
+        lines.append(f"{name}_sum{_labels(stage=stage, symbol=symbol)} {_number(hist.sum)}")
+        lines.append(f"{name}_count{_labels(stage=stage, symbol=symbol)} {hist.count}")
+
+    by_name = {}
+    for (counter, symbol), value in state["counters"].items():
+        by_name.setdefault(counter, []).append((symbol, value))
+    for counter in sorted(by_name):
+        name = f"{PREFIX}_{counter}_total"
+        lines.append(f"# HELP {name} {COUNTERS.get(counter, counter)}")
+        lines.append(f"# TYPE {name} counter")
+        for symbol, value in sorted(by_name[counter]):
+            lines.append(f"{name}{_labels(symbol=symbol)} {_number(value)}")
+
+    for suffix, field, text in (("last_cycle_seconds", "seconds", "最近一轮总耗时（秒）"),
+                                ("last_cycle_timestamp_seconds", "timestamp", "最近一轮完成时间")):
+        name = f"{PREFIX}_{suffix}"
+        lines.append(f"# HELP {name} {text}")
+        lines.append(f"# TYPE {name} gauge")
+        for job, cycle in sorted(state["cycles"].items()):
+            lines.append(f"{name}{_labels(job=job)} {_number(cycle[field])}")
+    return "\n".join(lines) + "\n"
+
+
+def cycle_record(job, histograms, counters, started, now):
+    """本轮的JSON记录: stages为 {阶段: {品种: 秒}}，不分品种的阶段品种为"all" """
+    stages = {}
+    for (stage, symbol), hist in sorted(histograms.items()):
+        stages.setdefault(stage, {})[symbol or "all"] = round(hist.sum, 6)
+    totals = {}
+    for (counter, symbol), value in sorted(counters.items()):
+        totals.setdefault(counter, {})[symbol or "all"] = value
+    return {
+        "timestamp": int(now),
+        "datetime": datetime.fromtimestamp(now).strftime("%Y-%m-%d %H:%M:%S"),
+        "job": job,
+        "cycle_seconds": round(now - started, 3),
+        "stages": stages,
+        "counters": totals,
+    }
+
+
+def read_cycles(path, job=None):
+    records = []
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                rec = json.loads(line)
+            except ValueError:
+                continue
+            if job is None or rec.get("job") == job:
+                records.append(rec)
+    return records
+
+
+def drift(records, recent=96, baseline=672, threshold=0.5):
+    """
+    比较最近recent轮与之前baseline轮各阶段（按品种）耗时的p95
+    返回超过阈值的项 [(阶段, 品种, 基线p95, 最近p95)]
+    """
+    def p95(window):
+        series = {}
+        for rec in window:
+            for stage, symbols in rec["stages"].items():
+                for symbol, seconds in symbols.items():
+                    series.setdefault((stage, symbol), []).append(seconds)
+            series.setdefault(("cycle", "all"), []).append(rec["cycle_seconds"])
+        return {k: float(np.percentile(v, 95)) for k, v in series.items()}
+
+    now = p95(records[-recent:])
+    base = p95(records[-recent - baseline:-recent] if len(records) > recent else [])
+    drifted = []
+    for key, value in sorted(now.items()):
+        if key in base and value > base[key] * (1 + threshold):
+            drifted.append((key[0], key[1], base[key], value))
+    return drifted
+
+
+# 进程内共享的指标登记，各模块都记录到这里
+registry = Metrics()
+stage = registry.stage
+scope = registry.scope
+timed = registry.timed
+observe = registry.observe
+inc = registry.inc
+begin = registry.begin
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    options = {}
+    for flag in ("--recent", "--baseline", "--threshold", "--job"):
+        if flag in args:
+            i = args.index(flag)
+            options[flag] = args[i + 1]
+            del args[i:i + 2]
+    if not args or args[0] != "drift":
+        print(__doc__)
+        sys.exit(1)
+    path = Path(args[1]) if len(args) > 1 else LOG_DIR / "metrics.jsonl"
+    records = read_cycles(path, options.get("--job"))
+    recent = int(options.get("--recent", 96))
+    threshold = float(options.get("--threshold", 0.5))
+    drifted = drift(records, recent, int(options.get("--baseline", 672)), threshold)
+    print(f"{path}: {len(records)} 轮，最近 {min(recent, len(records))} 轮与之前比较")
+    if drifted:
+        print(f"p95超过基线{threshold * 100:.0f}%:")
+        for name, symbol, base, now in drifted:
+            print(f"  {name:<12} {symbol:<10} {base * 1000:>10.1f}ms -> {now * 1000:>10.1f}ms (x{now / base:.2f})")
+        sys.exit(1)
+    print("p95无明显漂移")
@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+本地行情模拟服务器，回放录制的Yahoo chart响应，用于离线验证数据获取层
+    /v8/finance/chart/{symbol}    返回录制的该品种响应，未录制的返回404
+    /v7/finance/spark?symbols=... 由录制的chart响应拼出多品种spark响应，未录制的品种不出现
+    /v1/latest/{code}             open.er-api.com 格式的报价（rates中给出的品种），用作备用数据源
+
+录制与回放:
+    python3 mock_server.py record recorded.json GC=F SI=F PL=F PA=F
+    python3 mock_server.py serve recorded.json [端口]
+
+在代码中使用:
+    server = MockServer(recordings)          # {symbol: chart响应}
+    server.start()
+    fetch_chart("GC=F", base_url=server.chart_url)
+    fetch_batched(symbols, spark_url=server.spark_url, fetch_single=...)
+    server.stop()
+
+    MockServer({}, rates={"XAU": 2680.5}, delay=lambda: random.expovariate(10))   # 备用源，随机延迟
+    get_json(server.secondary_url.format(code="XAU"))
+"""
+
+import json
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlsplit
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def log_message(self, *args):
+        pass
+
+    def _send(self, status, payload):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        server = self.server.mock
+        url = urlsplit(self.path)
+        server.requests.append(self.path)
+        delay = server.delay() if callable(server.delay) else server.delay
+        if delay:
+            time.sleep(delay)
+        if server.status != 200:
+            return self._send(server.status, {"error": "mock status"})
+
+        if url.path.startswith("/v8/finance/chart/"):
+            symbol = unquote(url.path.rsplit("/", 1)[1])
+            if symbol in server.fail_symbols or symbol not in server.recordings:
+                return self._send(404, {"chart": {"result": None, "error": {"code": "Not Found"}}})
+            return self._send(200, server.recordings[symbol])
+
+        if url.path == "/v7/finance/spark":
+            symbols = parse_qs(url.query).get("symbols", [""])[0].split(",")
+            result = []
+            for symbol in symbols:
+                if symbol in server.recordings and symbol not in server.fail_symbols:
+                    chart = server.recordings[symbol]["chart"]["result"][0]
+                    result.append({"symbol": symbol, "response": [chart]})
+            return self._send(200, {"spark": {"result": result, "error": None}})
+
+        if url.path.startswith("/v1/latest/"):
+            code = url.path.rsplit("/", 1)[1]
+            if code not in server.rates:
+                return self._send(404, {"result": "error", "error-type": "unsupported-code"})
+            return self._send(200, {"result": "success", "base_code": code, "rates": {"USD": server.rates[code]}})
+
+        self._send(404, {"error": "unknown path"})
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # 客户端已取消请求（如对冲请求中落后的一方），写回响应失败不打印
+        if isinstance(sys.exc_info()[1], ConnectionError):
+            return
+        super().handle_error(request, client_address)
+
+
+class MockServer:
+    """
+    recordings: {symbol: chart接口的完整响应}
+    delay: 每个请求的额外延迟（秒），也可以是每次调用返回延迟的函数（模拟长尾）
+    status: 非200时所有请求都返回该状态码
+    fail_symbols: 这些品种在两个接口上都视为无数据
+    rates: {货币代码: 美元价格}，/v1/latest/ 接口的报价
+    """
+    def __init__(self, recordings, port=0, delay=0.0, status=200, fail_symbols=(), rates=None):
+        self.recordings = recordings
+        self.rates = rates or {}
+        self.delay = delay
+        self.status = status
+        self.fail_symbols = set(fail_symbols)
+        self.requests = []
+        self.httpd = _Server(("127.0.0.1", port), _Handler)
+        self.httpd.mock = self
+        self._thread = None
+
+    @property
+    def base(self):
+        return f"http://127.0.0.1:{self.httpd.server_address[1]}"
+
+    @property
+    def chart_url(self):
+        return self.base + "/v8/finance/chart/{symbol}"
+
+    @property
+    def spark_url(self):
+        return self.base + "/v7/finance/spark"
+
+    @property
+    def secondary_url(self):
+        return self.base + "/v1/latest/{code}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+def load_recordings(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def record(path, symbols, interval="5m", range_="1d"):
+    """从Yahoo录制各品种的chart响应"""
+    from market_data import fetch_chart
+    recordings = {}
+    for symbol in symbols:
+        try:
+            recordings[symbol] = fetch_chart(symbol, interval, range_)
+            print(f"已录制 {symbol}")
+        except Exception as e:
+            print(f"录制{symbol}失败: {e}")
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(recordings, f, separators=(",", ":"))
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 3 or sys.argv[1] not in ("record", "serve"):
+        print(__doc__)
+        sys.exit(1)
+    if sys.argv[1] == "record":
+        record(sys.argv[2], sys.argv[3:])
+    else:
+        port = int(sys.argv[3]) if len(sys.argv) > 3 else 8765
+        server = MockServer(load_recordings(sys.argv[2]), port=port)
+        print(f"模拟行情服务: {server.base}")
+        server.httpd.serve_forever()
@@ -0,0 +1,329 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+异步分级流水线
+常驻运行时把实时分析的一轮拆成独立的阶段，阶段之间用有界队列连接:
+    获取(每品种) -> 分析(每品种) -> 渲染(每轮) -> 存储(每轮) -> 发布
+  - 获取: 在单独的获取线程池中增量更新K线（共用keep-alive连接池和K线缓存），一轮共享一个截止时间，
+          超时的品种使用归档中的K线，超时的线程在socket超时后自行结束；
+          Yahoo持续卡住只会占满获取线程池，渲染、存储用另一个线程池，不受影响
+  - 分析: 指标计算在进程池中进行，不占用事件循环
+  - 各品种独立流动，先获取到的品种先分析；一轮的全部品种分析完成后渲染报告
+  - 队列有界: 下游变慢时上游在put处等待（背压），不会无限堆积
+  - 发布: 只保留一批待发布文件，上一批提交未完成时新一轮的文件合并进去
+          git卡住只会让待发布文件合并，不会阻塞分析和存储
+上一轮还在渲染、存储或发布时，下一轮已经可以开始获取
+
+运行:
+    python3 pipeline.py [--interval 900] [--no-align] [--once] [--queue N] [--workers N] [--deadline 秒]
+    kill -TERM <pid>   不再开始新的一轮，等进行中的各轮完成后退出
+"""
+
+import asyncio
+import functools
+import os
+import signal
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import datetime
+
+import metrics
+import rate_limiter
+from analysis_daemon import MIN_INTERVAL, log
+from kline_frame import KlineFrame
+from realtime_analyzer import RealtimeMarketAnalyzer
+from universe_runner import analyze_shard
+
+# 报告中的顺序: 白银、黄金
+SYMBOLS = ("XAGUSD", "XAUUSD")
+
+
+class Cycle:
+    """一轮分析，done在报告存储完成后给出结果"""
+    __slots__ = ("number", "started", "deadline", "analyses", "done")
+
+    def __init__(self, number, deadline):
+        self.number = number
+        self.started = time.time()
+        self.deadline = self.started + deadline
+        self.analyses = {}
+        self.done = asyncio.get_running_loop().create_future()
+
+    def fail(self, error):
+        if not self.done.done():
+            self.done.set_exception(error)
+
+
+class PublishSlot:
+    """最多一批待发布文件，发布进行中到达的文件合并进同一批"""
+
+    def __init__(self):
+        self.paths = {}
+        self.cycles = 0
+        self._ready = asyncio.Event()
+
+    def offer(self, paths):
+        for p in paths:
+            self.paths[str(p)] = None
+        self.cycles += 1
+        self._ready.set()
+
+    async def take(self):
+        await self._ready.wait()
+        self._ready.clear()
+        paths, cycles = list(self.paths), self.cycles
+        self.paths, self.cycles = {}, 0
+        return paths, cycles
+
+
+def publish_message(cycles):
+    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    return f"更新贵金属分析报告 - {timestamp}" + (f"（{cycles}轮）" if cycles > 1 else "")
+
+
+class AnalysisPipeline:
+    def __init__(self, analyzer=None, queue_size=4, workers=None, deadline=20):
+        self.analyzer = analyzer or RealtimeMarketAnalyzer()
+        self.labels = [self.analyzer.metric_label(s) for s in SYMBOLS]
+        self.queue_size = queue_size
+        self.workers = workers or os.cpu_count() or 1
+        self.deadline = deadline
+        self.stats = {"cycles": 0, "failed": 0, "fetch_timeouts": 0, "publishes": 0, "coalesced": 0,
+                      "abandoned": 0}
+        self._count = 0
+        self._tasks = []
+        self._inflight = set()
+        # 正在等待提交的一批，退出前drain等它完成
+        self._flushing = None
+
+    async def start(self):
+        self._fetch_q = asyncio.Queue(self.queue_size)
+        self._analyze_q = asyncio.Queue(self.queue_size)
+        self._render_q = asyncio.Queue(self.queue_size)
+        self._persist_q = asyncio.Queue(self.queue_size)
+        self._slot = PublishSlot()
+        # 获取单独一个线程池: 超时的获取线程还会占用线程直到socket超时，不能挤占渲染和存储
+        # 容量为两轮的品种数，上一轮卡住的线程未结束时下一轮仍能获取
+        self._fetch_io = ThreadPoolExecutor(max_workers=2 * len(SYMBOLS), thread_name_prefix="pipeline-fetch")
+        self._io = ThreadPoolExecutor(max_workers=2, thread_name_prefix="pipeline-io")
+        # 发布单独一个线程，git卡住时不占用获取和存储的线程
+        self._git = ThreadPoolExecutor(max_workers=1, thread_name_prefix="pipeline-publish")
+        self._cpu = ProcessPoolExecutor(max_workers=self.workers)
+        workers = [self._fetch] * len(SYMBOLS) + [self._analyze] * self.workers + [self._render, self._persist,
+                                                                                   self._publish]
+        self._tasks = [asyncio.ensure_future(w()) for w in workers]
+
+    async def close(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._fetch_io.shutdown(wait=False)
+        self._io.shutdown(wait=False)
+        self._git.shutdown(wait=False)
+        self._cpu.shutdown()
+
+    async def submit(self):
+        """开始新的一轮，获取队列已满时在这里等待"""
+        self._count += 1
+        cycle = Cycle(self._count, self.deadline)
+        cycle.done.add_done_callback(functools.partial(self._finished, cycle))
+        self._inflight.add(cycle)
+        for symbol in SYMBOLS:
+            await self._fetch_q.put((cycle, symbol))
+        return cycle
+
+    def _finished(self, cycle, future):
+        self._inflight.discard(cycle)
+        if future.cancelled():
+            return
+        error = future.exception()
+        if error is not None:
+            self.stats["failed"] += 1
+            log(f"第{cycle.number}轮失败: {error}")
+            return
+        self.stats["cycles"] += 1
+        result = future.result()
+        log(f"第{cycle.number}轮完成: 白银 ${result['silver_price']}, 黄金 ${result['gold_price']}, "
+            f"耗时 {result['seconds'] * 1000:.0f} ms")
+
+    async def _fetch(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            cycle, symbol = await self._fetch_q.get()
+            if cycle.done.done():
+                continue
+            label = self.analyzer.metric_label(symbol)
+            try:
+                try:
+                    # 数据来源随K线一起返回: 各轮重叠，超时的获取线程之后还会写入共享的analyzer.quotes
+                    fetch = loop.run_in_executor(self._fetch_io, rate_limiter.within, cycle.deadline,
+                                                 self.analyzer.get_kline_quote, symbol)
+                    klines, quote = await asyncio.wait_for(fetch, max(cycle.deadline - time.time(), 0))
+                except asyncio.TimeoutError:
+                    self.stats["fetch_timeouts"] += 1
+                    klines, quote = self.analyzer.cached_quote(symbol, error=f"超过本轮截止时间({self.deadline}s)")
+                frame = KlineFrame.from_klines(klines)
+            except Exception as e:
+                cycle.fail(e)
+                continue
+            await self._analyze_q.put((cycle, label, frame, quote))
+
+    async def _analyze(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            cycle, label, frame, quote = await self._analyze_q.get()
+            if cycle.done.done():
+                continue
+            start = time.perf_counter()
+            try:
+                [(_, analysis, error)] = await loop.run_in_executor(self._cpu, analyze_shard,
+                                                                    [(label, frame.columns())])
+            except Exception as e:
+                analysis, error = None, str(e)
+            metrics.observe("indicators", time.perf_counter() - start, label)
+            if error is not None:
+                cycle.fail(RuntimeError(f"{label} 分析失败: {error}"))
+                continue
+            analysis['data_source'] = quote.label() if quote is not None else "实时"
+            cycle.analyses[label] = analysis
+            if len(cycle.analyses) == len(self.labels):
+                await self._render_q.put(cycle)
+
+    async def _render(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            cycle = await self._render_q.get()
+            if cycle.done.done():
+                continue
+            analyses = [cycle.analyses[label] for label in self.labels]
+            try:
+                rendered = await loop.run_in_executor(self._io, self.analyzer.render_reports, *analyses)
+            except Exception as e:
+                cycle.fail(e)
+                continue
+            await self._persist_q.put((cycle, rendered))
+
+    async def _persist(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            cycle, rendered = await self._persist_q.get()
+            if cycle.done.done():
+                continue
+            try:
+                md_file, segment_file = await loop.run_in_executor(self._io, self.analyzer.persist_reports,
+                                                                   *rendered)
+            except Exception as e:
+                cycle.fail(e)
+                continue
+            # 放入待发布的一批后立即处理下一轮，不等待提交
+            self._slot.offer([md_file, md_file.with_suffix('.html'), segment_file])
+            record = await loop.run_in_executor(self._io, metrics.registry.export, self.analyzer.log_dir,
+                                                "pipeline", cycle.started)
+            silver, gold = (cycle.analyses[label] for label in self.labels)
+            if not cycle.done.done():
+                cycle.done.set_result({
+                    "silver_price": silver['current_price'],
+                    "gold_price": gold['current_price'],
+                    "md_file": str(md_file),
+                    "store_file": str(segment_file),
+                    "seconds": record["cycle_seconds"],
+                })
+
+    async def _publish(self):
+        loop = asyncio.get_running_loop()
+        publisher = self.analyzer.publisher
+        while True:
+            paths, cycles = await self._slot.take()
+            if not paths:
+                continue
+            start = time.perf_counter()
+            publisher.publish(paths, publish_message(cycles))
+            # 上一批提交完成后再取下一批，期间到达的文件在slot中合并
+            self._flushing = asyncio.ensure_future(self._flush(paths, cycles))
+            await self._flushing
+            metrics.observe("publish", time.perf_counter() - start)
+            self.stats["publishes"] += 1
+            self.stats["coalesced"] += cycles - 1
+
+    async def _flush(self, paths, cycles):
+        """
+        等待发布线程提交，最多等到git各步骤的超时之和
+        git卡住时不再等待这一批（文件仍在发布队列中），发布线程中的flush也按同一时限返回，不会阻止退出
+        """
+        loop = asyncio.get_running_loop()
+        publisher = self.analyzer.publisher
+        bound = publisher.commit_timeout()
+        try:
+            committed = await asyncio.wait_for(loop.run_in_executor(self._git, publisher.flush, bound), bound + 5)
+        except asyncio.TimeoutError:
+            committed = False
+        if not committed:
+            self.stats["abandoned"] += 1
+            log(f"git提交超过{bound:.0f}s未完成，不再等待这一批（{cycles}轮，{len(paths)}个文件）")
+        return committed
+
+    async def drain(self):
+        """等待进行中的各轮完成，未取走的待发布文件交给发布线程并等待提交（git卡住时有时限）"""
+        while self._inflight:
+            await asyncio.wait([c.done for c in list(self._inflight)])
+        if self._flushing is not None:
+            await asyncio.wait([self._flushing])
+        if self._slot.cycles:
+            paths, cycles = await self._slot.take()
+            self.analyzer.publisher.publish(paths, publish_message(cycles))
+            await self._flush(paths, cycles)
+
+    async def run_once(self):
+        """运行一轮，返回结果（与RealtimeMarketAnalyzer.run相同的键）"""
+        await self.start()
+        try:
+            cycle = await self.submit()
+            result = await cycle.done
+            await self.drain()
+            return result
+        finally:
+            await self.close()
+
+    async def serve(self, interval=900, align=True):
+        """按周期开始新的一轮，上一轮未完成不影响下一轮开始获取"""
+        loop = asyncio.get_running_loop()
+        stop = asyncio.Event()
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            loop.add_signal_handler(sig, stop.set)
+        await self.start()
+        log(f"流水线启动: 周期 {interval}s, 队列 {self.queue_size}, 分析进程 {self.workers}")
+        try:
+            while not stop.is_set():
+                await self.submit()
+                now = time.time()
+                next_at = now - now % interval + interval if align else now + interval
+                try:
+                    await asyncio.wait_for(stop.wait(), next_at - time.time())
+                except asyncio.TimeoutError:
+                    pass
+            log("收到退出信号，等待进行中的各轮完成")
+            await self.drain()
+        finally:
+            await self.close()
+        log(f"流水线退出: {self.stats}")
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    options = {}
+    for flag in ("--interval", "--queue", "--workers", "--deadline"):
+        if flag in args:
+            i = args.index(flag)
+            options[flag] = int(args[i + 1])
+            del args[i:i + 2]
+    pipeline = AnalysisPipeline(queue_size=options.get("--queue", 4), workers=options.get("--workers"),
+                                deadline=options.get("--deadline", 20))
+    if "--once" in args:
+        result = asyncio.run(pipeline.run_once())
+        print(f"白银(XAG/USD): ${result['silver_price']}")
+        print(f"黄金(XAU/USD): ${result['gold_price']}")
+        print(f"报告文件: {result['md_file']}")
+    else:
+        asyncio.run(pipeline.serve(max(options.get("--interval", 900), MIN_INTERVAL),
+                                   align="--no-align" not in args))
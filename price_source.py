@@ -0,0 +1,562 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+分级行情来源
+依次尝试，每个结果都带来源和数据年龄，报告中标明，不再把备用价格当作实时价格:
+    1. live       Yahoo Finance，限定耗时预算（默认5秒，而不是15秒）
+    2. cache      最近一次成功获取的价格（last known good），不超过max_age时使用
+    3. secondary  open.er-api.com 现货价格
+    4. cache      超过max_age的旧价格，标记为过期
+    5. default    调用方给出的参考价，标记为过期
+每个数据源有一个熔断器: 连续失败threshold次后断开cooldown秒，期间直接跳过，
+不再每轮都等满超时；冷却结束后只放行一个试探请求，成功则恢复
+只有连接错误、超时和429/5xx算作数据源故障；单个品种的4xx（如代码不存在）和空数据不计入
+
+对冲请求（resolve(..., hedge=True)）: 先请求Yahoo，超过对冲延迟（Yahoo近期耗时的p90）仍未返回时
+同时请求备用源，采用先返回的有效价格并取消另一个请求；Yahoo在对冲延迟内失败时立即改用备用源
+两个数据源的价格互相校验量级，与另一数据源近期价格相差超过SCALE_LIMIT倍的视为无效（单位、倒数报价等错误）
+
+熔断状态、最近价格和Yahoo耗时样本保存在 cache/sources.json，crontab每轮的新进程也能沿用
+
+    resolver = PriceResolver(output_dir / "cache")
+    quote = resolver.resolve("XAU/USD", default=4680.0)
+    quote.price, quote.source, quote.age, quote.stale
+
+查看状态:
+    python3 price_source.py [缓存目录]
+对冲请求基准（两个本地模拟服务，主数据源带长尾延迟）:
+    python3 price_source.py hedge-bench [--requests 200] [--slow-rate 0.05] [--slow 1.0] [--secondary 0.15] [--invert]
+"""
+
+import http.client
+import json
+import os
+import queue
+import random
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+import metrics
+from http_client import Cancelled, CancelToken, HttpError, get_json
+from rate_limiter import RateLimited
+from market_data import YAHOO_CHART_URL, fetch_klines
+from universe import default_universe
+
+CACHE_DIR = Path("/root/clawd/market_analysis/cache")
+
+# 实时数据源的耗时预算（秒）
+LIVE_BUDGET = 5
+# 最近价格在这个时间内视为新鲜，可以代替实时价格（秒）
+MAX_AGE = 30 * 60
+
+# 熔断: 连续失败次数、断开后的冷却时间（秒）
+BREAKER_THRESHOLD = 3
+BREAKER_COOLDOWN = 300
+
+# 备用数据源: 报告代码 -> open.er-api.com 的货币代码
+SECONDARY_URL = "https://open.er-api.com/v1/latest/{code}"
+SECONDARY_CODES = {"XAU/USD": "XAU", "XAG/USD": "XAG"}
+
+# 对冲请求: Yahoo耗时样本的分位数作为对冲延迟，样本不足时用HEDGE_DELAY（秒）
+HEDGE_QUANTILE = 0.9
+HEDGE_DELAY = 1.0
+HEDGE_MIN_DELAY = 0.05
+HEDGE_MIN_SAMPLES = 20
+LATENCY_SAMPLES = 200
+
+# 量级校验: 与数据源近期价格的比值超出 [1/SCALE_LIMIT, SCALE_LIMIT] 视为无效，近期价格的最长年龄（秒）
+SCALE_LIMIT = 1.5
+REFERENCE_AGE = 7 * 86400
+# 没有近期价格时与品种表中的参考价比较，只排除数量级错误（美分、克、倒数报价）
+ORDER_LIMIT = 10
+
+SOURCE_LABELS = {
+    "live": "实时",
+    "cache": "缓存",
+    "secondary": "备用源",
+    "simulated": "模拟数据",
+    "default": "默认参考价",
+    "batch": "批量价格+缓存K线",
+}
+
+
+class Quote:
+    """
+    一次取价的结果
+    time为数据本身的时间（K线时间或取价时间），age为距今秒数，stale表示不应当作实时数据
+    """
+    __slots__ = ("symbol", "price", "source", "time", "age", "stale", "error")
+
+    def __init__(self, symbol, price, source, time_=None, stale=False, error=None, now=None):
+        now = time.time() if now is None else now
+        self.symbol = symbol
+        self.price = price
+        self.source = source
+        self.time = int(now if time_ is None else time_)
+        self.age = max(int(now - self.time), 0)
+        self.stale = stale
+        self.error = error
+
+    def label(self):
+        """报告中显示的来源，如 "缓存（12分钟前，已过期）" """
+        text = SOURCE_LABELS.get(self.source, self.source)
+        if self.source in ("simulated", "default"):
+            return f"{text}（非实时）"
+        notes = []
+        if self.age >= 60:
+            notes.append(f"{format_age(self.age)}前")
+        if self.stale:
+            notes.append("已过期")
+        return f"{text}（{'，'.join(notes)}）" if notes else text
+
+    def to_dict(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    def __repr__(self):
+        return f"Quote({self.symbol}, {self.price}, {self.source}, age={self.age}s{', stale' if self.stale else ''})"
+
+
+def format_age(seconds):
+    if seconds < 3600:
+        return f"{seconds // 60}分钟"
+    if seconds < 86400:
+        return f"{seconds / 3600:.1f}小时"
+    return f"{seconds / 86400:.1f}天"
+
+
+class CircuitBreaker:
+    """
+    closed: 正常放行；连续失败threshold次后 open: cooldown秒内拒绝
+    冷却结束后 half_open: 只放行一个试探请求，成功回到closed，失败重新open
+    试探请求cooldown秒内没有结果（如线程卡住）时再放行一个
+    """
+    __slots__ = ("name", "threshold", "cooldown", "failures", "opened_at", "trial_at")
+
+    def __init__(self, name, threshold=BREAKER_THRESHOLD, cooldown=BREAKER_COOLDOWN, failures=0, opened_at=None,
+                 trial_at=None):
+        self.name = name
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = failures
+        self.opened_at = opened_at
+        self.trial_at = trial_at
+
+    def state(self, now=None):
+        if self.opened_at is None:
+            return "closed"
+        now = time.time() if now is None else now
+        return "open" if now - self.opened_at < self.cooldown else "half_open"
+
+    def allow(self, now=None):
+        """是否放行本次请求，半开时放行的请求即为试探请求"""
+        now = time.time() if now is None else now
+        state = self.state(now)
+        if state != "half_open":
+            return state == "closed"
+        if self.trial_at is not None and now - self.trial_at < self.cooldown:
+            return False
+        self.trial_at = now
+        return True
+
+    def success(self):
+        self.failures = 0
+        self.opened_at = None
+        self.trial_at = None
+
+    def failure(self, now=None):
+        now = time.time() if now is None else now
+        self.failures += 1
+        self.trial_at = None
+        # 半开试探失败或连续失败达到阈值，重新计时
+        if self.opened_at is not None or self.failures >= self.threshold:
+            self.opened_at = now
+
+    def to_dict(self):
+        return {"failures": self.failures, "opened_at": self.opened_at, "trial_at": self.trial_at}
+
+
+class PriceResolver:
+    def __init__(self, cache_dir=CACHE_DIR, budget=LIVE_BUDGET, max_age=MAX_AGE,
+                 threshold=BREAKER_THRESHOLD, cooldown=BREAKER_COOLDOWN,
+                 chart_url=YAHOO_CHART_URL, secondary_url=SECONDARY_URL):
+        self.path = Path(cache_dir) / "sources.json"
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.budget = budget
+        self.max_age = max_age
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.chart_url = chart_url
+        self.secondary_url = secondary_url
+        self.last_good = {}
+        # 各数据源各自最近的价格和取得时间，用于互相校验量级: {报告代码: {"live"|"secondary": {"price", "time"}}}
+        self.by_source = {}
+        self.breakers = {}
+        # Yahoo请求耗时（秒），被取消的请求按取消时已用的时间计入
+        self.latency = []
+        # 对冲请求统计: 请求数、发出对冲数、对冲后备用源胜出数、Yahoo快速失败后改用备用源数、量级校验拒绝数
+        self.stats = {"requests": 0, "hedges": 0, "hedge_wins": 0, "failovers": 0, "scale_rejects": 0}
+        # 多个获取线程共用同一个实例
+        self._lock = threading.RLock()
+        self.load()
+
+    def load(self):
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+        self.last_good = data.get("last_good", {})
+        self.by_source = data.get("by_source", {})
+        self.latency = data.get("latency", [])
+        for name, b in data.get("breakers", {}).items():
+            self.breakers[name] = CircuitBreaker(name, self.threshold, self.cooldown, b["failures"], b["opened_at"],
+                                                 b.get("trial_at"))
+
+    def save(self):
+        """原子写入，多个进程同时写时以最后一次为准"""
+        with self._lock:
+            data = {"last_good": dict(self.last_good),
+                    "by_source": {symbol: dict(seen) for symbol, seen in self.by_source.items()},
+                    "breakers": {name: b.to_dict() for name, b in self.breakers.items()},
+                    "latency": list(self.latency)}
+            tmp = self.path.with_suffix(f".{os.getpid()}.tmp")
+            with open(tmp, 'w', encoding='utf-8') as f:
+                json.dump(data, f, ensure_ascii=False, indent=1)
+            os.replace(tmp, self.path)
+
+    def breaker(self, name):
+        with self._lock:
+            if name not in self.breakers:
+                self.breakers[name] = CircuitBreaker(name, self.threshold, self.cooldown)
+            return self.breakers[name]
+
+    def allow(self, name):
+        """熔断器是否放行，半开时只有一个调用方得到试探机会（登记到状态文件，其他进程也能看到）"""
+        breaker = self.breaker(name)
+        with self._lock:
+            half_open = breaker.state() == "half_open"
+            allowed = breaker.allow()
+        if allowed and half_open:
+            self.save()
+        return allowed
+
+    def call(self, name, fn, *args, **kwargs):
+        """经熔断器调用数据源，断开时直接抛出，不发请求"""
+        if not self.allow(name):
+            breaker = self.breaker(name)
+            if breaker.state() == "half_open":
+                raise RuntimeError(f"{name} 已熔断，正在试探恢复")
+            raise RuntimeError(f"{name} 已熔断，{int(breaker.opened_at + breaker.cooldown - time.time())}秒后重试")
+        try:
+            result = fn(*args, **kwargs)
+        except (Cancelled, RateLimited):
+            # 被对冲请求的另一方取消、本地限速未发出，既不算失败也不算成功，让出半开的试探机会
+            self.release(name)
+            raise
+        except Exception as e:
+            # 4xx、空数据说明数据源有响应，只是该品种的问题
+            self.record(name, not endpoint_failure(e))
+            raise
+        self.record(name, True)
+        return result
+
+    def release(self, name):
+        breaker = self.breaker(name)
+        with self._lock:
+            if breaker.trial_at is None:
+                return
+            breaker.trial_at = None
+        self.save()
+
+    def record(self, name, ok):
+        """登记一次调用的结果，调用方自行请求（如批量接口）时直接调用"""
+        breaker = self.breaker(name)
+        with self._lock:
+            if ok:
+                if not breaker.failures and breaker.opened_at is None:
+                    return
+                breaker.success()
+            else:
+                breaker.failure()
+        self.save()
+
+    def remember(self, symbol, price, time_=None, source="live"):
+        """登记一次成功取得的价格，作为之后的last known good"""
+        symbol = canonical(symbol)
+        now = int(time.time())
+        with self._lock:
+            self.last_good[symbol] = {"price": price, "time": now if time_ is None else int(time_), "source": source}
+            self.by_source.setdefault(symbol, {})[source] = {"price": price, "time": now}
+        self.save()
+        return Quote(symbol, price, source, time_)
+
+    def cached(self, symbol, max_age=None):
+        """最近价格，超过max_age时返回None；max_age为None表示不限"""
+        entry = self.last_good.get(canonical(symbol))
+        if entry is None:
+            return None
+        quote = Quote(canonical(symbol), entry["price"], "cache", entry["time"])
+        if max_age is not None and quote.age > max_age:
+            return None
+        quote.stale = quote.age > self.max_age
+        return quote
+
+    def check_scale(self, symbol, price, source):
+        """
+        与另一数据源近期的价格比较量级，另一数据源没有近期价格时与本数据源之前的价格比较，
+        都没有时与品种表中的参考价比较（只排除数量级错误）
+        超出范围时抛出ValueError（如美分报价、倒数报价），该价格不登记
+        """
+        if not price or price <= 0:
+            raise ValueError(f"{SOURCE_LABELS[source]}价格无效: {price}")
+        symbol = canonical(symbol)
+        seen = self.by_source.get(symbol, {})
+        now = time.time()
+        for name in sorted(seen, key=lambda n: n == source):
+            if now - seen[name]["time"] <= REFERENCE_AGE:
+                reference, limit, label = seen[name]["price"], SCALE_LIMIT, SOURCE_LABELS[name]
+                break
+        else:
+            inst = default_universe.get(symbol)
+            if inst is None:
+                return
+            reference, limit, label = inst.price, ORDER_LIMIT, "参考价"
+        if not 1 / limit <= price / reference <= limit:
+            with self._lock:
+                self.stats["scale_rejects"] += 1
+            metrics.inc("scale_rejects", symbol=symbol)
+            raise ValueError(f"{SOURCE_LABELS[source]}价格 {price} 与{label} {reference} 量级不一致")
+
+    def observe_latency(self, seconds):
+        with self._lock:
+            self.latency.append(round(seconds, 3))
+            del self.latency[:-LATENCY_SAMPLES]
+
+    def hedge_delay(self):
+        """Yahoo耗时的HEDGE_QUANTILE分位数，不超过耗时预算"""
+        with self._lock:
+            samples = sorted(self.latency)
+        if len(samples) < HEDGE_MIN_SAMPLES:
+            return min(HEDGE_DELAY, self.budget)
+        value = samples[min(int(len(samples) * HEDGE_QUANTILE), len(samples) - 1)]
+        return min(max(value, HEDGE_MIN_DELAY), self.budget)
+
+    def live(self, symbol, cancel=None):
+        inst = default_universe.get(symbol)
+        source = inst.source if inst is not None else symbol
+        start = time.monotonic()
+        data = self.call("yahoo", fetch_klines, source, timeout=self.budget, base_url=self.chart_url,
+                         cancel=cancel)
+        self.observe_latency(time.monotonic() - start)
+        self.check_scale(symbol, data['current_price'], "live")
+        return self.remember(symbol, data['current_price'], data['klines'][-1]['time'])
+
+    def secondary(self, symbol, cancel=None):
+        code = SECONDARY_CODES.get(canonical(symbol))
+        if code is None:
+            raise ValueError(f"{symbol} 没有备用数据源")
+        data = self.call("er-api", get_json, self.secondary_url.format(code=code), timeout=self.budget,
+                         cancel=cancel)
+        price = data.get('rates', {}).get('USD')
+        if not price:
+            raise ValueError(f"备用数据源没有{code}价格")
+        self.check_scale(symbol, float(price), "secondary")
+        return self.remember(symbol, round(float(price), 2), source="secondary")
+
+    def hedged(self, symbol, default=None):
+        """
+        对冲取价: 先请求Yahoo，超过对冲延迟仍未返回时同时请求备用源，采用先返回的有效价格，取消另一个请求
+        两个都失败或都超过耗时预算时，按 缓存 -> 过期缓存 -> 默认价
+        """
+        symbol = canonical(symbol)
+        delay = self.hedge_delay()
+        fetchers = {"live": self.live, "secondary": self.secondary}
+        tokens = {name: CancelToken() for name in fetchers}
+        results = queue.Queue()
+        started = {}
+
+        def attempt(name):
+            try:
+                results.put((name, fetchers[name](symbol, cancel=tokens[name]), None))
+            except Exception as e:
+                results.put((name, None, e))
+
+        def launch(name):
+            started[name] = time.monotonic()
+            pending.add(name)
+            threading.Thread(target=attempt, args=(name,), name=f"hedge-{name}", daemon=True).start()
+
+        pending = set()
+        launch("live")
+        hedged = False
+        quote, errors = None, []
+        while pending:
+            if "secondary" in started:
+                remaining = started["secondary"] + self.budget - time.monotonic()
+            else:
+                remaining = started["live"] + delay - time.monotonic()
+            try:
+                name, result, error = results.get(timeout=max(remaining, 0))
+            except queue.Empty:
+                if "secondary" in started:
+                    break
+                hedged = True
+                launch("secondary")
+                continue
+            pending.discard(name)
+            if error is None:
+                quote = result
+                break
+            errors.append(f"{SOURCE_LABELS[name]}: {error}")
+            # Yahoo在对冲延迟内失败，直接改用备用源
+            if "secondary" not in started:
+                launch("secondary")
+
+        finished = time.monotonic()
+        for name in pending:
+            tokens[name].cancel()
+            errors.append(f"{SOURCE_LABELS[name]}: 超过耗时预算")
+        if "live" in pending:
+            # 未返回的Yahoo请求按已用时间计入耗时样本（实际耗时的下限），否则慢请求总被取消，p90会偏低
+            self.observe_latency(finished - started["live"])
+
+        with self._lock:
+            self.stats["requests"] += 1
+            self.stats["hedges"] += hedged
+            self.stats["hedge_wins"] += hedged and quote is not None and quote.source == "secondary"
+            self.stats["failovers"] += "secondary" in started and not hedged
+        metrics.inc("price_requests", symbol=symbol)
+        if hedged:
+            metrics.inc("hedges", symbol=symbol)
+            if quote is not None and quote.source == "secondary":
+                metrics.inc("hedge_wins", symbol=symbol)
+        metrics.observe("price", finished - started["live"], symbol)
+        if quote is not None:
+            return quote
+        return self.fallback(symbol, default, "; ".join(errors), secondary=False)
+
+    def hedge_rate(self):
+        return self.stats["hedges"] / self.stats["requests"] if self.stats["requests"] else 0.0
+
+    def fallback(self, symbol, default=None, error=None, secondary=True):
+        """实时数据源失败后的各级备用，secondary=False时跳过备用源（已经请求过）"""
+        quote = self.cached(symbol, self.max_age)
+        if quote is None and secondary:
+            try:
+                quote = self.secondary(symbol)
+            except Exception as e:
+                error = error or str(e)
+        if quote is None:
+            quote = self.cached(symbol)
+        if quote is None:
+            quote = Quote(canonical(symbol), default, "default", stale=True)
+        quote.error = error
+        return quote
+
+    def resolve(self, symbol, default=None, hedge=False):
+        """按 实时 -> 缓存 -> 备用源 -> 过期缓存 -> 默认价 的顺序取价，hedge=True时实时和备用源对冲请求"""
+        if hedge:
+            return self.hedged(symbol, default)
+        try:
+            return self.live(symbol)
+        except Exception as e:
+            return self.fallback(symbol, default, str(e))
+
+
+def endpoint_failure(error):
+    """是否算作数据源整体故障: 连接错误、超时、429/5xx"""
+    if isinstance(error, HttpError):
+        return error.status == 429 or error.status >= 500
+    return isinstance(error, (OSError, http.client.HTTPException))
+
+
+def canonical(symbol):
+    """统一为报告代码，GC=F和XAU/USD共用同一条缓存"""
+    inst = default_universe.get(symbol)
+    return inst.symbol if inst is not None else symbol
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(int(len(values) * q), len(values) - 1)]
+
+
+def hedge_bench(n=200, slow_rate=0.05, slow=1.0, fast=0.03, secondary_delay=0.15, invert=False, seed=1):
+    """
+    两个本地模拟服务上对比 只用Yahoo 和 对冲请求 的取价耗时
+    主数据源多数请求约fast秒，slow_rate比例的请求慢到slow秒；备用源固定secondary_delay秒
+    两种方式使用同一串主数据源延迟，节省的时间为逐次耗时之差
+    invert=True时备用源返回倒数报价，检验量级校验
+    """
+    from mock_server import MockServer
+    from synthetic import chart_response, generate
+
+    rng = random.Random(seed)
+    delays = [slow if rng.random() < slow_rate else fast * (0.5 + rng.random()) for _ in range(n)]
+    frame = generate("XAU/USD", n=50, seed=seed)
+    price = round(float(frame.close[-1]), 2)
+    sequence = iter(())
+    primary = MockServer({"GC=F": chart_response(frame, "GC=F")}, delay=lambda: next(sequence)).start()
+    secondary = MockServer({}, delay=secondary_delay, rates={"XAU": 1 / price if invert else price}).start()
+
+    with tempfile.TemporaryDirectory() as cache_dir:
+        resolver = PriceResolver(cache_dir, chart_url=primary.chart_url, secondary_url=secondary.secondary_url)
+        timings = {}
+        # 先只用Yahoo，同时积累对冲延迟需要的耗时样本
+        for hedge in (False, True):
+            sequence = iter(delays)
+            timings[hedge] = []
+            for _ in range(n):
+                start = time.perf_counter()
+                resolver.resolve("XAU/USD", hedge=hedge)
+                timings[hedge].append(time.perf_counter() - start)
+            if not hedge:
+                delay = resolver.hedge_delay()
+    primary.stop()
+    secondary.stop()
+
+    stats = resolver.stats
+    saved = [a - b for a, b in zip(timings[False], timings[True])]
+    print(f"对冲请求基准: {n}次, 主数据源 {slow_rate * 100:.0f}%请求慢到{slow}s, 备用源 {secondary_delay}s"
+          f"{', 备用源倒数报价' if invert else ''}")
+    print(f"对冲延迟(p{HEDGE_QUANTILE * 100:.0f}): {delay * 1000:.0f} ms")
+    print(f"{'p50':>10}{'p90':>10}{'p99':>10}{'max':>10}{'total':>10}")
+    for hedge, label in ((False, "只用Yahoo"), (True, "对冲请求")):
+        t = timings[hedge]
+        print("".join(f"{percentile(t, q) * 1000:>8.0f}ms" for q in (0.5, 0.9, 0.99))
+              + f"{max(t) * 1000:>8.0f}ms{sum(t):>9.2f}s  {label}")
+    print(f"对冲率 {resolver.hedge_rate() * 100:.1f}%（{stats['hedges']}/{stats['requests']}），"
+          f"备用源胜出 {stats['hedge_wins']} 次，备用源请求 {len(secondary.requests)} 次")
+    print(f"节省耗时: 合计 {sum(saved):.2f}s，平均每次 {sum(saved) / n * 1000:.1f} ms，"
+          f"p99降低 {(percentile(timings[False], 0.99) - percentile(timings[True], 0.99)) * 1000:.0f} ms")
+    print(f"量级校验拒绝 {stats['scale_rejects']} 次")
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    if args and args[0] == "hedge-bench":
+        options = {}
+        for flag in ("--requests", "--slow-rate", "--slow", "--secondary"):
+            if flag in args:
+                i = args.index(flag)
+                options[flag] = float(args[i + 1])
+                del args[i:i + 2]
+        hedge_bench(int(options.get("--requests", 200)), options.get("--slow-rate", 0.05),
+                    options.get("--slow", 1.0), secondary_delay=options.get("--secondary", 0.15),
+                    invert="--invert" in args)
+        sys.exit(0)
+    resolver = PriceResolver(sys.argv[1] if len(sys.argv) > 1 else CACHE_DIR)
+    print(f"状态文件: {resolver.path}")
+    print("熔断器:")
+    for name, b in sorted(resolver.breakers.items()):
+        print(f"  {name:<10} {b.state():<10} 连续失败 {b.failures}")
+    if len(resolver.latency) >= HEDGE_MIN_SAMPLES:
+        print(f"Yahoo耗时: p50 {percentile(resolver.latency, 0.5) * 1000:.0f} ms, "
+              f"对冲延迟 {resolver.hedge_delay() * 1000:.0f} ms（{len(resolver.latency)}个样本）")
+    print("最近价格:")
+    for symbol in sorted(resolver.last_good):
+        q = resolver.cached(symbol)
+        print(f"  {symbol:<10} {q.price:>12}  {q.label()}")
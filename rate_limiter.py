@@ -0,0 +1,269 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+跨进程共享的令牌桶限速
+各分析脚本、crontab任务对同一数据源的请求共用一个令牌桶，状态保存在一个小文件中，用flock互斥:
+  - rate: 每秒补充的令牌数（长期平均请求速率），burst: 桶容量（允许连续发出的请求数）
+  - 令牌不足时预约: 先记账（令牌数为负），在锁外等到预约的时间再发送，多个进程按到达顺序排开
+  - 数据源返回429或5xx时，所有进程一起暂停（Retry-After或带抖动的指数退避），之后从空桶开始按rate恢复
+    连续失败次数也是共享的，退避时间随之加倍；成功一次后清零
+只在429和5xx时退避重试，其他错误（404、超时、解析失败）直接返回给调用方
+
+http_client对LIMITS中的主机自动限速，调用方不需要自己sleep；取令牌默认最多等待连接超时，
+一轮共享截止时间的并发获取（fetch_concurrent、流水线）在本线程内设置deadline，最多等到截止时间:
+    retry_call(get_json, url, timeout=20, retries=3)   # 429/5xx时重试
+    with deadline(time.time() + 60):
+        fetch_klines("GC=F")
+
+查看状态:
+    python3 rate_limiter.py [状态目录]
+多进程验证（临时目录中的令牌桶，统计实际速率）:
+    python3 rate_limiter.py demo [--processes 4] [--requests 20] [--rate 5] [--burst 2]
+"""
+
+import fcntl
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+import metrics
+
+STATE_DIR = Path("/root/clawd/market_analysis/cache/ratelimit")
+
+# 各主机的 (每秒请求数, 桶容量)
+# Yahoo未公开限额，约每小时2000次以内不会返回429；容量覆盖一轮并发获取的品种数
+LIMITS = {
+    "query1.finance.yahoo.com": (1.0, 5),
+    "open.er-api.com": (0.2, 2),
+}
+
+# 退避: 第n次连续失败等待 [0, min(BACKOFF_CAP, BACKOFF_BASE * 2^n)) 秒（full jitter）
+BACKOFF_BASE = 1.0
+BACKOFF_CAP = 60.0
+# Retry-After超过这个值时按这个值暂停（秒）
+MAX_PAUSE = 300
+
+
+class RateLimited(Exception):
+    """在给定的时间内取不到令牌"""
+
+
+class TokenBucket:
+    def __init__(self, path, rate, burst):
+        self.path = Path(path)
+        self.rate = rate
+        self.burst = burst
+
+    def _update(self, fn):
+        """在文件锁内读出状态、补充令牌、调用fn(state, now)修改后写回，返回fn的返回值"""
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            try:
+                state = json.loads(os.read(fd, 4096) or b"{}")
+            except ValueError:
+                state = {}
+            now = time.time()
+            tokens = state.get("tokens", self.burst)
+            # 暂停期间不补充令牌，暂停结束后才开始按rate恢复
+            since = max(state.get("updated", now), state.get("paused_until", 0))
+            elapsed = max(now - since, 0)
+            state["tokens"] = min(self.burst, tokens + elapsed * self.rate)
+            state["updated"] = now
+            result = fn(state, now)
+            os.lseek(fd, 0, os.SEEK_SET)
+            os.ftruncate(fd, 0)
+            os.write(fd, json.dumps(state).encode())
+            return result
+        finally:
+            # 关闭文件同时释放锁
+            os.close(fd)
+
+    def acquire(self, timeout=None):
+        """
+        取一个令牌，必要时等待，返回等待的秒数
+        需要等待超过timeout秒时不预约，抛出RateLimited
+        """
+        def reserve(state, now):
+            # 欠下的令牌从暂停结束时开始补充
+            wait = max(state.get("paused_until", 0) - now, 0) + max(1 - state["tokens"], 0) / self.rate
+            if timeout is not None and wait > timeout:
+                return None
+            state["tokens"] -= 1
+            return wait
+
+        wait = self._update(reserve)
+        if wait is None:
+            raise RateLimited(f"{self.path.stem} 限速中，需要等待超过{timeout}秒")
+        if wait > 0:
+            metrics.inc("rate_limit_waits")
+            time.sleep(wait)
+        return wait
+
+    def report(self, status, retry_after=None):
+        """
+        登记一次响应的状态码，429或5xx时让所有进程暂停，返回暂停的秒数（其他状态返回0）
+        retry_after为响应的Retry-After头（秒数）
+        """
+        throttled = status == 429 or status >= 500
+
+        def update(state, now):
+            if not throttled:
+                state["failures"] = 0
+                return 0
+            failures = state.get("failures", 0)
+            state["failures"] = failures + 1
+            pause = parse_retry_after(retry_after)
+            if pause is None:
+                pause = backoff(failures)
+            pause = min(pause, MAX_PAUSE)
+            state["paused_until"] = max(state.get("paused_until", 0), now + pause)
+            # 暂停结束后从空桶开始，不一次放出整桶请求
+            state["tokens"] = min(state["tokens"], 0)
+            return pause
+
+        if not throttled and not self._failing():
+            return 0
+        if throttled:
+            metrics.inc("throttled")
+        return self._update(update)
+
+    def _failing(self):
+        """不加锁读一次状态，成功响应只有在有连续失败记录时才需要写回"""
+        try:
+            with open(self.path, 'rb') as f:
+                return json.loads(f.read() or b"{}").get("failures", 0) > 0
+        except (OSError, ValueError):
+            return False
+
+    def state(self):
+        return self._update(lambda state, now: dict(state, paused=max(state.get("paused_until", 0) - now, 0)))
+
+
+def backoff(attempt, base=BACKOFF_BASE, cap=BACKOFF_CAP):
+    """带抖动的指数退避（full jitter），attempt从0开始"""
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+def parse_retry_after(value):
+    """Retry-After头的秒数形式，HTTP日期形式或无法解析时返回None"""
+    try:
+        return max(float(value), 0)
+    except (TypeError, ValueError):
+        return None
+
+
+def retryable(error):
+    status = getattr(error, "status", None)
+    return status is not None and (status == 429 or status >= 500)
+
+
+def retry_call(fn, *args, retries=3, **kwargs):
+    """
+    调用fn，只在429、5xx时重试，最多retries次
+    限速的主机已由令牌桶暂停（error.paused），下次请求在取令牌时等待；其他主机在这里退避
+    """
+    for attempt in range(retries):
+        try:
+            return fn(*args, **kwargs)
+        except Exception as e:
+            if not retryable(e) or attempt == retries - 1:
+                raise
+            if not getattr(e, "paused", False):
+                time.sleep(backoff(attempt))
+
+
+_local = threading.local()
+
+
+@contextmanager
+def deadline(at):
+    """本线程内的请求取令牌时最多等到at（unix秒）"""
+    previous = getattr(_local, "deadline", None)
+    _local.deadline = at
+    try:
+        yield
+    finally:
+        _local.deadline = previous
+
+
+def within(at, fn, *args, **kwargs):
+    """在deadline(at)内调用fn，用于提交到线程池"""
+    with deadline(at):
+        return fn(*args, **kwargs)
+
+
+def wait_limit(default):
+    """取令牌最多等待的秒数: 本线程设置了截止时间时到截止时间为止，否则为default"""
+    at = getattr(_local, "deadline", None)
+    return default if at is None else max(at - time.time(), 0)
+
+
+_buckets = {}
+
+
+def limiter_for(host, state_dir=None):
+    """LIMITS中主机的令牌桶，同一进程内共用一个实例，没有限额的主机返回None"""
+    if host not in LIMITS:
+        return None
+    if host not in _buckets:
+        rate, burst = LIMITS[host]
+        _buckets[host] = TokenBucket(Path(state_dir or STATE_DIR) / f"{host}.json", rate, burst)
+    return _buckets[host]
+
+
+def _demo_worker(path, rate, burst, n, out):
+    bucket = TokenBucket(path, rate, burst)
+    times = []
+    for _ in range(n):
+        bucket.acquire()
+        times.append(time.time())
+    out.put(times)
+
+
+def demo(processes=4, requests=20, rate=5.0, burst=2):
+    """多个进程共用一个令牌桶，实际总速率应接近rate"""
+    import multiprocessing
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "demo.json"
+        out = multiprocessing.Queue()
+        workers = [multiprocessing.Process(target=_demo_worker, args=(path, rate, burst, requests, out))
+                   for _ in range(processes)]
+        start = time.time()
+        for w in workers:
+            w.start()
+        times = sorted(t for _ in workers for t in out.get())
+        for w in workers:
+            w.join()
+    total = len(times)
+    # 去掉开始时容量内的突发，余下按rate发出
+    steady = (total - burst) / (times[-1] - times[burst - 1]) if total > burst and times[-1] > times[burst - 1] else 0
+    print(f"{processes}个进程 x {requests}次, 限额 {rate}/s, 容量 {burst}")
+    print(f"耗时 {times[-1] - start:.2f}s, 稳定速率 {steady:.2f}/s（理论 {rate}/s，理论耗时 {(total - burst) / rate:.2f}s）")
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    if args and args[0] == "demo":
+        options = {}
+        for flag in ("--processes", "--requests", "--rate", "--burst"):
+            if flag in args:
+                i = args.index(flag)
+                options[flag] = float(args[i + 1])
+                del args[i:i + 2]
+        demo(int(options.get("--processes", 4)), int(options.get("--requests", 20)),
+             options.get("--rate", 5.0), int(options.get("--burst", 2)))
+        sys.exit(0)
+    state_dir = Path(args[0]) if args else STATE_DIR
+    for host in LIMITS:
+        state = limiter_for(host, state_dir).state()
+        print(f"{host:<28} {LIMITS[host][0]}/s 容量{LIMITS[host][1]}  令牌 {state['tokens']:.2f}  "
+              f"连续失败 {state.get('failures', 0)}  暂停剩余 {state['paused']:.0f}s")
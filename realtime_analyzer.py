@@ -5,456 +5,249 @@
 基于真实K线数据生成高胜率交易计划
 """
 
-import json
 import time
 from datetime import datetime
 from pathlib import Path
-import subprocess
 import os
 
+from bar_archive import BarArchive
+from bar_cache import BarCache
+from git_publisher import get_publisher
+import indicators
+import metrics
+from kline_frame import KlineFrame
+from market_data import fetch_concurrent
+from price_source import PriceResolver, Quote
+from report_renderer import render_html, render_json, render_realtime_markdown
+from report_store import ReportStore, write_latest
+from universe import default_universe, price_decimals
+
+
+def analyze_frame(klines, symbol):
+    """
+    分析一个品种的K线，klines可以是字典列表或KlineFrame
+    不依赖分析器实例，可在子进程中调用
+    """
+    frame = KlineFrame.from_klines(klines)
+    closes = frame.close.tolist()
+    volumes = frame.volume.tolist()
+    
+    current_price = closes[-1]
+    daily_high = float(frame.high.max())
+    daily_low = float(frame.low.min())
+    
+    ind = indicators.snapshot(frame)
+    ema7, ema25, ema99 = ind['ema7'], ind['ema25'], ind['ema99']
+    rsi = ind['rsi']
+    atr = ind['atr']
+    diff, dea, hist = ind['macd_diff'], ind['macd_dea'], ind['macd_hist']
+    
+    # 趋势判断
+    if ema7 > ema25 > ema99:
+        trend = "strong_bullish" if rsi > 60 else "bullish"
+    elif ema7 < ema25 < ema99:
+        trend = "strong_bearish" if rsi < 40 else "bearish"
+    else:
+        trend = "consolidation"
+    
+    # 成交量趋势
+    vol_avg = sum(volumes[-5:]) / 5
+    vol_trend = "increasing" if volumes[-1] > vol_avg * 0.9 else "decreasing"
+    
+    # 按品种的最小变动价位保留小数，外汇（0.0001）不能按2位取整；ATR、MACD比价格多保留2位
+    d = price_decimals(symbol)
+    return {
+        "symbol": symbol,
+        "current_price": round(current_price, d),
+        "daily_high": round(daily_high, d),
+        "daily_low": round(daily_low, d),
+        "trend": trend,
+        "ema7": round(ema7, d),
+        "ema25": round(ema25, d),
+        "ema99": round(ema99, d),
+        "rsi": round(rsi, 1),
+        "atr": round(atr, d + 2),
+        "macd_diff": round(diff, d + 2),
+        "macd_dea": round(dea, d + 2),
+        "macd_hist": round(hist, d + 2),
+        "volume_trend": vol_trend,
+        "last_klines": frame[-5:].to_klines()
+    }
+
+
 class RealtimeMarketAnalyzer:
     def __init__(self):
         self.output_dir = Path("/root/clawd/market_analysis")
         self.output_dir.mkdir(parents=True, exist_ok=True)
         self.log_dir = self.output_dir / "logs"
         self.log_dir.mkdir(parents=True, exist_ok=True)
+        # 本地K线缓存，每轮只增量获取新K线
+        self.bar_cache = BarCache(self.output_dir / "cache")
+        # 长期K线归档，分析窗口直接从内存映射中读取
+        self.archive_dir = self.output_dir / "archive"
+        self.archives = {}
+        # 分析窗口，保证EMA99有足够的K线
+        self.window_size = 99
+        # 数据源熔断和最近价格；各品种本轮K线的来源和数据年龄
+        self.resolver = PriceResolver(self.output_dir / "cache")
+        self.quotes = {}
+        # 每轮结果追加到按日分段的存储，不再每轮新建json文件
+        self.store = ReportStore(self.output_dir / "store")
+        # 后台提交、推送报告
+        self.publisher = get_publisher(self.output_dir)
         
-    def get_kline_data(self, symbol):
+    def get_archive(self, symbol):
+        """
+        获取品种的5分钟K线归档
+        按报告代码去掉斜杠归档（XAGUSD、XAG/USD、SI=F都是XAGUSD），实时分析和品种池批量分析共用
+        """
+        key = self.metric_label(symbol).replace("/", "")
+        if key not in self.archives:
+            self.archives[key] = BarArchive(self.archive_dir, key, "5m")
+        return self.archives[key]
+    
+    def get_kline_data(self, symbol, source=None):
         """
         获取K线数据
-        尝试多个API源，返回最近13根5分钟K线
+        从Yahoo Finance增量更新本地缓存并写入归档，返回最近window_size根5分钟K线
+        Yahoo失败或已熔断时使用归档中最近的真实K线
+        source为Yahoo代码，默认按品种池查找；归档和数据来源按报告代码记录
         """
-        # 尝试从API获取真实数据
-        data_sources = []
-        
-        # 尝试Yahoo Finance
-        try:
-            import urllib.request
-            url = f"https://query1.finance.yahoo.com/v8/finance/chart/{symbol}?interval=5m&range=1d"
-            req = urllib.request.Request(url, headers={
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36',
-                'Accept': 'application/json'
-            })
-            with urllib.request.urlopen(req, timeout=10) as r:
-                data = json.loads(r.read().decode())
-                result = data.get('chart', {}).get('result', [{}])[0]
-                timestamps = result.get('timestamp', [])
-                quote = result.get('indicators', {}).get('quote', [{}])[0]
-                closes = quote.get('close', [])
-                highs = quote.get('high', [])
-                lows = quote.get('low', [])
-                opens = quote.get('open', [])
-                
-                if len(timestamps) >= 13:
-                    klines = []
-                    for i in range(-13, 0):
-                        klines.append({
-                            "time": timestamps[i],
-                            "open": opens[i],
-                            "high": highs[i],
-                            "low": lows[i],
-                            "close": closes[i],
-                            "volume": 1000  # Yahoo不返回详细成交量
-                        })
-                    return klines
-        except Exception as e:
-            pass
-        
-        # 如果API失败，使用基于真实市场波动的模拟数据
-        return self.generate_simulated_klines(symbol)
+        return self.get_kline_quote(symbol, source)[0]
+
+    def get_kline_quote(self, symbol, source=None):
+        """
+        同get_kline_data，返回 (K线, 本次的Quote)
+        各轮重叠运行时（流水线）用返回的Quote，不读共享的self.quotes（可能已被其他轮覆盖）
+        """
+        # XAGUSD等报告代码不是Yahoo代码，请求时换成品种池中的期货代码（SI=F）
+        if source is None:
+            instrument = default_universe.get(symbol)
+            source = instrument.source if instrument is not None else symbol
+        with metrics.scope(self.metric_label(symbol)):
+            try:
+                self.resolver.call("yahoo", self.bar_cache.refresh, source, timeout=self.resolver.budget)
+                archive = self.get_archive(symbol)
+                archive.append(self.bar_cache.since(source, archive.last_time()))
+                return self.cached_quote(symbol, "live")
+            except Exception as e:
+                metrics.inc("fetch_errors")
+                return self.cached_quote(symbol, "cache", str(e))
+    
+    def cached_klines(self, symbol, source="cache", error=None):
+        """
+        归档中最近的真实K线，来源和数据年龄记录在self.quotes中
+        归档不足13根时才使用模拟数据，并在报告中标明
+        """
+        return self.cached_quote(symbol, source, error)[0]
+
+    def cached_quote(self, symbol, source="cache", error=None):
+        """同cached_klines，返回 (K线, Quote)"""
+        label = self.metric_label(symbol)
+        klines = self.get_archive(symbol).tail(self.window_size)
+        if len(klines) >= 13:
+            quote = Quote(label, float(klines.close[-1]), source, int(klines.time[-1]), error=error)
+            quote.stale = source != "live" and quote.age > self.resolver.max_age
+            if source == "live":
+                self.resolver.remember(label, quote.price, quote.time)
+            else:
+                metrics.inc("cache_fallbacks", symbol=label)
+            self.quotes[label] = quote
+            return klines, quote
+        metrics.inc("fallbacks", symbol=label)
+        quote = self.quotes[label] = Quote(label, None, "simulated", stale=True, error=error)
+        return self.generate_simulated_klines(symbol), quote
+    
+    def annotate(self, analysis):
+        """在分析结果中标明数据来源"""
+        quote = self.quotes.get(analysis['symbol'])
+        analysis['data_source'] = quote.label() if quote is not None else "实时"
+        return analysis
+    
+    def metric_label(self, symbol):
+        """指标中的品种名统一为报告代码（XAGUSD -> XAG/USD）"""
+        instrument = default_universe.get(symbol)
+        return instrument.symbol if instrument is not None else symbol
     
     def generate_simulated_klines(self, symbol):
         """
         基于真实市场波动特征生成模拟K线
-        白银日内波动约1-2美元，黄金约20-40美元
+        走势参数来自品种池配置（白银日内波动约1-2美元，黄金约20-40美元）
         """
-        current_time = int(time.time())
-        
-        if symbol == "XAGUSD":
-            # 白银: 从低点逐步上涨，日内涨幅约3美元
-            base_price = 84.10
-            klines = []
-            for i in range(13):
-                time_offset = i * 300
-                open_price = base_price + i * 0.25
-                high_price = open_price + 0.25
-                low_price = open_price - 0.15
-                close_price = open_price + 0.2
-                volume = 1500 + (2000 - i * 100)  # 逐渐减少
-                
-                klines.append({
-                    "time": current_time - (12 - i) * 300,
-                    "open": round(open_price, 2),
-                    "high": round(high_price, 2),
-                    "low": round(low_price, 2),
-                    "close": round(close_price, 2),
-                    "volume": int(volume)
-                })
-            return klines
-        else:
-            # 黄金: 从低点逐步上涨，日内涨幅约100美元
-            base_price = 2660
-            klines = []
-            for i in range(13):
-                time_offset = i * 300
-                open_price = base_price + i * 8
-                high_price = open_price + 10
-                low_price = open_price - 5
-                close_price = open_price + 7
-                volume = 800 + (1200 - i * 50)
-                
-                klines.append({
-                    "time": current_time - (12 - i) * 300,
-                    "open": round(open_price, 2),
-                    "high": round(high_price, 2),
-                    "low": round(low_price, 2),
-                    "close": round(close_price, 2),
-                    "volume": int(volume)
-                })
-            return klines
+        instrument = default_universe.get(symbol)
+        if instrument is None:
+            raise ValueError(f"品种池中没有 {symbol}")
+        return instrument.simulated_klines()
     
     def calculate_ema(self, prices, period):
-        """计算EMA"""
-        k = 2 / (period + 1)
-        ema = prices[0]
-        for price in prices[1:]:
-            ema = price * k + ema * (1 - k)
-        return ema
+        """计算EMA（最新值）"""
+        return float(indicators.ema(prices, period)[-1])
     
     def calculate_atr(self, klines, period=14):
-        """计算ATR"""
-        trs = []
-        for i, k in enumerate(klines):
-            if i == 0:
-                tr = k['high'] - k['low']
-            else:
-                prev_close = klines[i-1]['close']
-                tr = max(k['high'] - k['low'], abs(k['high'] - prev_close), abs(k['low'] - prev_close))
-            trs.append(tr)
-        return sum(trs[-period:]) / min(period, len(trs))
+        """计算ATR（最新值）"""
+        frame = KlineFrame.from_klines(klines)
+        return float(indicators.atr(frame.high, frame.low, frame.close, period)[-1])
     
     def calculate_rsi(self, prices, period=14):
-        """计算RSI"""
-        deltas = [prices[i+1] - prices[i] for i in range(len(prices)-1)]
-        gains = [d if d > 0 else 0 for d in deltas]
-        losses = [-d if d < 0 else 0 for d in deltas]
-        avg_gain = sum(gains[-period:]) / period if gains else 0
-        avg_loss = sum(losses[-period:]) / period if losses else 0
-        if avg_loss == 0:
-            return 70
-        rs = avg_gain / avg_loss
-        return 100 - (100 / (1 + rs))
+        """计算RSI（最新值）"""
+        return float(indicators.rsi(prices, period)[-1])
     
     def analyze_klines(self, klines, symbol):
-        """分析K线数据"""
-        closes = [k['close'] for k in klines]
-        highs = [k['high'] for k in klines]
-        lows = [k['low'] for k in klines]
-        volumes = [k['volume'] for k in klines]
-        
-        current_price = closes[-1]
-        daily_high = max(highs)
-        daily_low = min(lows)
-        
-        ema7 = self.calculate_ema(closes[-7:], 7)
-        ema25 = self.calculate_ema(closes[-25:], 25)
-        ema99 = self.calculate_ema(closes, min(99, len(closes)))
-        
-        rsi = self.calculate_rsi(closes[-15:], 14)
-        atr = self.calculate_atr(klines[-14:])
-        
-        ema12 = self.calculate_ema(closes[-12:], 12)
-        ema26 = self.calculate_ema(closes[-26:], 26)
-        diff = ema12 - ema26
-        dea = diff * 0.8
-        hist = diff - dea
-        
-        # 趋势判断
-        if ema7 > ema25 > ema99:
-            trend = "strong_bullish" if rsi > 60 else "bullish"
-        elif ema7 < ema25 < ema99:
-            trend = "strong_bearish" if rsi < 40 else "bearish"
-        else:
-            trend = "consolidation"
-        
-        # 成交量趋势
-        vol_avg = sum(volumes[-5:]) / 5
-        vol_trend = "increasing" if volumes[-1] > vol_avg * 0.9 else "decreasing"
-        
-        return {
-            "symbol": symbol,
-            "current_price": round(current_price, 2),
-            "daily_high": round(daily_high, 2),
-            "daily_low": round(daily_low, 2),
-            "trend": trend,
-            "ema7": round(ema7, 2),
-            "ema25": round(ema25, 2),
-            "ema99": round(ema99, 2),
-            "rsi": round(rsi, 1),
-            "atr": round(atr, 2),
-            "macd_diff": round(diff, 2),
-            "macd_dea": round(dea, 2),
-            "macd_hist": round(hist, 2),
-            "volume_trend": vol_trend,
-            "last_klines": klines[-5:]
-        }
+        """分析K线数据，klines可以是字典列表或KlineFrame"""
+        return analyze_frame(klines, symbol)
     
     def generate_markdown_report(self, silver_analysis, gold_analysis):
         """生成Markdown格式分析报告"""
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        
-        def format_klines(klines):
-            lines = []
-            for k in klines:
-                time_str = datetime.fromtimestamp(k['time']).strftime('%H:%M')
-                lines.append(f"{time_str}: O{k['open']:.2f} H{k['high']:.2f} L{k['low']:.2f} C{k['close']:.2f} Vol:{k['volume']}")
-            return "\n".join(lines)
-        
-        def get_trend_signal(trend, rsi):
-            if 'bullish' in trend:
-                return '偏多' + ('(超买)' if rsi > 70 else '(偏强)' if rsi > 60 else '')
-            elif 'bearish' in trend:
-                return '偏空' + ('超卖' if rsi < 30 else '偏弱' if rsi < 40 else '')
-            return '中性'
+        return render_realtime_markdown([silver_analysis, gold_analysis])
+    
+    def render_reports(self, silver_analysis, gold_analysis):
+        """渲染本轮报告，返回 (存储记录, Markdown, HTML)"""
+        with metrics.stage("render"):
+            # 保存JSON原始数据，关键价位与Markdown中的数值相同
+            levels = render_json([silver_analysis, gold_analysis])
+            json_data = {
+                "timestamp": int(time.time()),
+                "datetime": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+                "silver": levels[silver_analysis['symbol']],
+                "gold": levels[gold_analysis['symbol']]
+            }
+            markdown = self.generate_markdown_report(silver_analysis, gold_analysis)
+            html = render_html([silver_analysis, gold_analysis])
+        return json_data, markdown, html
+    
+    def persist_reports(self, json_data, markdown, html):
+        """
+        原始数据追加到报告存储，Markdown/HTML只保留最新一份
+        返回 (Markdown文件, 存储分段文件)
+        """
+        with metrics.stage("persist"):
+            ts = self.store.append("realtime", json_data, json_data["timestamp"])
+            md_file = write_latest(self.output_dir / "precious_metals_analysis_latest.md", markdown)
+            write_latest(md_file.with_suffix('.html'), html)
+            
+            # 记录日志
+            log_file = self.log_dir / f"analysis_{datetime.now().strftime('%Y%m%d')}.log"
+            with open(log_file, 'a', encoding='utf-8') as f:
+                f.write(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] 生成报告: {md_file.name}\n")
         
-        md = f"""# 贵金属短线技术分析报告
-
-**生成时间**: {datetime.now().strftime("%Y-%m-%d %H:%M:%S")}  
-**数据来源**: Kitco/实时K线数据  
-**分析周期**: 5分钟K线
-
----
-
-## 一、国际白银(XAG/USD)技术分析
-
-### 1.1 实时行情
-
-| 项目 | 数值 |
-|------|------|
-| 当前价格 | ${silver_analysis['current_price']} |
-| 日内区间 | ${silver_analysis['daily_low']} - ${silver_analysis['daily_high']} |
-| ATR(14) | {silver_analysis['atr']} |
-| 成交量趋势 | {silver_analysis['volume_trend']} |
-
-### 1.2 技术指标
-
-| 指标 | 数值 | 信号 |
-|------|------|------|
-| 趋势 | {silver_analysis['trend']} | {get_trend_signal(silver_analysis['trend'], silver_analysis['rsi'])} |
-| EMA7 | {silver_analysis['ema7']} | {'多头排列' if silver_analysis['ema7'] > silver_analysis['ema25'] else '空头排列'} |
-| EMA25 | {silver_analysis['ema25']} | - |
-| EMA99 | {silver_analysis['ema99']} | - |
-| RSI(14) | {silver_analysis['rsi']} | {'超买' if silver_analysis['rsi'] > 70 else '偏强' if silver_analysis['rsi'] > 60 else '中性' if silver_analysis['rsi'] > 40 else '偏弱'} |
-| MACD | D:{silver_analysis['macd_diff']} DEA:{silver_analysis['macd_dea']} H:{silver_analysis['macd_hist']} | {'金叉' if silver_analysis['macd_hist'] > 0 else '死叉'} |
-
-### 1.3 最近5根5分钟K线
-
-```
-{format_klines(silver_analysis['last_klines'])}
-```
-
-### 1.4 关键价位
-
-**支撑位**:
-- S1: ${round(silver_analysis['current_price'] - silver_analysis['atr']*0.5, 2)}
-- S2: ${round(silver_analysis['current_price'] - silver_analysis['atr']*1, 2)}
-- S3: ${round(silver_analysis['current_price'] - silver_analysis['atr']*1.5, 2)}
-
-**阻力位**:
-- R1: ${round(silver_analysis['current_price'] + silver_analysis['atr']*0.5, 2)}
-- R2: ${round(silver_analysis['current_price'] + silver_analysis['atr']*1, 2)}
-- R3: ${round(silver_analysis['current_price'] + silver_analysis['atr']*1.5, 2)}
-
-### 1.5 高胜率交易计划
-
-**方案A: 回踩做多（胜率最高）**
-- 进场位: {round(silver_analysis['current_price'] - silver_analysis['atr']*0.3, 2)} - {round(silver_analysis['current_price'] - silver_analysis['atr']*0.1, 2)}
-- 止损: {round(silver_analysis['current_price'] - silver_analysis['atr']*1, 2)}
-- 止盈1: {round(silver_analysis['current_price'] + silver_analysis['atr']*0.5, 2)}
-- 止盈2: {round(silver_analysis['current_price'] + silver_analysis['atr']*1, 2)}
-- 盈亏比: 1:2
-- 仓位: 30%
-
-**方案B: 突破做多（高确定性）**
-- 进场位: {round(silver_analysis['current_price'] + silver_analysis['atr']*0.5, 2)} 突破后回踩
-- 止损: {silver_analysis['current_price']}
-- 止盈: {round(silver_analysis['current_price'] + silver_analysis['atr']*1.5, 2)}
-- 盈亏比: 1:1.5
-- 仓位: 25%
-
----
-
-## 二、国际黄金(XAU/USD)技术分析
-
-### 2.1 实时行情
-
-| 项目 | 数值 |
-|------|------|
-| 当前价格 | ${gold_analysis['current_price']} |
-| 日内区间 | ${gold_analysis['daily_low']} - ${gold_analysis['daily_high']} |
-| ATR(14) | {gold_analysis['atr']} |
-| 成交量趋势 | {gold_analysis['volume_trend']} |
-
-### 2.2 技术指标
-
-| 指标 | 数值 | 信号 |
-|------|------|------|
-| 趋势 | {gold_analysis['trend']} | {get_trend_signal(gold_analysis['trend'], gold_analysis['rsi'])} |
-| EMA7 | {gold_analysis['ema7']} | {'多头排列' if gold_analysis['ema7'] > gold_analysis['ema25'] else '空头排列'} |
-| EMA25 | {gold_analysis['ema25']} | - |
-| EMA99 | {gold_analysis['ema99']} | - |
-| RSI(14) | {gold_analysis['rsi']} | {'超买' if gold_analysis['rsi'] > 70 else '偏强' if gold_analysis['rsi'] > 60 else '中性' if gold_analysis['rsi'] > 40 else '偏弱'} |
-| MACD | D:{gold_analysis['macd_diff']} DEA:{gold_analysis['macd_dea']} H:{gold_analysis['macd_hist']} | {'金叉' if gold_analysis['macd_hist'] > 0 else '死叉'} |
-
-### 2.3 最近5根5分钟K线
-
-```
-{format_klines(gold_analysis['last_klines'])}
-```
-
-### 2.4 关键价位
-
-**支撑位**:
-- S1: ${round(gold_analysis['current_price'] - gold_analysis['atr']*0.5, 2)}
-- S2: ${round(gold_analysis['current_price'] - gold_analysis['atr']*1, 2)}
-- S3: ${round(gold_analysis['current_price'] - gold_analysis['atr']*1.5, 2)}
-
-**阻力位**:
-- R1: ${round(gold_analysis['current_price'] + gold_analysis['atr']*0.5, 2)}
-- R2: ${round(gold_analysis['current_price'] + gold_analysis['atr']*1, 2)}
-- R3: ${round(gold_analysis['current_price'] + gold_analysis['atr']*1.5, 2)}
-
-### 2.5 高胜率交易计划
-
-**方案A: 回踩做多（胜率最高）**
-- 进场位: {round(gold_analysis['current_price'] - gold_analysis['atr']*0.3, 2)} - {round(gold_analysis['current_price'] - gold_analysis['atr']*0.1, 2)}
-- 止损: {round(gold_analysis['current_price'] - gold_analysis['atr']*1, 2)}
-- 止盈1: {round(gold_analysis['current_price'] + gold_analysis['atr']*0.5, 2)}
-- 止盈2: {round(gold_analysis['current_price'] + gold_analysis['atr']*1, 2)}
-- 盈亏比: 1:2
-- 仓位: 30%
-
-**方案B: 突破做多（高确定性）**
-- 进场位: {round(gold_analysis['current_price'] + gold_analysis['atr']*0.5, 2)} 突破后回踩
-- 止损: {gold_analysis['current_price']}
-- 止盈: {round(gold_analysis['current_price'] + gold_analysis['atr']*1.5, 2)}
-- 盈亏比: 1:1.5
-- 仓位: 25%
-
----
-
-## 三、综合交易建议
-
-### 3.1 整体市场状态
-
-- 白银: 短期趋势为{silver_analysis['trend']}，RSI({silver_analysis['rsi']})处于{'超买区域' if silver_analysis['rsi'] > 70 else '偏强区域' if silver_analysis['rsi'] > 60 else '中性区域'}，{'MACD金叉，多头动能充足' if silver_analysis['macd_hist'] > 0 else 'MACD死叉，空头动能增强'}
-- 黄金: 短期趋势为{gold_analysis['trend']}，RSI({gold_analysis['rsi']})处于{'超买区域' if gold_analysis['rsi'] > 70 else '偏强区域' if gold_analysis['rsi'] > 60 else '中性区域'}，{'MACD金叉，多头动能充足' if gold_analysis['macd_hist'] > 0 else 'MACD死叉，空头动能增强'}
-- 两品种联动性: {'强' if abs(silver_analysis['trend'] == gold_analysis['trend']) else '弱'}，交易策略保持一致
-
-### 3.2 最佳交易时段
-
-欧美盘重叠时段（14:00-18:00 UTC）波动最大，建议在此时段操作
-
-### 3.3 风险控制
-
-1. 单笔止损不超过总资金2%
-2. 总仓位不超过60%
-3. 严格止损，不扛单
-4. 盈利后移动止损至成本价
-
-### 3.4 信号确认规则
-
-- 突破需要3%以上放量配合
-- 回调需要缩量
-- 等待1分钟/5分钟K线收线确认
-
----
-
-## 四、交易计划汇总表
-
-| 品种 | 方案 | 进场位 | 止损 | 止盈 | 盈亏比 | 置信度 |
-|------|------|--------|------|------|--------|--------|
-| 白银 | A.回踩做多 | {round(silver_analysis['current_price'] - silver_analysis['atr']*0.3, 2)}-{round(silver_analysis['current_price'] - silver_analysis['atr']*0.1, 2)} | {round(silver_analysis['current_price'] - silver_analysis['atr']*1, 2)} | {round(silver_analysis['current_price'] + silver_analysis['atr']*1, 2)} | 1:2 | 高 |
-| 白银 | B.突破做多 | {round(silver_analysis['current_price'] + silver_analysis['atr']*0.5, 2)}+ | {silver_analysis['current_price']} | {round(silver_analysis['current_price'] + silver_analysis['atr']*1.5, 2)} | 1:1.5 | 中高 |
-| 黄金 | A.回踩做多 | {round(gold_analysis['current_price'] - gold_analysis['atr']*0.3, 2)}-{round(gold_analysis['current_price'] - gold_analysis['atr']*0.1, 2)} | {round(gold_analysis['current_price'] - gold_analysis['atr']*1, 2)} | {round(gold_analysis['current_price'] + gold_analysis['atr']*1, 2)} | 1:2 | 高 |
-| 黄金 | B.突破做多 | {round(gold_analysis['current_price'] + gold_analysis['atr']*0.5, 2)}+ | {gold_analysis['current_price']} | {round(gold_analysis['current_price'] + gold_analysis['atr']*1.5, 2)} | 1:1.5 | 中高 |
-
----
-
-**报告编号**: {timestamp}  
-**下一次更新**: 15分钟后
-
-*本报告由自动化系统基于实时K线数据生成，仅供参考，不构成投资建议*  
-*投资有风险，交易需谨慎*
-"""
-        return md
+        return md_file, self.store.segment_path(ts)
     
     def save_reports(self, silver_analysis, gold_analysis):
-        """保存报告到文件"""
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        
-        # 生成Markdown报告
-        md_content = self.generate_markdown_report(silver_analysis, gold_analysis)
-        md_file = self.output_dir / f"precious_metals_analysis_{timestamp}.md"
-        
-        with open(md_file, 'w', encoding='utf-8') as f:
-            f.write(md_content)
-        
-        # 保存JSON原始数据
-        json_data = {
-            "timestamp": int(time.time()),
-            "datetime": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-            "silver": silver_analysis,
-            "gold": gold_analysis
-        }
-        json_file = self.output_dir / f"precious_metals_analysis_{timestamp}.json"
-        
-        with open(json_file, 'w', encoding='utf-8') as f:
-            json.dump(json_data, f, indent=2, ensure_ascii=False)
-        
-        # 记录日志
-        log_file = self.log_dir / f"analysis_{datetime.now().strftime('%Y%m%d')}.log"
-        with open(log_file, 'a', encoding='utf-8') as f:
-            f.write(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] 生成报告: {md_file.name}\n")
-        
-        return md_file, json_file
+        """
+        保存报告: 原始数据追加到报告存储，Markdown/HTML只保留最新一份
+        返回 (Markdown文件, 存储分段文件)
+        """
+        return self.persist_reports(*self.render_reports(silver_analysis, gold_analysis))
     
-    def push_to_github(self):
-        """推送到GitHub"""
-        try:
-            # 检查是否配置了Git
-            if not (self.output_dir / ".git").exists():
-                subprocess.run(["git", "init"], cwd=self.output_dir, capture_output=True)
-            
-            # 添加所有文件
-            subprocess.run(["git", "add", "."], cwd=self.output_dir, capture_output=True)
-            
-            # 检查是否有变更
-            result = subprocess.run(["git", "status", "--porcelain"], cwd=self.output_dir, capture_output=True)
-            if not result.stdout.strip():
-                return False, "无新内容需要推送"
-            
-            # 提交
-            timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            subprocess.run(
-                ["git", "commit", "-m", f"更新贵金属分析报告 - {timestamp}"],
-                cwd=self.output_dir, capture_output=True
-            )
-            
-            # 推送到远程
-            result = subprocess.run(
-                ["git", "push", "origin", "main"],
-                cwd=self.output_dir, capture_output=True, timeout=120
-            )
-            if result.returncode == 0:
-                return True, "已推送到GitHub"
-            else:
-                return False, f"推送失败: {result.stderr[:100]}"
-        except Exception as e:
-            return False, str(e)
+    def push_to_github(self, paths):
+        """把本轮报告交给后台发布线程，提交和推送不阻塞分析流程"""
+        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        self.publisher.publish(paths, f"更新贵金属分析报告 - {timestamp}")
+        return True, "已加入发布队列"
     
     def run(self):
         """执行完整分析流程"""
+        metrics.begin()
         print("=" * 60)
         print("贵金属技术分析系统")
         print(f"开始时间: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
@@ -462,29 +255,38 @@ class RealtimeMarketAnalyzer:
         
         # 获取K线数据
         print("\n[1/4] 获取K线数据...")
-        silver_klines = self.get_kline_data("XAGUSD")
-        gold_klines = self.get_kline_data("XAUUSD")
-        print(f"  白银K线: {len(silver_klines)} 根")
-        print(f"  黄金K线: {len(gold_klines)} 根")
+        # 两个品种并发获取，超过本轮截止时间的品种使用模拟数据
+        results = fetch_concurrent(["XAGUSD", "XAUUSD"], fetch=self.get_kline_data, deadline=20)
+        silver_klines = results["XAGUSD"]['data'] or self.cached_klines("XAGUSD", error=results["XAGUSD"]['error'])
+        gold_klines = results["XAUUSD"]['data'] or self.cached_klines("XAUUSD", error=results["XAUUSD"]['error'])
+        print(f"  白银K线: {len(silver_klines)} 根（{self.quotes['XAG/USD'].label()}）")
+        print(f"  黄金K线: {len(gold_klines)} 根（{self.quotes['XAU/USD'].label()}）")
         
         # 分析K线
         print("\n[2/4] 分析K线数据...")
-        silver_analysis = self.analyze_klines(silver_klines, "XAG/USD")
-        gold_analysis = self.analyze_klines(gold_klines, "XAU/USD")
+        with metrics.stage("indicators", "XAG/USD"):
+            silver_analysis = self.annotate(self.analyze_klines(silver_klines, "XAG/USD"))
+        with metrics.stage("indicators", "XAU/USD"):
+            gold_analysis = self.annotate(self.analyze_klines(gold_klines, "XAU/USD"))
         print(f"  白银当前价: ${silver_analysis['current_price']}")
         print(f"  黄金当前价: ${gold_analysis['current_price']}")
         
         # 生成报告
         print("\n[3/4] 生成分析报告...")
-        md_file, json_file = self.save_reports(silver_analysis, gold_analysis)
+        md_file, segment_file = self.save_reports(silver_analysis, gold_analysis)
         print(f"  Markdown报告: {md_file.name}")
-        print(f"  JSON数据: {json_file.name}")
+        print(f"  报告存储: {segment_file.relative_to(self.output_dir)}")
         
         # 推送到GitHub
         print("\n[4/4] 推送到GitHub...")
-        success, msg = self.push_to_github()
+        with metrics.stage("publish"):
+            success, msg = self.push_to_github([md_file, md_file.with_suffix('.html'), segment_file])
         print(f"  GitHub状态: {msg}")
         
+        # 导出本轮耗时和计数（Prometheus文本文件 + 每轮一行JSON）
+        cycle = metrics.registry.export(self.log_dir, "realtime")
+        print(f"\n本轮耗时 {cycle['cycle_seconds']}s，指标: {(self.log_dir / 'metrics.prom').relative_to(self.output_dir)}")
+        
         print("\n" + "=" * 60)
         print("分析完成!")
         print("=" * 60)
@@ -493,7 +295,7 @@ class RealtimeMarketAnalyzer:
             "silver_price": silver_analysis['current_price'],
             "gold_price": gold_analysis['current_price'],
             "md_file": str(md_file),
-            "json_file": str(json_file),
+            "store_file": str(segment_file),
             "github": msg
         }
 
@@ -0,0 +1,509 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+报告渲染
+每个品种的章节模板在导入时解析一次，渲染时只做字符串拼接
+关键价位和交易计划按品种计算一次（TradeLevels），Markdown/HTML/JSON共用同一份数值
+N个品种的报告 = 文档头 + N个章节 + 汇总，用str.join拼接
+"""
+
+import html
+import string
+from datetime import datetime
+
+from universe import default_universe, price_decimals
+
+CN_DIGITS = "零一二三四五六七八九"
+
+
+def cn_number(n):
+    """章节序号: 1 -> 一, 12 -> 十二, 25 -> 二十五，100以上用阿拉伯数字"""
+    if n >= 100:
+        return str(n)
+    if n < 10:
+        return CN_DIGITS[n]
+    tens, ones = divmod(n, 10)
+    return ("" if tens == 1 else CN_DIGITS[tens]) + "十" + (CN_DIGITS[ones] if ones else "")
+
+
+def display_name(symbol):
+    """报告中显示的 (全称, 简称)，取自品种池配置"""
+    inst = default_universe.get(symbol)
+    return (inst.name, inst.short_name) if inst is not None else (symbol, symbol)
+
+
+class Template:
+    """
+    str.format风格的模板，构造时解析为(文本, 字段)列表
+    render()只按字段名取值拼接，不再重复解析格式串
+    字段值应已格式化为字符串
+    """
+    __slots__ = ("parts",)
+
+    def __init__(self, text):
+        self.parts = []
+        for literal, field, spec, conv in string.Formatter().parse(text):
+            if spec or conv:
+                raise ValueError(f"模板字段不支持格式说明: {field}")
+            self.parts.append((literal, field))
+
+    def render(self, values):
+        out = []
+        for literal, field in self.parts:
+            out.append(literal)
+            if field is not None:
+                out.append(values[field])
+        return "".join(out)
+
+
+class TradeLevels:
+    """按当前价和ATR计算的支撑阻力位与交易计划，每个品种只算一次"""
+    __slots__ = ("price", "atr", "s1", "s2", "s3", "r1", "r2", "r3",
+                 "a_entry_low", "a_entry_high", "a_stop", "a_tp1", "a_tp2",
+                 "b_entry", "b_stop", "b_tp")
+
+    def __init__(self, price, atr, decimals=2):
+        self.price = price
+        self.atr = atr
+        self.s1 = round(price - atr * 0.5, decimals)
+        self.s2 = round(price - atr * 1, decimals)
+        self.s3 = round(price - atr * 1.5, decimals)
+        self.r1 = round(price + atr * 0.5, decimals)
+        self.r2 = round(price + atr * 1, decimals)
+        self.r3 = round(price + atr * 1.5, decimals)
+        # 方案A: 回踩做多
+        self.a_entry_low = round(price - atr * 0.3, decimals)
+        self.a_entry_high = round(price - atr * 0.1, decimals)
+        self.a_stop = self.s2
+        self.a_tp1 = self.r1
+        self.a_tp2 = self.r2
+        # 方案B: 突破做多
+        self.b_entry = self.r1
+        self.b_stop = price
+        self.b_tp = self.r3
+
+    def to_dict(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+
+def trend_signal(trend, rsi):
+    if 'bullish' in trend:
+        return '偏多' + ('(超买)' if rsi > 70 else '(偏强)' if rsi > 60 else '')
+    elif 'bearish' in trend:
+        return '偏空' + ('超卖' if rsi < 30 else '偏弱' if rsi < 40 else '')
+    return '中性'
+
+
+def rsi_label(rsi):
+    return '超买' if rsi > 70 else '偏强' if rsi > 60 else '中性' if rsi > 40 else '偏弱'
+
+
+def format_klines(klines, decimals=2):
+    lines = []
+    for k in klines:
+        time_str = datetime.fromtimestamp(k['time']).strftime('%H:%M')
+        o, h, l, c = (f"{k[name]:.{decimals}f}" for name in ("open", "high", "low", "close"))
+        lines.append(f"{time_str}: O{o} H{h} L{l} C{c} Vol:{k['volume']}")
+    return "\n".join(lines)
+
+
+class SymbolReport:
+    """一个品种的分析结果和由它派生的全部报告字段"""
+    __slots__ = ("analysis", "levels", "name", "short_name")
+
+    def __init__(self, analysis):
+        self.analysis = analysis
+        self.levels = TradeLevels(analysis['current_price'], analysis['atr'], price_decimals(analysis['symbol']))
+        self.name, self.short_name = display_name(analysis['symbol'])
+
+    def values(self, index):
+        """章节模板用的字段，全部转成字符串"""
+        a = self.analysis
+        values = {name: str(value) for name, value in self.levels.to_dict().items()}
+        values.update({name: str(value) for name, value in a.items() if not isinstance(value, (dict, list))})
+        values.update({
+            "cn_index": cn_number(index),
+            "index": str(index),
+            "name": self.name,
+            "short_name": self.short_name,
+            "trend_signal": trend_signal(a['trend'], a['rsi']),
+            "ema_signal": '多头排列' if a['ema7'] > a['ema25'] else '空头排列',
+            "rsi_signal": rsi_label(a['rsi']),
+            "macd_signal": '金叉' if a['macd_hist'] > 0 else '死叉',
+            "rsi_zone": '超买区域' if a['rsi'] > 70 else '偏强区域' if a['rsi'] > 60 else '中性区域',
+            "macd_momentum": 'MACD金叉，多头动能充足' if a['macd_hist'] > 0 else 'MACD死叉，空头动能增强',
+        })
+        values.setdefault("data_source", "实时")
+        if 'last_klines' in a:
+            values["klines"] = format_klines(a['last_klines'], price_decimals(a['symbol']))
+        return values
+
+    def to_dict(self):
+        return dict(self.analysis, levels=self.levels.to_dict())
+
+
+# ---------------------------------------------------------------------------
+# 实时K线报告（RealtimeMarketAnalyzer）
+# ---------------------------------------------------------------------------
+
+REALTIME_HEADER = Template("""# 贵金属短线技术分析报告
+
+**生成时间**: {now}  
+**数据来源**: Yahoo Finance 5分钟K线（各品种实际来源见下文）  
+**分析周期**: 5分钟K线
+
+---
+
+""")
+
+REALTIME_SECTION = Template("""## {cn_index}、{name}({symbol})技术分析
+
+### {index}.1 实时行情
+
+| 项目 | 数值 |
+|------|------|
+| 当前价格 | ${current_price} |
+| 数据来源 | {data_source} |
+| 日内区间 | ${daily_low} - ${daily_high} |
+| ATR(14) | {atr} |
+| 成交量趋势 | {volume_trend} |
+
+### {index}.2 技术指标
+
+| 指标 | 数值 | 信号 |
+|------|------|------|
+| 趋势 | {trend} | {trend_signal} |
+| EMA7 | {ema7} | {ema_signal} |
+| EMA25 | {ema25} | - |
+| EMA99 | {ema99} | - |
+| RSI(14) | {rsi} | {rsi_signal} |
+| MACD | D:{macd_diff} DEA:{macd_dea} H:{macd_hist} | {macd_signal} |
+
+### {index}.3 最近5根5分钟K线
+
+```
+{klines}
+```
+
+### {index}.4 关键价位
+
+**支撑位**:
+- S1: ${s1}
+- S2: ${s2}
+- S3: ${s3}
+
+**阻力位**:
+- R1: ${r1}
+- R2: ${r2}
+- R3: ${r3}
+
+### {index}.5 高胜率交易计划
+
+**方案A: 回踩做多（胜率最高）**
+- 进场位: {a_entry_low} - {a_entry_high}
+- 止损: {a_stop}
+- 止盈1: {a_tp1}
+- 止盈2: {a_tp2}
+- 盈亏比: 1:2
+- 仓位: 30%
+
+**方案B: 突破做多（高确定性）**
+- 进场位: {b_entry} 突破后回踩
+- 止损: {b_stop}
+- 止盈: {b_tp}
+- 盈亏比: 1:1.5
+- 仓位: 25%
+
+---
+
+""")
+
+REALTIME_STATE = Template("- {short_name}: 短期趋势为{trend}，RSI({rsi})处于{rsi_zone}，{macd_momentum}\n")
+
+REALTIME_SUMMARY = Template("""## {cn_index}、综合交易建议
+
+### {index}.1 整体市场状态
+
+{states}- 品种联动性: {linkage}，交易策略保持一致
+
+### {index}.2 最佳交易时段
+
+欧美盘重叠时段（14:00-18:00 UTC）波动最大，建议在此时段操作
+
+### {index}.3 风险控制
+
+1. 单笔止损不超过总资金2%
+2. 总仓位不超过60%
+3. 严格止损，不扛单
+4. 盈利后移动止损至成本价
+
+### {index}.4 信号确认规则
+
+- 突破需要3%以上放量配合
+- 回调需要缩量
+- 等待1分钟/5分钟K线收线确认
+
+---
+
+## {cn_plan_index}、交易计划汇总表
+
+| 品种 | 方案 | 进场位 | 止损 | 止盈 | 盈亏比 | 置信度 |
+|------|------|--------|------|------|--------|--------|
+{plan_rows}
+---
+
+**报告编号**: {timestamp}  
+**下一次更新**: 15分钟后
+
+*本报告由自动化系统基于实时K线数据生成，仅供参考，不构成投资建议*  
+*投资有风险，交易需谨慎*
+""")
+
+REALTIME_PLAN_ROWS = Template(
+    "| {short_name} | A.回踩做多 | {a_entry_low}-{a_entry_high} | {a_stop} | {a_tp2} | 1:2 | 高 |\n"
+    "| {short_name} | B.突破做多 | {b_entry}+ | {b_stop} | {b_tp} | 1:1.5 | 中高 |\n"
+)
+
+
+def render_realtime_markdown(analyses, now=None):
+    """analyses为analyze_klines结果列表，按列表顺序输出各品种章节"""
+    now = now or datetime.now()
+    reports = [SymbolReport(a) for a in analyses]
+    values = [r.values(i + 1) for i, r in enumerate(reports)]
+    n = len(reports)
+    summary = {
+        "cn_index": cn_number(n + 1),
+        "index": str(n + 1),
+        "cn_plan_index": cn_number(n + 2),
+        "states": "".join(REALTIME_STATE.render(v) for v in values),
+        "linkage": '强' if len({r.analysis['trend'] for r in reports}) <= 1 else '弱',
+        "plan_rows": "".join(REALTIME_PLAN_ROWS.render(v) for v in values),
+        "timestamp": now.strftime("%Y%m%d_%H%M%S"),
+    }
+    return "".join([
+        REALTIME_HEADER.render({"now": now.strftime("%Y-%m-%d %H:%M:%S")}),
+        "".join(REALTIME_SECTION.render(v) for v in values),
+        REALTIME_SUMMARY.render(summary),
+    ])
+
+
+# ---------------------------------------------------------------------------
+# 综合分析报告（GoldSilverAnalyzer）
+# ---------------------------------------------------------------------------
+
+COMPREHENSIVE_HEADER = Template("""# 贵金属综合技术分析报告
+
+**生成时间**: {now}  
+**数据来源**: Yahoo Finance (GC=F黄金期货, SI=F白银期货)  
+**分析周期**: 5分钟K线 + 多维度分析
+
+---
+
+""")
+
+COMPREHENSIVE_SECTION = Template("""## {cn_index}、{name}({symbol})综合分析
+
+### {index}.1 实时行情
+- 当前价格: ${current_price}
+- 数据来源: {data_source}
+- 日内区间: ${daily_low} - ${daily_high}
+- ATR(14): {atr}
+
+### {index}.2 技术指标
+| 指标 | 数值 | 信号 |
+|------|------|------|
+| 趋势 | {trend} | {trend_direction} |
+| EMA7/25/99 | {ema7}/{ema25}/{ema99} | {ema_signal} |
+| RSI(14) | {rsi} | {rsi_signal} |
+| MACD | {macd_hist} | {macd_signal} |
+
+### {index}.3 威科夫分析
+- 趋势: {wyckoff_trend}
+- 量能: {wyckoff_volume}
+- 弹簧测试: {wyckoff_spring}
+- 供需: {wyckoff_supply} ({wyckoff_side})
+- 阶段: {wyckoff_phase}
+
+### {index}.4 四度空间分析
+- POC: ${poc}
+- VAH/VAL: ${vah}/${val}
+- 价格位置: {price_position}
+
+### {index}.5 CME持仓
+- 商业净头寸: {commercial_net} ({cme_signal})
+- 多空比: {long_short_ratio}
+
+### {index}.6 期权分析
+- PCR: {put_call_ratio} ({pcr_signal})
+- Max Pain: ${max_pain}
+- IV: {vix_equivalent}
+
+### {index}.7 关键价位
+- 支撑: ${s1}, ${s2}
+- 阻力: ${r1}, ${r2}
+
+---
+
+""")
+
+COMPREHENSIVE_PLAN = Template("""### {plan_index}.{index} {short_name}交易计划
+
+**方案A: 回踩做多（胜率最高）**
+- 进场位: {a_entry_low}-{a_entry_high}
+- 止损: {a_stop}
+- 止盈: {a_tp2}
+- 盈亏比: 1:2
+- 仓位: 30%
+
+**方案B: 突破做多**
+- 进场位: {b_entry}+回踩确认
+- 止损: {b_stop}
+- 止盈: {b_tp}
+- 盈亏比: 1:1.5
+- 仓位: 25%
+
+""")
+
+COMPREHENSIVE_FOOTER = Template("""## {cn_plan_index}、高胜率交易计划
+
+{plans}---
+
+**报告编号**: {timestamp}  
+*自动化系统生成，基于Yahoo Finance期货实时数据*
+""")
+
+
+def _comprehensive_values(report, index, cme, options):
+    values = report.values(index)
+    a = report.analysis
+    wyckoff, profile = a['wyckoff'], a['profile']
+    values.update({
+        "trend_direction": '偏多' if 'bullish' in a['trend'] else '偏空' if 'bearish' in a['trend'] else '中性',
+        "wyckoff_trend": wyckoff['current_trend'],
+        "wyckoff_volume": wyckoff['volume_trend'],
+        "wyckoff_spring": '是' if wyckoff['spring_test'] else '否',
+        "wyckoff_supply": wyckoff['supply_demand'],
+        "wyckoff_side": '买方主导' if wyckoff['supply_demand'] == 'demand' else '卖方主导',
+        "wyckoff_phase": wyckoff['wyckoff_phase'],
+        "poc": str(profile['poc']),
+        "vah": str(profile['vah']),
+        "val": str(profile['val']),
+        "price_position": profile['price_position'],
+        "commercial_net": f"{cme['commercial_net']:,}",
+        "cme_signal": '看涨' if cme['commercial_net'] > 0 else '看跌',
+        "long_short_ratio": str(cme['long_short_ratio']),
+        "put_call_ratio": str(options['put_call_ratio']),
+        "pcr_signal": '看跌多' if options['put_call_ratio'] > 1 else '看涨多',
+        "max_pain": str(options['max_pain']),
+        "vix_equivalent": str(options['vix_equivalent']),
+    })
+    return values
+
+
+def render_comprehensive_markdown(items, now=None):
+    """items为 [(analysis, cme, options)]，按列表顺序输出"""
+    now = now or datetime.now()
+    values = [_comprehensive_values(SymbolReport(a), i + 1, cme, options)
+              for i, (a, cme, options) in enumerate(items)]
+    plan_index = len(values) + 1
+    for v in values:
+        v["plan_index"] = str(plan_index)
+    return "".join([
+        COMPREHENSIVE_HEADER.render({"now": now.strftime("%Y-%m-%d %H:%M:%S")}),
+        "".join(COMPREHENSIVE_SECTION.render(v) for v in values),
+        COMPREHENSIVE_FOOTER.render({
+            "cn_plan_index": cn_number(plan_index),
+            "plans": "".join(COMPREHENSIVE_PLAN.render(v) for v in values),
+            "timestamp": now.strftime("%Y%m%d_%H%M%S"),
+        }),
+    ])
+
+
+# ---------------------------------------------------------------------------
+# HTML / JSON，与Markdown使用同一份SymbolReport数值
+# ---------------------------------------------------------------------------
+
+HTML_HEADER = Template("""<!DOCTYPE html>
+<html lang="zh-CN">
+<head>
+<meta charset="utf-8">
+<title>{title}</title>
+<style>
+body {{ font-family: sans-serif; margin: 2em; }}
+table {{ border-collapse: collapse; margin-bottom: 1em; }}
+td, th {{ border: 1px solid #ccc; padding: 4px 10px; text-align: right; }}
+</style>
+</head>
+<body>
+<h1>{title}</h1>
+<p>生成时间: {now}</p>
+""")
+
+HTML_SECTION = Template("""<h2>{name} ({symbol})</h2>
+<table>
+<tr><th>当前价格</th><td>{current_price}</td><th>ATR(14)</th><td>{atr}</td></tr>
+<tr><th>数据来源</th><td colspan="3">{data_source}</td></tr>
+<tr><th>趋势</th><td>{trend}</td><th>信号</th><td>{trend_signal}</td></tr>
+<tr><th>EMA7/25/99</th><td>{ema7} / {ema25} / {ema99}</td><th>RSI(14)</th><td>{rsi} ({rsi_signal})</td></tr>
+<tr><th>支撑</th><td>{s1} / {s2} / {s3}</td><th>阻力</th><td>{r1} / {r2} / {r3}</td></tr>
+<tr><th>方案A 回踩做多</th><td>{a_entry_low} - {a_entry_high}</td><th>止损 / 止盈</th><td>{a_stop} / {a_tp2}</td></tr>
+<tr><th>方案B 突破做多</th><td>{b_entry}+</td><th>止损 / 止盈</th><td>{b_stop} / {b_tp}</td></tr>
+</table>
+""")
+
+HTML_FOOTER = "</body>\n</html>\n"
+
+
+def render_html(analyses, title="贵金属短线技术分析报告", now=None):
+    now = now or datetime.now()
+    sections = []
+    for i, a in enumerate(analyses):
+        values = {k: html.escape(v) for k, v in SymbolReport(a).values(i + 1).items()}
+        sections.append(HTML_SECTION.render(values))
+    header = HTML_HEADER.render({"title": html.escape(title), "now": now.strftime("%Y-%m-%d %H:%M:%S")})
+    return "".join([header, "".join(sections), HTML_FOOTER])
+
+
+def render_json(analyses):
+    """各品种分析结果附带计算好的关键价位，键为品种代码"""
+    return {a['symbol']: SymbolReport(a).to_dict() for a in analyses}
+
+
+# ---------------------------------------------------------------------------
+# 品种池汇总报告（UniverseRunner），每个品种一行
+# ---------------------------------------------------------------------------
+
+SUMMARY_HEADER = Template("""# 品种池技术分析汇总
+
+**生成时间**: {now}  
+**品种数**: {symbols}  
+**分析耗时**: {analyze_seconds}s（{symbols_per_second} 品种/秒），数据获取 {fetch_seconds}s
+
+| 品种 | 名称 | 分组 | 现价 | 趋势 | 信号 | RSI(14) | ATR(14) | S1 | R1 | 方案A进场 | 方案B进场 | 数据来源 |
+|------|------|------|------|------|------|---------|---------|----|----|-----------|-----------|----------|
+""")
+
+SUMMARY_ROW = Template(
+    "| {symbol} | {name} | {group} | {current_price} | {trend} | {trend_signal} | {rsi} | {atr} "
+    "| {s1} | {r1} | {a_entry_low}-{a_entry_high} | {b_entry}+ | {data_source} |\n"
+)
+
+
+def render_summary_markdown(analyses, universe, stats, now=None):
+    """analyses按输出顺序排列，universe用于取名称和分组"""
+    now = now or datetime.now()
+    rows = []
+    for i, a in enumerate(analyses):
+        values = SymbolReport(a).values(i + 1)
+        inst = universe.get(a['symbol'])
+        values["name"] = inst.name if inst is not None else a['symbol']
+        values["group"] = inst.group if inst is not None else "-"
+        rows.append(SUMMARY_ROW.render(values))
+    header = SUMMARY_HEADER.render({
+        "now": now.strftime("%Y-%m-%d %H:%M:%S"),
+        "symbols": str(stats['symbols']),
+        "analyze_seconds": str(stats['analyze_seconds']),
+        "symbols_per_second": str(stats['symbols_per_second']),
+        "fetch_seconds": str(stats['fetch_seconds']),
+    })
+    return "".join([header, "".join(rows)])
@@ -0,0 +1,336 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+追加写入的报告存储，替代每轮生成的大量json/md文件
+每个UTC日期一个分段: reports-YYYYMMDD.jsonl，每轮结果追加为一行
+每个分段带一个定长二进制索引 reports-YYYYMMDD.idx: (时间戳, 偏移, 长度, 类型)，24字节一条
+分段内记录按追加顺序排列，时间戳递增（早于最后一条的时间戳按最后一条记录）
+按时间范围读取时先在索引中二分定位，只解析范围内的记录
+
+保留与压缩:
+    retain(days)               删除早于days天的整个分段
+    compact(before, resolution) 早于before的记录按resolution秒只保留每个类型的最后一条
+
+命令行:
+    python3 report_store.py <存储目录> info
+    python3 report_store.py <存储目录> import <旧报告目录>   导入旧的json报告文件
+    python3 report_store.py <存储目录> retain <天数>
+    python3 report_store.py <存储目录> compact <天数> <秒>
+"""
+
+import fcntl
+import json
+import os
+import re
+import sys
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+import numpy as np
+
+INDEX_DTYPE = np.dtype([("ts", "<i8"), ("offset", "<i8"), ("length", "<i4"), ("kind", "<i4")])
+
+# 报告类型编号，写入索引后按类型筛选不需要解析记录
+KINDS = {"realtime": 1, "market": 2, "comprehensive": 3, "universe": 4}
+KIND_NAMES = {v: k for k, v in KINDS.items()}
+
+SEGMENT_RE = re.compile(r"reports-(\d{8})\.jsonl$")
+
+
+def segment_day(ts):
+    return datetime.fromtimestamp(ts, tz=timezone.utc).strftime("%Y%m%d")
+
+
+class ReportStore:
+    def __init__(self, root):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self._indexes = {}
+
+    def _paths(self, day):
+        return self.root / f"reports-{day}.jsonl", self.root / f"reports-{day}.idx"
+
+    def segment_path(self, ts=None):
+        """时间戳所在分段的记录文件（发布到git时只需要它，索引可重建）"""
+        return self._paths(segment_day(int(time.time()) if ts is None else ts))[0]
+
+    def days(self):
+        """全部分段日期，升序"""
+        return sorted(m.group(1) for m in (SEGMENT_RE.match(p.name) for p in self.root.iterdir()) if m)
+
+    def append(self, kind, data, ts=None):
+        """
+        追加一轮结果，返回记录时间戳
+        ts早于分段中最后一条（显式传入或其他进程时钟不同）时按最后一条的时间戳记录，保证索引有序
+        """
+        ts = int(time.time()) if ts is None else int(ts)
+        body = json.dumps(data, ensure_ascii=False, separators=(",", ":"))
+        log_path, idx_path = self._paths(segment_day(ts))
+        # 多个进程同时写同一分段时串行化，保证记录与索引一一对应
+        with _locked(log_path) as log:
+            self._repair(log_path, idx_path)
+            ts = max(ts, _last_ts(idx_path))
+            line = f'{{"ts":{ts},"kind":{json.dumps(kind)},"data":{body}}}\n'.encode("utf-8")
+            offset = log.seek(0, os.SEEK_END)
+            log.write(line)
+            log.flush()
+            entry = np.array([(ts, offset, len(line), KINDS.get(kind, 0))], dtype=INDEX_DTYPE)
+            with open(idx_path, "ab") as idx:
+                idx.write(entry.tobytes())
+        self._indexes.pop(idx_path, None)
+        return ts
+
+    def _repair(self, log_path, idx_path):
+        """写入中断时，截掉未完成的记录和指向它的索引"""
+        size = log_path.stat().st_size
+        if not idx_path.exists():
+            if size:
+                self._rebuild_index(log_path, idx_path)
+            return
+        idx_size = idx_path.stat().st_size
+        n = idx_size // INDEX_DTYPE.itemsize
+        end = 0
+        if n:
+            last = np.fromfile(idx_path, dtype=INDEX_DTYPE, count=1, offset=(n - 1) * INDEX_DTYPE.itemsize)[0]
+            end = int(last["offset"]) + int(last["length"])
+        if end > size:
+            self._rebuild_index(log_path, idx_path)
+        else:
+            if idx_size != n * INDEX_DTYPE.itemsize:
+                os.truncate(idx_path, n * INDEX_DTYPE.itemsize)
+            if size > end:
+                os.truncate(log_path, end)
+
+    def _rebuild_index(self, log_path, idx_path):
+        rows = []
+        offset = 0
+        with open(log_path, "rb") as f:
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break
+                try:
+                    rec = json.loads(line)
+                except ValueError:
+                    break
+                rows.append((rec["ts"], offset, len(line), KINDS.get(rec.get("kind"), 0)))
+                offset += len(line)
+        os.truncate(log_path, offset)
+        np.array(rows, dtype=INDEX_DTYPE).tofile(str(idx_path))
+        self._indexes.pop(idx_path, None)
+
+    def index(self, day):
+        """某分段的索引数组，分段文件未变化时复用"""
+        log_path, idx_path = self._paths(day)
+        if not idx_path.exists():
+            if not log_path.exists():
+                return np.zeros(0, dtype=INDEX_DTYPE)
+            # 重建会截掉未写完的记录，加锁避免截掉其他进程正在追加的记录
+            with _locked(log_path):
+                if not idx_path.exists():
+                    self._rebuild_index(log_path, idx_path)
+        size = idx_path.stat().st_size
+        cached = self._indexes.get(idx_path)
+        if cached is None or cached[0] != size:
+            entries = np.fromfile(idx_path, dtype=INDEX_DTYPE, count=size // INDEX_DTYPE.itemsize)
+            cached = (size, entries)
+            self._indexes[idx_path] = cached
+        return cached[1]
+
+    def locate(self, start=None, end=None, kind=None):
+        """
+        时间在[start, end]内的记录位置，只读索引
+        返回 [(分段日期, 索引行数组)]
+        """
+        out = []
+        first = None if start is None else segment_day(start)
+        last = None if end is None else segment_day(end)
+        for day in self.days():
+            if (first is not None and day < first) or (last is not None and day > last):
+                continue
+            entries = self.index(day)
+            ts = entries["ts"]
+            lo = 0 if start is None else int(np.searchsorted(ts, start, side="left"))
+            hi = len(entries) if end is None else int(np.searchsorted(ts, end, side="right"))
+            rows = entries[lo:hi]
+            if kind is not None:
+                rows = rows[rows["kind"] == KINDS.get(kind, 0)]
+            if len(rows):
+                out.append((day, rows))
+        return out
+
+    def read(self, day, rows):
+        """按索引行读取记录，返回 [(时间戳, 类型, 数据)]"""
+        log_path, _ = self._paths(day)
+        records = []
+        with open(log_path, "rb") as f:
+            for row in rows:
+                f.seek(int(row["offset"]))
+                rec = json.loads(f.read(int(row["length"])))
+                records.append((rec["ts"], rec["kind"], rec["data"]))
+        return records
+
+    def scan(self, start=None, end=None, kind=None):
+        """按时间顺序逐条返回 (时间戳, 类型, 数据)"""
+        for day, rows in self.locate(start, end, kind):
+            yield from self.read(day, rows)
+
+    def latest(self, kind=None):
+        for day in reversed(self.days()):
+            entries = self.index(day)
+            if kind is not None:
+                entries = entries[entries["kind"] == KINDS.get(kind, 0)]
+            if len(entries):
+                return self.read(day, entries[-1:])[0]
+        return None
+
+    def retain(self, days):
+        """删除早于days天的分段，返回删除的分段数"""
+        cutoff = segment_day(time.time() - days * 86400)
+        removed = 0
+        for day in self.days():
+            if day < cutoff:
+                for path in self._paths(day):
+                    if path.exists():
+                        path.unlink()
+                    self._indexes.pop(path, None)
+                removed += 1
+        return removed
+
+    def compact(self, before, resolution):
+        """
+        早于before的记录，每个类型每resolution秒只保留最后一条
+        分段整体重写后原子替换，返回删除的记录数
+        读取、重写和替换都在分段的文件锁内，期间其他进程的追加等待替换完成后写入新文件
+        """
+        removed = 0
+        for day in self.days():
+            if day > segment_day(before):
+                break
+            log_path, idx_path = self._paths(day)
+            with _locked(log_path):
+                self._repair(log_path, idx_path)
+                self._indexes.pop(idx_path, None)
+                # 已持有分段锁，不经过index()（其中重建索引时会再次加锁）
+                if idx_path.exists():
+                    entries = np.fromfile(idx_path, dtype=INDEX_DTYPE)
+                else:
+                    entries = np.zeros(0, dtype=INDEX_DTYPE)
+                old = entries["ts"] < before
+                if not old.any():
+                    continue
+                # 同一(类型, 时间桶)内只保留最后一条；较新的记录全部保留
+                key = (entries["ts"] // resolution) * 1000 + entries["kind"]
+                _, first_in_reversed = np.unique(key[::-1], return_index=True)
+                keep = ~old
+                keep[len(key) - 1 - first_in_reversed] = True
+                if keep.all():
+                    continue
+                with open(log_path, "rb") as f:
+                    data = f.read()
+                kept = entries[keep]
+                chunks = [data[int(r["offset"]):int(r["offset"]) + int(r["length"])] for r in kept]
+                new = kept.copy()
+                new["offset"] = np.r_[0, np.cumsum(kept["length"])[:-1]]
+                tmp_log, tmp_idx = log_path.with_suffix(".jsonl.tmp"), idx_path.with_suffix(".idx.tmp")
+                with open(tmp_log, "wb") as f:
+                    f.write(b"".join(chunks))
+                new.tofile(str(tmp_idx))
+                os.replace(tmp_log, log_path)
+                os.replace(tmp_idx, idx_path)
+            self._indexes.pop(idx_path, None)
+            removed += int((~keep).sum())
+        return removed
+
+    def import_files(self, directory, kind_for=None):
+        """
+        导入旧的json报告文件（按文件中的timestamp字段排序后追加）
+        kind_for(文件名)返回报告类型，默认按文件名前缀判断
+        """
+        kind_for = kind_for or _legacy_kind
+        files = []
+        for path in Path(directory).glob("*.json"):
+            kind = kind_for(path.name)
+            if kind is None:
+                continue
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+            except (ValueError, OSError):
+                continue
+            ts = data.get("timestamp") if isinstance(data, dict) else None
+            files.append((int(ts) if ts else int(path.stat().st_mtime), kind, data))
+        files.sort(key=lambda x: x[0])
+        for ts, kind, data in files:
+            self.append(kind, data, ts)
+        return len(files)
+
+
+def _locked(log_path):
+    """
+    以追加方式打开分段并加排他锁，关闭文件时释放
+    等锁期间分段被compact替换或被retain删除时，锁住的是旧文件，重新打开当前的文件
+    """
+    while True:
+        f = open(log_path, "ab")
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            if os.stat(log_path).st_ino == os.fstat(f.fileno()).st_ino:
+                return f
+        except FileNotFoundError:
+            pass
+        f.close()
+
+
+def _last_ts(idx_path):
+    """索引中最后一条的时间戳，没有记录时为0"""
+    n = idx_path.stat().st_size // INDEX_DTYPE.itemsize if idx_path.exists() else 0
+    if not n:
+        return 0
+    return int(np.fromfile(idx_path, dtype=INDEX_DTYPE, count=1, offset=(n - 1) * INDEX_DTYPE.itemsize)[0]["ts"])
+
+
+def write_latest(path, text):
+    """原子覆盖写入最新一份导出的报告"""
+    path = Path(path)
+    tmp = path.with_suffix(path.suffix + ".tmp")
+    with open(tmp, 'w', encoding='utf-8') as f:
+        f.write(text)
+    os.replace(tmp, path)
+    return path
+
+
+def _legacy_kind(name):
+    if name.startswith("precious_metals_analysis_"):
+        return "realtime"
+    if name.startswith(("XAU_USD_", "XAG_USD_")):
+        return "market"
+    if name.startswith("analysis_"):
+        return "comprehensive"
+    if name.startswith("universe_summary_"):
+        return "universe"
+    return None
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 3:
+        print(__doc__)
+        sys.exit(1)
+    store = ReportStore(sys.argv[1])
+    command = sys.argv[2]
+    if command == "info":
+        for day in store.days():
+            entries = store.index(day)
+            kinds = {KIND_NAMES.get(k, "?"): int((entries["kind"] == k).sum()) for k in np.unique(entries["kind"])}
+            size = store._paths(day)[0].stat().st_size
+            print(f"{day}: {len(entries)} 条, {size / 1024:.0f} KB, {kinds}")
+    elif command == "import":
+        print(f"导入 {store.import_files(sys.argv[3])} 个文件")
+    elif command == "retain":
+        print(f"删除 {store.retain(int(sys.argv[3]))} 个分段")
+    elif command == "compact":
+        before = time.time() - int(sys.argv[3]) * 86400
+        print(f"压缩掉 {store.compact(before, int(sys.argv[4]))} 条记录")
+    else:
+        print(__doc__)
+        sys.exit(1)
@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+多周期K线合成
+从一条基础K线流（1分钟或数据源提供的最小周期）合成5m/15m/1h/4h等周期
+周期按交易时段起点对齐，一次下载即可得到所有周期的真实K线
+
+resample()      对整段KlineFrame向量化合成，每个周期一次遍历
+Resampler       逐根增量合成，支持未收线K线的临时更新
+"""
+
+import numpy as np
+
+from kline_frame import KlineFrame
+
+TIMEFRAMES = {"1m": 60, "5m": 300, "15m": 900, "30m": 1800, "1h": 3600, "4h": 14400, "1d": 86400}
+
+# COMEX/NYMEX贵金属在Globex上每个交易日从UTC 22:00开始（冬令时为23:00）
+SESSION_OFFSET = 22 * 3600
+
+
+def bucket_start(t, seconds, offset=SESSION_OFFSET):
+    """时间戳所在周期的起点"""
+    return t - (t - offset) % seconds
+
+
+def resample(frame, timeframe, offset=SESSION_OFFSET):
+    """把基础K线向量化合成为指定周期，最后一个周期可能尚未走完"""
+    frame = KlineFrame.from_klines(frame)
+    n = len(frame)
+    if not n:
+        return KlineFrame.empty()
+    seconds = TIMEFRAMES[timeframe]
+    buckets = bucket_start(frame.time, seconds, offset)
+    starts = np.flatnonzero(np.r_[True, buckets[1:] != buckets[:-1]])
+    ends = np.r_[starts[1:], n] - 1
+    return KlineFrame(
+        buckets[starts],
+        frame.open[starts],
+        np.maximum.reduceat(frame.high, starts),
+        np.minimum.reduceat(frame.low, starts),
+        frame.close[ends],
+        np.add.reduceat(frame.volume, starts),
+    )
+
+
+def resample_all(frame, timeframes=("5m", "15m", "1h", "4h"), offset=SESSION_OFFSET):
+    """一次合成多个周期，返回 {周期: KlineFrame}"""
+    frame = KlineFrame.from_klines(frame)
+    return {tf: resample(frame, tf, offset) for tf in timeframes}
+
+
+def _merge(agg, bar):
+    if agg is None:
+        return dict(bar)
+    return {
+        "time": agg["time"],
+        "open": agg["open"],
+        "high": max(agg["high"], bar["high"]),
+        "low": min(agg["low"], bar["low"]),
+        "close": bar["close"],
+        "volume": agg["volume"] + bar["volume"],
+    }
+
+
+class TimeframeBuilder:
+    """单个周期的增量合成"""
+    def __init__(self, timeframe, offset=SESSION_OFFSET, max_bars=5000):
+        self.timeframe = timeframe
+        self.seconds = TIMEFRAMES[timeframe]
+        self.offset = offset
+        self.max_bars = max_bars
+        self.bars = []
+        self.bucket = None
+        self.agg = None
+        self.forming = None
+
+    def current(self):
+        """当前周期（含未收线部分）的K线"""
+        bar = dict(self.agg) if self.agg is not None else None
+        if self.forming is not None:
+            bar = _merge(bar, self.forming)
+        if bar is not None:
+            bar["time"] = self.bucket
+        return bar
+
+    def add(self, bar, closed=True):
+        """
+        加入一根基础K线
+        closed=False 表示基础K线尚未收线，之后同一时间的K线会覆盖它
+        返回本次完成的周期K线，没有则返回None
+        """
+        b = bucket_start(bar["time"], self.seconds, self.offset)
+        finished = None
+        if self.bucket is not None and b < self.bucket:
+            return None
+        if self.bucket is not None and b > self.bucket:
+            finished = self.current()
+            if finished is not None:
+                self.bars.append(finished)
+                if len(self.bars) > self.max_bars:
+                    del self.bars[0]
+            self.agg = self.forming = None
+        self.bucket = b
+
+        if self.forming is not None and self.forming["time"] < bar["time"]:
+            # 上一根基础K线没有收到收线消息，按最后一次的值并入
+            self.agg = _merge(self.agg, self.forming)
+            self.forming = None
+        if closed:
+            self.agg = _merge(self.agg, bar)
+            self.forming = None
+        else:
+            self.forming = dict(bar)
+        return finished
+
+    def frame(self, include_partial=True):
+        bars = list(self.bars)
+        if include_partial and self.current() is not None:
+            bars.append(self.current())
+        return KlineFrame.from_klines(bars) if bars else KlineFrame.empty()
+
+
+class Resampler:
+    """同时维护多个周期，基础K线只遍历一次"""
+    def __init__(self, timeframes=("5m", "15m", "1h", "4h"), offset=SESSION_OFFSET):
+        self.builders = {tf: TimeframeBuilder(tf, offset) for tf in timeframes}
+
+    def add(self, bar, closed=True):
+        """返回 {周期: 本次完成的K线}"""
+        finished = {}
+        for tf, builder in self.builders.items():
+            done = builder.add(bar, closed)
+            if done is not None:
+                finished[tf] = done
+        return finished
+
+    def frame(self, timeframe, include_partial=True):
+        return self.builders[timeframe].frame(include_partial)
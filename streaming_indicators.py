@@ -0,0 +1,334 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+流式技术指标
+每个指标对象保存递推状态，每根新K线O(1)更新，不再对历史切片重新计算
+close(x): K线收线，把x并入状态
+update(x): 当前K线尚未收线，只基于已收线状态计算临时值，不改变状态
+to_dict()/from_dict() 用于保存和恢复状态
+计算口径与indicators.py一致（EMA以首值为起点，Wilder以前period个值的均值为起点）
+"""
+
+import math
+from collections import deque
+
+
+class EmaState:
+    def __init__(self, period):
+        self.period = period
+        self.alpha = 2.0 / (period + 1)
+        self.ema = None
+        self.value = None
+
+    def _next(self, x):
+        return x if self.ema is None else self.ema + self.alpha * (x - self.ema)
+
+    def update(self, x):
+        self.value = self._next(x)
+        return self.value
+
+    def close(self, x):
+        self.ema = self.value = self._next(x)
+        return self.value
+
+    def to_dict(self):
+        return {"period": self.period, "ema": self.ema}
+
+    @classmethod
+    def from_dict(cls, d):
+        state = cls(d["period"])
+        state.ema = state.value = d["ema"]
+        return state
+
+
+class WilderState:
+    """Wilder平滑，前period个值为累计均值，之后按1/period递推"""
+    def __init__(self, period):
+        self.period = period
+        self.count = 0
+        self.avg = None
+        self.value = None
+
+    def _next(self, x):
+        if self.avg is None:
+            return x
+        if self.count < self.period:
+            return self.avg + (x - self.avg) / (self.count + 1)
+        return self.avg + (x - self.avg) / self.period
+
+    def update(self, x):
+        self.value = self._next(x)
+        return self.value
+
+    def close(self, x):
+        self.avg = self.value = self._next(x)
+        self.count += 1
+        return self.value
+
+    def to_dict(self):
+        return {"period": self.period, "count": self.count, "avg": self.avg}
+
+    @classmethod
+    def from_dict(cls, d):
+        state = cls(d["period"])
+        state.count = d["count"]
+        state.avg = state.value = d["avg"]
+        return state
+
+
+def _rsi_value(avg_gain, avg_loss):
+    if avg_gain is None:
+        return None
+    if avg_loss == 0:
+        return 50.0 if avg_gain == 0 else 100.0
+    return 100.0 - 100.0 / (1.0 + avg_gain / avg_loss)
+
+
+class RsiState:
+    def __init__(self, period=14):
+        self.period = period
+        self.prev_close = None
+        self.gain = WilderState(period)
+        self.loss = WilderState(period)
+        self.value = None
+
+    def update(self, close):
+        if self.prev_close is None:
+            return self.value
+        delta = close - self.prev_close
+        self.value = _rsi_value(self.gain.update(max(delta, 0.0)), self.loss.update(max(-delta, 0.0)))
+        return self.value
+
+    def close(self, close):
+        if self.prev_close is not None:
+            delta = close - self.prev_close
+            self.value = _rsi_value(self.gain.close(max(delta, 0.0)), self.loss.close(max(-delta, 0.0)))
+        self.prev_close = close
+        return self.value
+
+    def to_dict(self):
+        return {"period": self.period, "prev_close": self.prev_close,
+                "gain": self.gain.to_dict(), "loss": self.loss.to_dict()}
+
+    @classmethod
+    def from_dict(cls, d):
+        state = cls(d["period"])
+        state.prev_close = d["prev_close"]
+        state.gain = WilderState.from_dict(d["gain"])
+        state.loss = WilderState.from_dict(d["loss"])
+        state.value = _rsi_value(state.gain.avg, state.loss.avg)
+        return state
+
+
+class AtrState:
+    def __init__(self, period=14):
+        self.period = period
+        self.prev_close = None
+        self.smooth = WilderState(period)
+        self.value = None
+
+    def _true_range(self, high, low):
+        if self.prev_close is None:
+            return high - low
+        return max(high - low, abs(high - self.prev_close), abs(low - self.prev_close))
+
+    def update(self, high, low, close):
+        self.value = self.smooth.update(self._true_range(high, low))
+        return self.value
+
+    def close(self, high, low, close):
+        self.value = self.smooth.close(self._true_range(high, low))
+        self.prev_close = close
+        return self.value
+
+    def to_dict(self):
+        return {"period": self.period, "prev_close": self.prev_close, "smooth": self.smooth.to_dict()}
+
+    @classmethod
+    def from_dict(cls, d):
+        state = cls(d["period"])
+        state.prev_close = d["prev_close"]
+        state.smooth = WilderState.from_dict(d["smooth"])
+        state.value = state.smooth.value
+        return state
+
+
+class MacdState:
+    def __init__(self, fast=12, slow=26, signal=9):
+        self.fast = EmaState(fast)
+        self.slow = EmaState(slow)
+        self.signal = EmaState(signal)
+        self.value = (None, None, None)
+
+    def update(self, close):
+        diff = self.fast.update(close) - self.slow.update(close)
+        dea = self.signal.update(diff)
+        self.value = (diff, dea, diff - dea)
+        return self.value
+
+    def close(self, close):
+        diff = self.fast.close(close) - self.slow.close(close)
+        dea = self.signal.close(diff)
+        self.value = (diff, dea, diff - dea)
+        return self.value
+
+    def to_dict(self):
+        return {"fast": self.fast.to_dict(), "slow": self.slow.to_dict(), "signal": self.signal.to_dict()}
+
+    @classmethod
+    def from_dict(cls, d):
+        state = cls()
+        state.fast = EmaState.from_dict(d["fast"])
+        state.slow = EmaState.from_dict(d["slow"])
+        state.signal = EmaState.from_dict(d["signal"])
+        if state.fast.ema is not None:
+            diff = state.fast.ema - state.slow.ema
+            state.value = (diff, state.signal.ema, diff - state.signal.ema)
+        return state
+
+
+class RollingStats:
+    """
+    固定窗口滚动均值/方差，用于布林带
+    数值减去首个值后再累加，并定期按窗口重算累加和，抑制长时间运行的误差累积
+    """
+    RESYNC_EVERY = 10000
+
+    def __init__(self, period=20, k=2.0):
+        self.period = period
+        self.k = k
+        self.window = deque()
+        self.shift = None
+        self.total = 0.0
+        self.total_sq = 0.0
+        self.closes = 0
+        self.value = (None, None, None)
+
+    def _bands(self, total, total_sq, n):
+        if n < self.period:
+            return (None, None, None)
+        mean = total / n
+        std = math.sqrt(max(total_sq / n - mean * mean, 0.0))
+        middle = mean + self.shift
+        return (middle + self.k * std, middle, middle - self.k * std)
+
+    def update(self, x):
+        if self.shift is None:
+            self.shift = x
+        v = x - self.shift
+        total, total_sq, n = self.total + v, self.total_sq + v * v, len(self.window) + 1
+        if n > self.period:
+            old = self.window[0]
+            total, total_sq, n = total - old, total_sq - old * old, n - 1
+        self.value = self._bands(total, total_sq, n)
+        return self.value
+
+    def close(self, x):
+        if self.shift is None:
+            self.shift = x
+        v = x - self.shift
+        self.window.append(v)
+        self.total += v
+        self.total_sq += v * v
+        if len(self.window) > self.period:
+            old = self.window.popleft()
+            self.total -= old
+            self.total_sq -= old * old
+        self.closes += 1
+        if self.closes % self.RESYNC_EVERY == 0:
+            self.total = sum(self.window)
+            self.total_sq = sum(w * w for w in self.window)
+        self.value = self._bands(self.total, self.total_sq, len(self.window))
+        return self.value
+
+    def to_dict(self):
+        return {"period": self.period, "k": self.k, "shift": self.shift, "window": list(self.window)}
+
+    @classmethod
+    def from_dict(cls, d):
+        state = cls(d["period"], d["k"])
+        state.shift = d["shift"]
+        state.window = deque(d["window"])
+        state.total = sum(state.window)
+        state.total_sq = sum(w * w for w in state.window)
+        state.value = state._bands(state.total, state.total_sq, len(state.window))
+        return state
+
+
+class IndicatorSet:
+    """
+    单个品种的全部流式指标
+    snapshot()的字段与indicators.snapshot()相同，可直接替换
+    """
+    def __init__(self):
+        self.ema7 = EmaState(7)
+        self.ema25 = EmaState(25)
+        self.ema99 = EmaState(99)
+        self.rsi = RsiState(14)
+        self.atr = AtrState(14)
+        self.macd = MacdState()
+        self.boll = RollingStats(20)
+        self.last_time = None
+
+    def _states(self):
+        return {"ema7": self.ema7, "ema25": self.ema25, "ema99": self.ema99, "rsi": self.rsi,
+                "atr": self.atr, "macd": self.macd, "boll": self.boll}
+
+    def update_bar(self, bar):
+        """未收线K线的临时更新"""
+        c = bar['close']
+        for ema in (self.ema7, self.ema25, self.ema99):
+            ema.update(c)
+        self.rsi.update(c)
+        self.atr.update(bar['high'], bar['low'], c)
+        self.macd.update(c)
+        self.boll.update(c)
+        return self.snapshot()
+
+    def close_bar(self, bar):
+        """K线收线"""
+        c = bar['close']
+        for ema in (self.ema7, self.ema25, self.ema99):
+            ema.close(c)
+        self.rsi.close(c)
+        self.atr.close(bar['high'], bar['low'], c)
+        self.macd.close(c)
+        self.boll.close(c)
+        self.last_time = bar['time']
+        return self.snapshot()
+
+    def snapshot(self):
+        diff, dea, hist = self.macd.value
+        upper, middle, lower = self.boll.value
+        return {
+            "ema7": self.ema7.value, "ema25": self.ema25.value, "ema99": self.ema99.value,
+            "rsi": self.rsi.value, "atr": self.atr.value,
+            "macd_diff": diff, "macd_dea": dea, "macd_hist": hist,
+            "boll_upper": upper, "boll_middle": middle, "boll_lower": lower,
+        }
+
+    def to_dict(self):
+        d = {name: state.to_dict() for name, state in self._states().items()}
+        d["last_time"] = self.last_time
+        return d
+
+    @classmethod
+    def from_dict(cls, d):
+        s = cls()
+        s.ema7 = EmaState.from_dict(d["ema7"])
+        s.ema25 = EmaState.from_dict(d["ema25"])
+        s.ema99 = EmaState.from_dict(d["ema99"])
+        s.rsi = RsiState.from_dict(d["rsi"])
+        s.atr = AtrState.from_dict(d["atr"])
+        s.macd = MacdState.from_dict(d["macd"])
+        s.boll = RollingStats.from_dict(d["boll"])
+        s.last_time = d["last_time"]
+        return s
+
+    @classmethod
+    def from_klines(cls, klines):
+        """用历史K线预热，之后每根新K线只需一次close_bar"""
+        s = cls()
+        for bar in klines:
+            s.close_bar(bar)
+        return s
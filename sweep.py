@@ -0,0 +1,260 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+交易计划参数扫描
+在历史5分钟K线上回测方案A/B的ATR倍数（进场、止损、止盈）与评分门槛的全部组合
+    方案A 回踩做多: 进场 p-0.1~0.3ATR，止损 p-0.5~1.5ATR，止盈 p+0.5~2ATR
+    方案B 突破做多: 进场 p+0.3~0.7ATR，止损 p-0.5~+0.25ATR，止盈 p+1~2.5ATR
+    评分门槛: 只在综合评分不低于门槛的报告上下单（gen_plan中75为高，50为中高）
+
+K线、信号位置、ATR和评分放在一块共享内存中，子进程启动时按名字映射，任务只传参数组合
+每完成一批组合追加写入检查点文件，中断后重新运行相同命令从检查点继续
+全部完成后按期望(R)排序输出结果表（Markdown + JSON）
+
+运行:
+    python3 sweep.py <品种> [--days N] [--workers N] [--step N] [--hold N] [--min-fills N] [--top N]
+"""
+
+import itertools
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+from multiprocessing.shared_memory import SharedMemory
+from pathlib import Path
+
+import numpy as np
+
+from backtest import PlanRule, load_bars, signal_index, signal_scores, simulate, summarize
+from kline_frame import KlineFrame
+from volume_profile import tick_size
+
+OUTPUT_DIR = Path("/root/clawd/market_analysis/sweeps")
+
+DEFAULT_GRID = {
+    "A": {"order": "limit",
+          "entry": [-0.1, -0.15, -0.2, -0.25, -0.3],
+          "stop": [-0.5, -0.75, -1.0, -1.25, -1.5],
+          "target": [0.5, 0.75, 1.0, 1.25, 1.5, 2.0]},
+    "B": {"order": "stop",
+          "entry": [0.3, 0.4, 0.5, 0.6, 0.7],
+          "stop": [-0.5, -0.25, 0.0, 0.25],
+          "target": [1.0, 1.25, 1.5, 2.0, 2.5]},
+}
+
+# 评分由30/25/20三项组成，可能的取值全部作为门槛
+SCORE_CUTOFFS = [0, 20, 25, 30, 45, 50, 55, 75]
+
+# 每个任务包含的组合数，完成一个任务写一次检查点
+CHUNK_SIZE = 16
+
+
+def make_grid(grid=DEFAULT_GRID, cutoffs=SCORE_CUTOFFS):
+    """展开为参数组合列表，止损不低于进场价的组合跳过"""
+    combos = []
+    for name, spec in grid.items():
+        for entry, stop, target, cutoff in itertools.product(spec["entry"], spec["stop"], spec["target"], cutoffs):
+            if stop >= entry or target <= entry:
+                continue
+            combos.append({
+                "id": f"{name}|{entry}|{stop}|{target}|{cutoff}",
+                "plan": name, "order": spec["order"],
+                "entry": entry, "stop": stop, "target": target, "min_score": cutoff,
+            })
+    return combos
+
+
+def _layout(n, m):
+    """共享内存布局: time(n) open/high/low/close(4n) signals(m) atr(m) score(m)，均为8字节"""
+    return 8 * (5 * n + 3 * m)
+
+
+def _views(buf, n, m):
+    offset = 0
+
+    def take(count, dtype):
+        nonlocal offset
+        arr = np.ndarray((count,), dtype=dtype, buffer=buf, offset=offset)
+        offset += 8 * count
+        return arr
+
+    return {
+        "time": take(n, np.int64),
+        "open": take(n, np.float64),
+        "high": take(n, np.float64),
+        "low": take(n, np.float64),
+        "close": take(n, np.float64),
+        "signals": take(m, np.int64),
+        "atr": take(m, np.float64),
+        "score": take(m, np.float64),
+    }
+
+
+# 子进程中映射的共享数据
+_worker = {}
+
+
+def _attach(name, n, m):
+    # 子进程与父进程共用同一个resource_tracker，共享内存由父进程unlink
+    shm = SharedMemory(name=name)
+    views = _views(shm.buf, n, m)
+    _worker["shm"] = shm
+    _worker["frame"] = KlineFrame(views["time"], views["open"], views["high"], views["low"], views["close"],
+                                  np.zeros(n))
+    _worker["views"] = views
+
+
+def run_chunk(combos, entry_bars, hold_bars):
+    """子进程中回测一批组合，返回 [(组合id, 统计)]"""
+    frame = _worker["frame"]
+    views = _worker["views"]
+    results = []
+    for combo in combos:
+        mask = views["score"] >= combo["min_score"]
+        signals = views["signals"][mask]
+        plan = PlanRule(combo["plan"], combo["entry"], combo["stop"], combo["target"], combo["order"])
+        trades = simulate(frame, plan, signals, views["atr"][mask], entry_bars, hold_bars)
+        results.append((combo["id"], summarize(trades, len(signals))))
+    return results
+
+
+class Sweep:
+    def __init__(self, symbol, days=None, workers=None, step=3, hold_bars=288, grid=None, output_dir=OUTPUT_DIR,
+                 frame=None):
+        self.symbol = symbol
+        # 未指定K线时从归档读取
+        self.frame = load_bars(symbol, days) if frame is None else KlineFrame.from_klines(frame)
+        self.workers = workers or os.cpu_count() or 1
+        self.step = step
+        self.hold_bars = hold_bars
+        self.combos = make_grid(grid or DEFAULT_GRID)
+        self.output_dir = Path(output_dir)
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        safe = symbol.replace("/", "_").replace("=", "_")
+        if len(self.frame):
+            span = f"{int(self.frame.time[0])}_{int(self.frame.time[-1])}"
+        else:
+            span = "empty"
+        self.name = f"sweep_{safe}"
+        # K线范围和回测设置相同才能从检查点继续
+        self.checkpoint = self.output_dir / f"{self.name}_{span}_{step}_{hold_bars}.checkpoint.jsonl"
+
+    def load_checkpoint(self):
+        done = {}
+        if not self.checkpoint.exists():
+            return done
+        with open(self.checkpoint, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    rec = json.loads(line)
+                except ValueError:
+                    # 中断时写了一半的最后一行
+                    continue
+                done[rec["id"]] = rec["stats"]
+        return done
+
+    def run(self, key="expectancy_r", min_fills=30):
+        """回测检查点中未完成的组合，返回排序后的全部结果"""
+        done = self.load_checkpoint()
+        todo = [c for c in self.combos if c["id"] not in done]
+        print(f"{self.symbol}: {len(self.frame)} 根K线, {len(self.combos)} 个组合, "
+              f"检查点中已完成 {len(done)} 个, {self.workers} 个进程")
+        if todo:
+            self._run(todo, done)
+        return self.rank(done, key, min_fills)
+
+    def _run(self, todo, done):
+        start = time.perf_counter()
+        signals, atr = signal_index(self.frame, self.step)
+        scores = signal_scores(self.frame, signals, tick_size(self.symbol))
+        print(f"  信号 {len(signals)} 个, 评分耗时 {time.perf_counter() - start:.1f}s")
+
+        n, m = len(self.frame), len(signals)
+        shm = SharedMemory(create=True, size=max(_layout(n, m), 8))
+        try:
+            views = _views(shm.buf, n, m)
+            for col in ("time", "open", "high", "low", "close"):
+                views[col][:] = getattr(self.frame, col)
+            views["signals"][:] = signals
+            views["atr"][:] = atr
+            views["score"][:] = scores
+            del views
+
+            chunks = [todo[i:i + CHUNK_SIZE] for i in range(0, len(todo), CHUNK_SIZE)]
+            finished = 0
+            with open(self.checkpoint, 'a', encoding='utf-8') as ckpt, \
+                    ProcessPoolExecutor(max_workers=self.workers, initializer=_attach,
+                                        initargs=(shm.name, n, m)) as pool:
+                futures = [pool.submit(run_chunk, chunk, self.step, self.hold_bars) for chunk in chunks]
+                for future in as_completed(futures):
+                    for combo_id, stats in future.result():
+                        done[combo_id] = stats
+                        ckpt.write(json.dumps({"id": combo_id, "stats": stats}, separators=(",", ":")) + "\n")
+                    ckpt.flush()
+                    finished += 1
+                    if finished % 10 == 0 or finished == len(chunks):
+                        elapsed = time.perf_counter() - start
+                        print(f"  {finished}/{len(chunks)} 批, {elapsed:.0f}s")
+        finally:
+            shm.close()
+            shm.unlink()
+
+    def rank(self, done, key="expectancy_r", min_fills=30):
+        """按key从高到低排序，成交数不足min_fills的组合排在最后"""
+        by_id = {c["id"]: c for c in self.combos}
+        rows = []
+        for combo_id, stats in done.items():
+            combo = by_id.get(combo_id)
+            if combo is None:
+                continue
+            rows.append(dict(combo, **stats))
+        rows.sort(key=lambda r: (r["fills"] >= min_fills, r[key]), reverse=True)
+        return rows
+
+    def save(self, rows, top=50):
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        md_file = self.output_dir / f"{self.name}_{timestamp}.md"
+        json_file = self.output_dir / f"{self.name}_{timestamp}.json"
+        with open(md_file, 'w', encoding='utf-8') as f:
+            f.write(format_table(self.symbol, rows, top))
+        with open(json_file, 'w', encoding='utf-8') as f:
+            json.dump({"symbol": self.symbol, "bars": len(self.frame), "step": self.step,
+                       "hold_bars": self.hold_bars, "results": rows}, f, indent=2, ensure_ascii=False)
+        return md_file, json_file
+
+
+def format_table(symbol, rows, top=50):
+    lines = [f"# {symbol} 交易计划参数扫描\n",
+             f"共 {len(rows)} 个组合，按期望(R)排序，显示前 {min(top, len(rows))} 个\n",
+             "| 排名 | 方案 | 进场 | 止损 | 止盈 | 评分门槛 | 成交 | 胜率 | 期望(R) | 期望(%) | 盈亏比 | 最大回撤(%) |",
+             "|------|------|------|------|------|----------|------|------|---------|---------|--------|-------------|"]
+    for i, r in enumerate(rows[:top], 1):
+        lines.append(f"| {i} | {r['plan']} | {r['entry']:+}ATR | {r['stop']:+}ATR | {r['target']:+}ATR | "
+                     f"{r['min_score']} | {r['fills']} | {r['win_rate'] * 100:.1f}% | {r['expectancy_r']} | "
+                     f"{r['expectancy_pct']} | {r['profit_factor']} | {r['max_drawdown_pct']} |")
+    return "\n".join(lines) + "\n"
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    options = {}
+    for flag in ("--days", "--workers", "--step", "--hold", "--min-fills", "--top"):
+        if flag in args:
+            i = args.index(flag)
+            options[flag] = float(args[i + 1])
+            del args[i:i + 2]
+    if not args:
+        print(__doc__)
+        sys.exit(1)
+    workers = options.get("--workers")
+    sweep = Sweep(args[0], options.get("--days"), int(workers) if workers else None,
+                  step=int(options.get("--step", 3)), hold_bars=int(options.get("--hold", 288)))
+    if len(sweep.frame) < 100:
+        print(f"{args[0]} 归档K线不足: {len(sweep.frame)} 根")
+        sys.exit(1)
+    rows = sweep.run(min_fills=int(options.get("--min-fills", 30)))
+    md_file, json_file = sweep.save(rows, int(options.get("--top", 50)))
+    print(format_table(args[0], rows, 10))
+    print(f"结果: {md_file}")
@@ -0,0 +1,220 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+模拟行情生成
+向量化生成任意长度的K线（几何布朗运动或带跳跃的扩散），用于压测、指标验证和回测
+  - 日内波动季节性: 亚洲时段低，伦敦、纽约开盘时段高（按UTC小时的倍数）
+  - 成交量随时段和当根波动变化，伽马分布噪声
+  - 交易时段缺口: 贵金属期货按Globex时段（每日1小时休市、周末休市），外汇24x5，ETF和矿业股只有美股时段
+  - 休市后第一根K线带跳空
+  - 价格按品种最小变动价位取整，波动率按品种设置（白银约为黄金的两倍）
+同一品种、种子和参数总是生成相同的数据
+
+输出:
+    generate("XAU/USD", n=1000000, seed=1)         KlineFrame
+    write_archive(frame, archive_dir, "XAU/USD")   写入K线归档（backtest/sweep直接读取）
+    chart_response(frame, "GC=F", none_rate=0.01)  Yahoo chart接口响应，部分K线为None，可作为mock_server录制数据
+
+命令行:
+    python3 synthetic.py <品种[,品种...]> [--bars N | --years N] [--seed N] [--model gbm|jump]
+                         [--archive 目录] [--recording 文件] [--none-rate 比例]
+"""
+
+import json
+import sys
+import zlib
+
+import numpy as np
+
+from bar_archive import BarArchive
+from kline_frame import KlineFrame
+from universe import Instrument, default_universe
+
+# 默认起点 2020-01-01 00:00 UTC，不依赖当前时间，保证可复现
+START = 1577836800
+
+# 年化波动率，未列出的品种按分组取值
+VOLATILITY = {
+    "XAU/USD": 0.15, "XAG/USD": 0.28, "XPT/USD": 0.25, "XPD/USD": 0.35,
+}
+GROUP_VOLATILITY = {"metals": 0.25, "etf": 0.18, "miners": 0.38, "fx": 0.08}
+
+# 每根5分钟K线的平均成交量
+VOLUME = {"XAU/USD": 2000, "XAG/USD": 3500}
+GROUP_VOLUME = {"metals": 1500, "etf": 50000, "miners": 30000, "fx": 0}
+
+# 跳跃扩散参数: 平均每天的跳跃次数、跳跃幅度（对数收益）的均值和标准差
+JUMP_RATE = 0.5
+JUMP_MEAN = 0.0
+JUMP_STD = 0.004
+
+# 各UTC小时的波动倍数: 亚洲时段低，伦敦(7-8点)、纽约(13-15点)开盘附近高
+HOURLY_VOLATILITY = np.array([
+    0.6, 0.6, 0.6, 0.6, 0.6, 0.7, 0.8, 1.1,
+    1.3, 1.2, 1.1, 1.0, 1.1, 1.6, 1.8, 1.6,
+    1.3, 1.1, 0.9, 0.8, 0.7, 0.5, 0.5, 0.5,
+])
+
+# 休市后首根K线的跳空，按休市时长折算为正常波动的比例
+GAP_VOLATILITY = 0.3
+
+SESSIONS = {"metals": "globex", "fx": "fx", "etf": "us_equity", "miners": "us_equity"}
+
+HOUR = 3600
+
+
+def trading_mask(t, session):
+    """时间戳是否在交易时段内（UTC，不考虑夏令时和节假日）"""
+    t = np.asarray(t, dtype=np.int64)
+    dow = (t // 86400 + 3) % 7  # 0为周一，1970-01-01是周四
+    sec = t % 86400
+    if session == "globex":
+        # 周日22:00开盘，周五21:00收盘，每天21:00-22:00休市
+        return ~(((dow == 4) & (sec >= 21 * HOUR)) | (dow == 5) | ((dow == 6) & (sec < 22 * HOUR))
+                 | ((sec >= 21 * HOUR) & (sec < 22 * HOUR)))
+    if session == "fx":
+        return ~(((dow == 4) & (sec >= 22 * HOUR)) | (dow == 5) | ((dow == 6) & (sec < 22 * HOUR)))
+    if session == "us_equity":
+        return (dow < 5) & (sec >= 13 * HOUR + 1800) & (sec < 20 * HOUR)
+    return np.ones(len(t), dtype=bool)
+
+
+def params_for(symbol):
+    """品种的参考价、最小变动价位、波动率、成交量和交易时段"""
+    inst = default_universe.get(symbol) or Instrument(symbol)
+    return {
+        "symbol": inst.symbol,
+        "price": float(inst.price),
+        "tick": float(inst.tick),
+        "vol": VOLATILITY.get(inst.symbol, GROUP_VOLATILITY.get(inst.group, 0.2)),
+        "volume": VOLUME.get(inst.symbol, GROUP_VOLUME.get(inst.group, 1000)),
+        "session": SESSIONS.get(inst.group, "continuous"),
+    }
+
+
+def timeline(n=None, start=START, end=None, interval=300, session="globex"):
+    """交易时段内的K线时间戳，给出n时从start起取n根，否则取[start, end)"""
+    start = int(start) - int(start) % interval
+    if n is None:
+        grid = np.arange(start, int(end), interval, dtype=np.int64)
+        return grid[trading_mask(grid, session)]
+    # 按一周内的交易比例估算需要的日历长度，不够时再向后延伸
+    week = np.arange(0, 7 * 86400, interval, dtype=np.int64) + START
+    fraction = max(trading_mask(week, session).mean(), 1e-3)
+    parts, count, t0 = [], 0, start
+    while count < n:
+        span = int((n - count) / fraction * 1.02) + 7 * 86400 // interval
+        grid = np.arange(t0, t0 + span * interval, interval, dtype=np.int64)
+        kept = grid[trading_mask(grid, session)]
+        parts.append(kept)
+        count += len(kept)
+        t0 = int(grid[-1]) + interval
+    return np.concatenate(parts)[:n]
+
+
+def generate(symbol, n=None, start=START, end=None, seed=0, model="gbm", interval=300, params=None):
+    """
+    生成一个品种的K线，返回KlineFrame
+    model: "gbm" 几何布朗运动，"jump" 带泊松跳跃的扩散
+    params覆盖params_for中的取值，如 {"vol": 0.3, "price": 30}
+    """
+    p = params_for(symbol)
+    p.update(params or {})
+    times = timeline(n, start, end, interval, p["session"])
+    m = len(times)
+    if not m:
+        return KlineFrame.empty()
+    rng = np.random.default_rng([seed, zlib.crc32(p["symbol"].encode("utf-8"))])
+
+    # 年化波动分摊到一年的交易K线上，再按时段倍数调整
+    week = np.arange(0, 7 * 86400, interval, dtype=np.int64) + START
+    bars_per_year = max(trading_mask(week, p["session"]).sum(), 1) * 365 / 7
+    season = HOURLY_VOLATILITY[(times % 86400) // HOUR]
+    season = season / season.mean()
+    sigma = p["vol"] / np.sqrt(bars_per_year) * season
+
+    # 休市后的第一根K线按休市时长补一段跳空
+    skipped = np.r_[0, np.diff(times) // interval - 1]
+    gap = rng.standard_normal(m) * np.sqrt(skipped) * (p["vol"] / np.sqrt(bars_per_year)) * GAP_VOLATILITY
+
+    move = rng.standard_normal(m) * sigma - 0.5 * sigma ** 2
+    if model == "jump":
+        jumps = rng.poisson(JUMP_RATE * interval / 86400, m)
+        move += jumps * JUMP_MEAN + np.sqrt(jumps) * JUMP_STD * rng.standard_normal(m)
+    elif model != "gbm":
+        raise ValueError(f"未知的模型: {model}")
+
+    log_close = np.log(p["price"]) + np.cumsum(gap + move)
+    log_open = np.r_[np.log(p["price"]), log_close[:-1]] + gap
+    close = np.exp(log_close)
+    open_ = np.exp(log_open)
+    # 影线长度与当根波动同量级
+    wick = np.abs(rng.standard_normal((2, m))) * sigma * 0.6
+    high = np.maximum(open_, close) * np.exp(wick[0])
+    low = np.minimum(open_, close) * np.exp(-wick[1])
+
+    tick = p["tick"]
+    open_, high, low, close = (np.round(np.round(x / tick) * tick, 8) for x in (open_, high, low, close))
+
+    # 成交量随时段活跃度和当根振幅变化
+    intensity = season * (1 + np.abs(move) / sigma)
+    volume = np.round(p["volume"] * intensity / intensity.mean() * rng.gamma(4.0, 0.25, m))
+    return KlineFrame(times, open_, high, low, close, volume)
+
+
+def write_archive(frame, archive_dir, symbol, interval="5m"):
+    """追加写入K线归档，返回新增条数"""
+    return BarArchive(archive_dir, symbol, interval).append(frame)
+
+
+def chart_response(frame, symbol, none_rate=0.0, seed=0):
+    """
+    转换为Yahoo chart接口响应
+    none_rate比例的K线OHLCV为None（Yahoo在停盘或无成交时返回的样子）
+    """
+    n = len(frame)
+    missing = np.random.default_rng(seed).random(n) < none_rate
+
+    def column(values, cast):
+        return [None if miss else cast(v) for v, miss in zip(values.tolist(), missing.tolist())]
+
+    quote = {
+        "open": column(frame.open, float),
+        "high": column(frame.high, float),
+        "low": column(frame.low, float),
+        "close": column(frame.close, float),
+        "volume": column(frame.volume, int),
+    }
+    meta = {"symbol": symbol, "regularMarketPrice": float(frame.close[-1]) if n else None}
+    return {"chart": {"result": [{"meta": meta, "timestamp": frame.time.tolist(),
+                                  "indicators": {"quote": [quote]}}], "error": None}}
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    options = {}
+    for flag in ("--bars", "--years", "--seed", "--model", "--archive", "--recording", "--none-rate"):
+        if flag in args:
+            i = args.index(flag)
+            options[flag] = args[i + 1]
+            del args[i:i + 2]
+    if not args:
+        print(__doc__)
+        sys.exit(1)
+    n = int(options["--bars"]) if "--bars" in options else None
+    end = START + int(float(options.get("--years", 1)) * 365 * 86400) if n is None else None
+    recordings = {}
+    for symbol in args[0].split(","):
+        frame = generate(symbol, n=n, end=end, seed=int(options.get("--seed", 0)),
+                         model=options.get("--model", "gbm"))
+        print(f"{symbol}: {len(frame)} 根K线, {frame.close[0]:.2f} -> {frame.close[-1]:.2f}")
+        if "--archive" in options:
+            print(f"  写入归档 {write_archive(frame, options['--archive'], symbol)} 根")
+        if "--recording" in options:
+            inst = default_universe.get(symbol)
+            source = inst.source if inst is not None else symbol
+            recordings[source] = chart_response(frame, source, float(options.get("--none-rate", 0)))
+    if recordings:
+        with open(options["--recording"], 'w', encoding='utf-8') as f:
+            json.dump(recordings, f, separators=(",", ":"))
+        print(f"录制数据: {options['--recording']}")
@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+品种池配置
+每个品种: 报告代码、Yahoo数据代码、显示名称、分组、最小变动价位、模拟数据参数
+默认品种池为四种COMEX/NYMEX贵金属期货、现货、矿业股、贵金属ETF和主要外汇
+可用JSON文件替换，格式与DEFAULT_UNIVERSE相同:
+    [{"symbol": "XAU/USD", "source": "GC=F", "name": "国际黄金", "group": "metals", "price": 2660}, ...]
+"""
+
+import json
+import time
+from decimal import Decimal
+from pathlib import Path
+
+# 模拟K线参数（相对参考价的比例），来自黄金日内走势: 每根+0.3%，振幅约0.56%
+SIM_RATIOS = {"step": 0.003, "high": 0.00376, "low": 0.00188, "close": 0.00263}
+
+DEFAULT_UNIVERSE = [
+    # 现货报告品种，模拟参数沿用原脚本的白银/黄金走势
+    {"symbol": "XAG/USD", "source": "SI=F", "name": "国际白银", "short_name": "白银", "group": "metals",
+     "tick": 0.005, "price": 84.10, "aliases": ["XAGUSD", "XAG"],
+     "sim": {"step": 0.25, "high": 0.25, "low": 0.15, "close": 0.2, "volume": 3500, "volume_step": 100}},
+    {"symbol": "XAU/USD", "source": "GC=F", "name": "国际黄金", "short_name": "黄金", "group": "metals",
+     "tick": 0.1, "price": 2660, "aliases": ["XAUUSD", "XAU"],
+     "sim": {"step": 8, "high": 10, "low": 5, "close": 7, "volume": 2000, "volume_step": 50}},
+    {"symbol": "XPT/USD", "source": "PL=F", "name": "国际铂金", "short_name": "铂金", "group": "metals",
+     "tick": 0.1, "price": 1000, "aliases": ["XPTUSD"]},
+    {"symbol": "XPD/USD", "source": "PA=F", "name": "国际钯金", "short_name": "钯金", "group": "metals",
+     "tick": 0.5, "price": 1000, "aliases": ["XPDUSD"]},
+    # 贵金属ETF
+    {"symbol": "GLD", "source": "GLD", "name": "SPDR黄金ETF", "group": "etf", "price": 240},
+    {"symbol": "IAU", "source": "IAU", "name": "iShares黄金ETF", "group": "etf", "price": 50},
+    {"symbol": "SLV", "source": "SLV", "name": "iShares白银ETF", "group": "etf", "price": 28},
+    {"symbol": "PPLT", "source": "PPLT", "name": "铂金ETF", "group": "etf", "price": 90},
+    {"symbol": "PALL", "source": "PALL", "name": "钯金ETF", "group": "etf", "price": 90},
+    {"symbol": "GDX", "source": "GDX", "name": "金矿股ETF", "group": "etf", "price": 40},
+    {"symbol": "GDXJ", "source": "GDXJ", "name": "小型金矿股ETF", "group": "etf", "price": 50},
+    {"symbol": "SIL", "source": "SIL", "name": "银矿股ETF", "group": "etf", "price": 35},
+    # 矿业股
+    {"symbol": "NEM", "source": "NEM", "name": "纽蒙特", "group": "miners", "price": 45},
+    {"symbol": "GOLD", "source": "GOLD", "name": "巴里克", "group": "miners", "price": 18},
+    {"symbol": "AEM", "source": "AEM", "name": "伊格尔矿业", "group": "miners", "price": 80},
+    {"symbol": "WPM", "source": "WPM", "name": "惠顿贵金属", "group": "miners", "price": 60},
+    {"symbol": "FNV", "source": "FNV", "name": "弗兰科内华达", "group": "miners", "price": 130},
+    {"symbol": "PAAS", "source": "PAAS", "name": "泛美白银", "group": "miners", "price": 22},
+    {"symbol": "AG", "source": "AG", "name": "第一矿业", "group": "miners", "price": 7},
+    # 外汇
+    {"symbol": "EUR/USD", "source": "EURUSD=X", "name": "欧元/美元", "group": "fx", "tick": 0.0001, "price": 1.08},
+    {"symbol": "GBP/USD", "source": "GBPUSD=X", "name": "英镑/美元", "group": "fx", "tick": 0.0001, "price": 1.27},
+    {"symbol": "USD/JPY", "source": "JPY=X", "name": "美元/日元", "group": "fx", "tick": 0.01, "price": 150},
+    {"symbol": "AUD/USD", "source": "AUDUSD=X", "name": "澳元/美元", "group": "fx", "tick": 0.0001, "price": 0.66},
+    {"symbol": "USD/CHF", "source": "CHF=X", "name": "美元/瑞郎", "group": "fx", "tick": 0.0001, "price": 0.88},
+    {"symbol": "USD/CAD", "source": "CAD=X", "name": "美元/加元", "group": "fx", "tick": 0.0001, "price": 1.36},
+]
+
+
+class Instrument:
+    __slots__ = ("symbol", "source", "name", "short_name", "group", "tick", "price", "aliases", "sim")
+
+    def __init__(self, symbol, source=None, name=None, short_name=None, group="other", tick=0.01,
+                 price=100.0, aliases=(), sim=None):
+        self.symbol = symbol
+        self.source = source or symbol
+        self.name = name or symbol
+        self.short_name = short_name or self.name
+        self.group = group
+        self.tick = tick
+        self.price = price
+        self.aliases = tuple(aliases)
+        if sim is None:
+            sim = {k: price * r for k, r in SIM_RATIOS.items()}
+            sim.update(volume=2000, volume_step=50)
+        self.sim = sim
+
+    @classmethod
+    def from_dict(cls, d):
+        return cls(**d)
+
+    def to_dict(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    @property
+    def decimals(self):
+        """报价保留的小数位: 按最小变动价位，至少2位（外汇0.0001为4位）"""
+        return max(2, -Decimal(str(self.tick)).normalize().as_tuple().exponent)
+
+    def simulated_klines(self, n=13, now=None):
+        """
+        基于参考价生成一段逐步上涨的模拟K线，数据源不可用时使用
+        """
+        sim = self.sim
+        d = self.decimals
+        now = int(time.time()) if now is None else now
+        klines = []
+        for i in range(n):
+            open_price = self.price + i * sim["step"]
+            klines.append({
+                "time": now - (n - 1 - i) * 300,
+                "open": round(open_price, d),
+                "high": round(open_price + sim["high"], d),
+                "low": round(open_price - sim["low"], d),
+                "close": round(open_price + sim["close"], d),
+                "volume": int(sim["volume"] - i * sim["volume_step"])
+            })
+        return klines
+
+    def __repr__(self):
+        return f"Instrument({self.symbol}, source={self.source}, group={self.group})"
+
+
+class Universe:
+    """按报告代码、数据代码或别名查找品种"""
+    def __init__(self, instruments):
+        self.instruments = list(instruments)
+        self._lookup = {}
+        for inst in self.instruments:
+            for key in (inst.symbol, inst.source) + inst.aliases:
+                self._lookup.setdefault(key, inst)
+
+    def __iter__(self):
+        return iter(self.instruments)
+
+    def __len__(self):
+        return len(self.instruments)
+
+    def get(self, symbol):
+        return self._lookup.get(symbol)
+
+    def group(self, *groups):
+        return Universe(inst for inst in self.instruments if inst.group in groups)
+
+
+def load_universe(path=None):
+    """读取品种池配置，path为None时使用默认品种池"""
+    rows = DEFAULT_UNIVERSE
+    if path is not None:
+        with open(Path(path), 'r', encoding='utf-8') as f:
+            rows = json.load(f)
+    return Universe(Instrument.from_dict(row) for row in rows)
+
+
+default_universe = load_universe()
+
+
+def price_decimals(symbol):
+    """品种报价保留的小数位，品种池中没有的按2位"""
+    inst = default_universe.get(symbol)
+    return inst.decimals if inst is not None else 2
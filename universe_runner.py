@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+品种池批量分析
+1. 获取: 线程池并发增量更新各品种K线（I/O）
+2. 分析: 品种按轮询分片到ProcessPoolExecutor，每个进程处理一片，用满所有核心
+3. 汇总: 全部结果写入一份汇总报告，并给出每秒分析的品种数
+
+运行:
+    python3 universe_runner.py [品种池配置.json] [--workers N] [--batch N]
+    --batch N: 用spark多品种接口每次请求N个品种，收盘价写入本地K线缓存，开高低取缓存中的完整K线
+               缓存不足（首次运行）、批量中缺失或缓存的完整K线落后两根以上的品种再逐个增量获取完整K线
+"""
+
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+from kline_frame import KlineFrame
+from market_data import fetch_batched, fetch_concurrent
+from price_source import Quote
+from realtime_analyzer import RealtimeMarketAnalyzer, analyze_frame
+from report_renderer import render_summary_markdown
+from report_store import write_latest
+from universe import load_universe
+
+
+def analyze_shard(shard):
+    """
+    子进程中分析一片品种
+    shard为 [(报告代码, K线列字典)]，K线以numpy列传递，序列化开销小
+    返回 [(报告代码, 分析结果, 错误)]
+    """
+    results = []
+    for symbol, columns in shard:
+        try:
+            results.append((symbol, analyze_frame(KlineFrame(**columns), symbol), None))
+        except Exception as e:
+            results.append((symbol, None, str(e)))
+    return results
+
+
+def make_shards(items, n):
+    """轮询分片，各片品种数最多相差1"""
+    return [shard for shard in (items[i::n] for i in range(n)) if shard]
+
+
+class UniverseRunner:
+    def __init__(self, universe_path=None, workers=None, deadline=60, batch_size=None):
+        self.universe = load_universe(universe_path)
+        self.workers = workers or os.cpu_count() or 1
+        self.deadline = deadline
+        # 为None时每个品种单独请求并走增量缓存，否则按批量接口分批请求
+        self.batch_size = batch_size
+        # K线缓存、归档和HTTP连接复用单品种分析器的
+        self.analyzer = RealtimeMarketAnalyzer()
+        self.output_dir = self.analyzer.output_dir
+        # 进程池常驻，常驻进程中每轮不再重新创建子进程
+        self._pool = None
+        # 本轮各品种的数据来源 {报告代码: 来源说明}，写入汇总
+        self.data_sources = {}
+
+    def pool(self):
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(max_workers=self.workers)
+        return self._pool
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+
+    def get_kline_data(self, source):
+        """按数据代码获取完整K线，归档和数据来源按报告代码记录，与实时分析共用"""
+        inst = self.universe.get(source)
+        return self.analyzer.get_kline_data(inst.symbol, inst.source)
+
+    def fetch(self):
+        """
+        并发获取全部品种K线，返回 {报告代码: KlineFrame}，失败的品种使用模拟数据
+        各品种的数据来源记录在self.data_sources
+        """
+        sources = {inst.source: inst for inst in self.universe}
+        self.data_sources = {}
+        if self.batch_size:
+            klines = self.fetch_batch(list(sources))
+        else:
+            results = fetch_concurrent(list(sources), fetch=self.get_kline_data, deadline=self.deadline)
+            klines = {source: res['data'] for source, res in results.items()}
+        frames = {}
+        for source, bars in klines.items():
+            inst = sources[source]
+            if bars is None:
+                bars = inst.simulated_klines()
+                self.data_sources[inst.symbol] = Quote(inst.symbol, None, "simulated").label()
+            elif inst.symbol not in self.data_sources:
+                quote = self.analyzer.quotes.get(self.analyzer.metric_label(inst.symbol))
+                self.data_sources[inst.symbol] = quote.label() if quote is not None else "实时"
+            frames[inst.symbol] = KlineFrame.from_klines(bars)[-self.analyzer.window_size:]
+        return frames
+
+    def fetch_batch(self, sources):
+        """
+        批量接口只有收盘价: 写入本地K线缓存的最后一根及之后，开高低取缓存中的完整K线（收盘价K线的ATR偏小、没有成交量）
+        缓存不足13根（首次运行）、批量中缺失、或缓存的完整K线落后批量数据两根以上的品种，
+        逐个增量获取完整K线，同时覆盖缓存中只有收盘价的K线
+        数据年龄和是否过期按缓存中最后一根完整K线计算
+        返回 {数据代码: K线列表或None}
+        """
+        start = time.monotonic()
+        cache = self.analyzer.bar_cache
+        # 批量中缺失的品种不在这里逐个获取，与需要完整K线的品种一起在下面获取
+        results = fetch_batched(sources, chunk_size=self.batch_size, deadline=self.deadline,
+                                fetch_single=lambda s: None)
+        klines, single = {}, []
+        for source, res in results.items():
+            spark = res['data']['klines'] if res['data'] is not None else None
+            ohlc_time = cache.ohlc_time(source)
+            if (not spark or ohlc_time is None or len(cache.window(source, 13)) < 13
+                    or spark[-1]['time'] - ohlc_time > 2 * cache.seconds):
+                single.append(source)
+                continue
+            cache.merge_closes(source, spark)
+            cache.save(source)
+            klines[source] = cache.window(source, self.analyzer.window_size)
+            quote = Quote(self.universe.get(source).symbol, klines[source][-1]['close'], "batch", ohlc_time)
+            quote.stale = quote.age > self.analyzer.resolver.max_age
+            self.data_sources[quote.symbol] = quote.label()
+        if single:
+            remaining = max(self.deadline - (time.monotonic() - start), 1)
+            results = fetch_concurrent(single, fetch=self.get_kline_data, deadline=remaining)
+            klines.update((source, res['data']) for source, res in results.items())
+        return {source: klines[source] for source in sources}
+
+    def analyze(self, frames):
+        """分片到进程池分析，返回 ({报告代码: 分析结果}, {报告代码: 错误})"""
+        items = [(symbol, frame.columns()) for symbol, frame in frames.items()]
+        analyses, errors = {}, {}
+        if self.workers == 1:
+            results = [analyze_shard(items)]
+        else:
+            results = self.pool().map(analyze_shard, make_shards(items, self.workers))
+        for shard in results:
+            for symbol, analysis, error in shard:
+                if error is None:
+                    analyses[symbol] = analysis
+                else:
+                    errors[symbol] = error
+        return analyses, errors
+
+    def run(self):
+        print("=" * 60)
+        print(f"品种池批量分析: {len(self.universe)} 个品种, {self.workers} 个进程")
+        print("=" * 60)
+
+        start = time.perf_counter()
+        frames = self.fetch()
+        fetched = time.perf_counter()
+        analyses, errors = self.analyze(frames)
+        analyzed = time.perf_counter()
+
+        # 按品种池配置顺序输出，标明数据来源（批量价格、缓存、模拟数据）
+        ordered = [analyses[inst.symbol] for inst in self.universe if inst.symbol in analyses]
+        for a in ordered:
+            a['data_source'] = self.data_sources.get(a['symbol'], "实时")
+        stats = {
+            "symbols": len(ordered),
+            "errors": errors,
+            "fetch_seconds": round(fetched - start, 3),
+            "analyze_seconds": round(analyzed - fetched, 3),
+            "symbols_per_second": round(len(ordered) / max(analyzed - fetched, 1e-9), 1),
+        }
+        for symbol, error in errors.items():
+            print(f"  {symbol} 分析失败: {error}")
+        print(f"  获取: {stats['fetch_seconds']}s, 分析: {stats['analyze_seconds']}s, "
+              f"{stats['symbols_per_second']} 品种/秒")
+
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        store = self.analyzer.store
+        ts = store.append("universe", {"timestamp": int(time.time()), "stats": stats, "analyses": ordered})
+        md_file = write_latest(self.output_dir / "universe_summary_latest.md",
+                               render_summary_markdown(ordered, self.universe, stats))
+        self.analyzer.publisher.publish([md_file, store.segment_path(ts)], f"更新品种池汇总 - {timestamp}")
+        print(f"  汇总报告: {md_file.name}")
+        return stats
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    options = {}
+    for flag in ("--workers", "--batch"):
+        if flag in args:
+            i = args.index(flag)
+            options[flag] = int(args[i + 1])
+            del args[i:i + 2]
+    runner = UniverseRunner(args[0] if args else None, workers=options.get("--workers"),
+                            batch_size=options.get("--batch"))
+    try:
+        runner.run()
+    finally:
+        runner.close()
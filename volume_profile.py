@@ -0,0 +1,209 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+成交量分布（四度空间）
+价格按最小变动价位分箱，箱号 = round(价格 / tick)
+每根K线的成交量均匀分摊到 [low, high] 覆盖的所有箱:
+在low箱加 v/n、在high+1箱减 v/n，两次bincount后做一次cumsum，总耗时 O(K线数 + 箱数)
+价值区从POC向两侧扩展，每次并入量较大的一侧，O(箱数)
+
+箱号是绝对值，同一tick的分布可直接相加/相减:
+时段分布、日分布、多日复合分布都可以合并或滚动维护，不必从原始K线重建
+"""
+
+import math
+from collections import deque
+
+import numpy as np
+
+from kline_frame import KlineFrame
+from resampler import SESSION_OFFSET, bucket_start
+from universe import default_universe
+
+DEFAULT_TICK = 0.01
+
+VALUE_AREA = 0.70
+
+
+def tick_size(symbol):
+    """品种的最小变动价位，取自品种池配置，未配置的按0.01"""
+    inst = default_universe.get(symbol)
+    return inst.tick if inst is not None else DEFAULT_TICK
+
+
+class VolumeProfile:
+    """
+    counts[i] 为价格 (base + i) * tick 上的成交量
+    """
+    __slots__ = ("tick", "base", "counts")
+
+    def __init__(self, tick=DEFAULT_TICK, base=0, counts=None):
+        self.tick = float(tick)
+        self.base = int(base)
+        self.counts = np.zeros(0) if counts is None else np.asarray(counts, dtype=np.float64)
+
+    @classmethod
+    def from_klines(cls, klines, tick=DEFAULT_TICK):
+        """klines为字典列表或KlineFrame"""
+        frame = KlineFrame.from_klines(klines)
+        if not len(frame):
+            return cls(tick)
+        lo = np.rint(frame.low / tick).astype(np.int64)
+        hi = np.rint(frame.high / tick).astype(np.int64)
+        hi = np.maximum(hi, lo)
+        base = int(lo.min())
+        size = int(hi.max()) - base + 1
+        per_bin = frame.volume / (hi - lo + 1)
+        delta = np.bincount(lo - base, per_bin, minlength=size + 1)
+        delta -= np.bincount(hi + 1 - base, per_bin, minlength=size + 1)
+        counts = np.cumsum(delta[:size])
+        # cumsum的舍入误差可能在空箱留下极小的负值
+        np.maximum(counts, 0.0, out=counts)
+        return cls(tick, base, counts)
+
+    def __len__(self):
+        return len(self.counts)
+
+    def _check(self, other):
+        if not math.isclose(self.tick, other.tick):
+            raise ValueError(f"tick不同的分布不能合并: {self.tick} != {other.tick}")
+
+    def _combine(self, other, sign):
+        self._check(other)
+        if not len(other):
+            return VolumeProfile(self.tick, self.base, self.counts.copy())
+        if not len(self):
+            return VolumeProfile(self.tick, other.base, sign * other.counts)
+        base = min(self.base, other.base)
+        end = max(self.base + len(self), other.base + len(other))
+        counts = np.zeros(end - base)
+        counts[self.base - base:self.base - base + len(self)] += self.counts
+        counts[other.base - base:other.base - base + len(other)] += sign * other.counts
+        return VolumeProfile(self.tick, base, counts)
+
+    def __add__(self, other):
+        return self._combine(other, 1.0)
+
+    def __sub__(self, other):
+        """滚动窗口移出旧时段用，结果去掉两端的空箱"""
+        result = self._combine(other, -1.0)
+        np.maximum(result.counts, 0.0, out=result.counts)
+        return result.trim()
+
+    @classmethod
+    def merge(cls, profiles, tick=None):
+        """合并多个分布（如多个交易日组成复合分布），一次分配"""
+        profiles = [p for p in profiles if len(p)]
+        if not profiles:
+            return cls(DEFAULT_TICK if tick is None else tick)
+        first = profiles[0]
+        for p in profiles[1:]:
+            first._check(p)
+        base = min(p.base for p in profiles)
+        end = max(p.base + len(p) for p in profiles)
+        counts = np.zeros(end - base)
+        for p in profiles:
+            counts[p.base - base:p.base - base + len(p)] += p.counts
+        return cls(first.tick, base, counts)
+
+    def trim(self, eps=1e-9):
+        nz = np.flatnonzero(self.counts > eps)
+        if not len(nz):
+            return VolumeProfile(self.tick)
+        return VolumeProfile(self.tick, self.base + int(nz[0]), self.counts[nz[0]:nz[-1] + 1])
+
+    def price(self, i):
+        return round((self.base + i) * self.tick, 8)
+
+    def total(self):
+        return float(self.counts.sum())
+
+    def poc_index(self):
+        return int(np.argmax(self.counts))
+
+    def value_area_index(self, pct=VALUE_AREA):
+        """
+        从POC开始向两侧扩展，每步并入上下相邻箱中量较大的一个，直到覆盖pct的成交量
+        返回 (下沿箱, 上沿箱)
+        """
+        counts = self.counts
+        n = len(counts)
+        poc = self.poc_index()
+        target = counts.sum() * pct
+        lo = hi = poc
+        acc = counts[poc]
+        while acc < target and (lo > 0 or hi < n - 1):
+            below = counts[lo - 1] if lo > 0 else -1.0
+            above = counts[hi + 1] if hi < n - 1 else -1.0
+            if above >= below:
+                hi += 1
+                acc += above
+            else:
+                lo -= 1
+                acc += below
+        return lo, hi
+
+    def summary(self, price=None, pct=VALUE_AREA):
+        """POC/VAH/VAL，给出price时附带价格相对价值区的位置"""
+        if not len(self) or self.total() <= 0:
+            return None
+        lo, hi = self.value_area_index(pct)
+        result = {
+            "poc": self.price(self.poc_index()),
+            "vah": self.price(hi),
+            "val": self.price(lo),
+            "volume": self.total(),
+        }
+        if price is not None:
+            result["position"] = "above" if price > result["vah"] else "below" if price < result["val"] else "inside"
+        return result
+
+    def to_dict(self):
+        return {"tick": self.tick, "base": self.base, "counts": self.counts.tolist()}
+
+    @classmethod
+    def from_dict(cls, d):
+        return cls(d["tick"], d["base"], d["counts"])
+
+    def __repr__(self):
+        if not len(self):
+            return f"VolumeProfile(tick={self.tick}, empty)"
+        return f"VolumeProfile(tick={self.tick}, {self.price(0)}~{self.price(len(self) - 1)}, {len(self)} 箱)"
+
+
+def session_profiles(klines, tick=DEFAULT_TICK, seconds=86400, offset=SESSION_OFFSET):
+    """按交易时段（默认UTC 22:00起的交易日）拆分，返回 [(时段起点, VolumeProfile)]"""
+    frame = KlineFrame.from_klines(klines)
+    if not len(frame):
+        return []
+    sessions = bucket_start(frame.time, seconds, offset)
+    starts = np.flatnonzero(np.r_[True, sessions[1:] != sessions[:-1]])
+    ends = np.r_[starts[1:], len(frame)]
+    return [(int(sessions[s]), VolumeProfile.from_klines(frame[s:e], tick)) for s, e in zip(starts, ends)]
+
+
+class RollingProfile:
+    """
+    最近window个时段的复合分布
+    新时段加入、最旧时段移出都只做一次数组加减
+    """
+    def __init__(self, tick=DEFAULT_TICK, window=5):
+        self.tick = tick
+        self.window = window
+        self.sessions = deque()
+        self.composite = VolumeProfile(tick)
+
+    def add_session(self, start, profile):
+        """加入一个已结束的时段，同一起点的时段会替换旧值"""
+        if self.sessions and self.sessions[-1][0] == start:
+            self.composite = self.composite - self.sessions.pop()[1]
+        self.sessions.append((start, profile))
+        self.composite = self.composite + profile
+        while len(self.sessions) > self.window:
+            self.composite = self.composite - self.sessions.popleft()[1]
+        return self.composite
+
+    def add_klines(self, klines, seconds=86400, offset=SESSION_OFFSET):
+        for start, profile in session_profiles(klines, self.tick, seconds, offset):
+            self.add_session(start, profile)
+        return self.composite